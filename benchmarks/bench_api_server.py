@@ -0,0 +1,152 @@
+"""Load test the JSON API server.
+
+Generates a synthetic database, starts myapp.web.api_server on a free
+port and sends requests from several client threads, each keeping one
+HTTP/1.1 connection open. Every request fetches the first page of a
+random user's movies, the user's stats or a movie, and with '--pages'
+also the user's cached HTML page (gzip accepted). With '--revalidate'
+clients send the ETag of their previous response for the same URL,
+and with '--write-ratio' a share of the requests updates a rating.
+
+Reports requests per second and latency percentiles per scenario.
+
+Usage:
+    python benchmarks/bench_api_server.py --requests 5000 --clients 8
+    python benchmarks/bench_api_server.py --revalidate --write-ratio 0.05
+    python benchmarks/bench_api_server.py --pages --write-ratio 0.01
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import generate_data
+
+USER_PREFIX = "apiuser"
+USERS = 100
+PASSWORD = "password"
+PAGE_SIZE = 20
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def make_requests(count, imdb_ids, write_ratio, pages, rng):
+    """Return a list of (method, url, body) requests."""
+    requests = []
+    for _ in range(count):
+        user_name = f"{USER_PREFIX}{rng.randrange(USERS)}"
+        if rng.random() < write_ratio:
+            imdb_id = rng.choice(imdb_ids)
+            body = {"rating": round(rng.uniform(1, 10), 1)}
+            requests.append(("PUT", f"/users/{user_name}/ratings/{imdb_id}",
+                             body))
+            continue
+        urls = [f"/users/{user_name}/movies?order_by=rating&desc=1"
+                f"&limit={PAGE_SIZE}",
+                f"/users/{user_name}/stats",
+                f"/movies/{rng.choice(imdb_ids)}"]
+        if pages:
+            urls.append(f"/pages/{user_name}.html")
+        url = rng.choice(urls)
+        requests.append(("GET", url, None))
+    return requests
+
+
+def run_client(port, requests, revalidate, results):
+    """Send the requests over one connection and record the latencies."""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    etags = {}
+    for method, url, body in requests:
+        headers = {"Accept-Encoding": "gzip"}
+        content = None
+        if body is not None:
+            user_name = url.split("/")[2]
+            credentials = f"{user_name}:{PASSWORD}".encode("utf-8")
+            headers["Authorization"] = ("Basic " + base64.b64encode(
+                credentials).decode("ascii"))
+            headers["Content-Type"] = "application/json"
+            content = json.dumps(body).encode("utf-8")
+        elif revalidate and url in etags:
+            headers["If-None-Match"] = etags[url]
+        start = time.perf_counter()
+        connection.request(method, url, body=content, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        elapsed = time.perf_counter() - start
+        if response.getheader("ETag"):
+            etags[url] = response.getheader("ETag")
+        kind = "PAGE" if url.startswith("/pages/") else method
+        results.append((kind, response.status, elapsed))
+    connection.close()
+
+
+def main():
+    """Print throughput and latency percentiles."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--revalidate", action="store_true",
+                        help="send If-None-Match with the last ETag")
+    parser.add_argument("--write-ratio", type=float, default=0.0)
+    parser.add_argument("--pages", action="store_true",
+                        help="also request the users' HTML pages")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    db_file = Path(tempfile.mkdtemp()) / "movies.sqlite3"
+    generate_data.generate_database(db_file, generate_data.parse_args([
+        "--users", str(USERS), "--movies", "5000",
+        "--user-prefix", USER_PREFIX, "--password", PASSWORD]))
+    os.environ["MOVIES_DB_PATH"] = str(db_file)
+    # Keep the cost factor of the generated password hashes,
+    # so logins don't rehash them.
+    os.environ["MYAPP_BCRYPT_ROUNDS"] = str(generate_data.BCRYPT_ROUNDS)
+    # Import after MOVIES_DB_PATH has been set.
+    from myapp.models import data_processing
+    from myapp.web import api_server
+    imdb_ids = list(data_processing.get_movies())[:1000]
+    server = api_server.create_server(port=0, workers=args.workers)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    rng = random.Random(args.seed)
+    per_client = args.requests // args.clients
+    results = []
+    threads = [threading.Thread(target=run_client, args=(
+                   port, make_requests(per_client, imdb_ids,
+                                       args.write_ratio, args.pages, rng),
+                   args.revalidate, results))
+               for _ in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    server.server_close()
+    statuses = Counter(status for _, status, _ in results)
+    print(f"{len(results)} requests, {args.clients} clients, "
+          f"{args.workers} workers: {len(results) / elapsed:.0f} requests/s")
+    print("status codes:", dict(sorted(statuses.items())))
+    for kind in sorted({kind for kind, _, _ in results}):
+        latencies = sorted(elapsed for request_kind, _, elapsed in results
+                           if request_kind == kind)
+        print(f"{kind:>6}: p50 {statistics.median(latencies) * 1e3:6.2f} ms"
+              f"  p90 {percentile(latencies, 0.90) * 1e3:6.2f} ms"
+              f"  p99 {percentile(latencies, 0.99) * 1e3:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Compare request throughput of the sync and async database layers.
+
+Every simulated request loads a user, counts the user's movies and
+fetches the first page of the library sorted by rating with its
+country flags, like a web page of the user's movies would, using one
+connection per request. Requests run sequentially, on a thread pool
+using the sync layer and as concurrent coroutines using the async layer.
+
+With '--io-ms' every request additionally waits for a simulated call
+to another service (e.g. OMDB), which is where coroutines pay off.
+
+Usage:
+    python benchmarks/bench_async.py --requests 2000 --concurrency 16
+    python benchmarks/bench_async.py --io-ms 20 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import generate_data
+
+USER_PREFIX = "asyncuser"
+USERS = 200
+PAGE_SIZE = 20
+
+
+def main():
+    """Print requests per second for each variant."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--io-ms", type=float, default=0,
+                        help="simulated wait for another service per request")
+    args = parser.parse_args()
+    db_file = Path(tempfile.mkdtemp()) / "movies.sqlite3"
+    generate_data.generate_database(db_file, generate_data.parse_args([
+        "--users", str(USERS), "--movies", "5000",
+        "--user-prefix", USER_PREFIX]))
+    os.environ["MOVIES_DB_PATH"] = str(db_file)
+    # Import after MOVIES_DB_PATH has been set.
+    from myapp.db import async_database
+    from myapp.models import async_data_processing, data_processing
+    user_names = [f"{USER_PREFIX}{i % USERS}" for i in range(args.requests)]
+
+    def handle_request(user_name):
+        time.sleep(args.io_ms / 1000)
+        with data_processing.transaction():
+            handle_queries(user_name)
+
+    def handle_queries(user_name):
+        user = data_processing.get_user(user_name)
+        data_processing.count_movies(user.id)
+        movies = data_processing.find_movies(user.id, order_by="rating",
+                                             descending=True,
+                                             limit=PAGE_SIZE)
+        data_processing.get_country_emojis_for_movies(
+            [movie.movie_id for movie in movies.values()])
+
+    async def handle_request_async(user_name, semaphore):
+        async with semaphore:
+            await asyncio.sleep(args.io_ms / 1000)
+            await handle_queries_async(user_name)
+
+    async def handle_queries_async(user_name):
+        async with async_data_processing.transaction():
+            user = await async_data_processing.get_user(user_name)
+            await async_data_processing.count_movies(user.id)
+            movies = await async_data_processing.find_movies(
+                user.id, order_by="rating", descending=True, limit=PAGE_SIZE)
+            await async_data_processing.get_country_emojis_for_movies(
+                [movie.movie_id for movie in movies.values()])
+
+    def run_sequential():
+        for user_name in user_names:
+            handle_request(user_name)
+
+    def run_threads():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(handle_request, user_names))
+
+    async def run_async():
+        semaphore = asyncio.Semaphore(args.concurrency)
+        await asyncio.gather(*(handle_request_async(user_name, semaphore)
+                               for user_name in user_names))
+        await async_data_processing.count_movies(1)
+
+    async def run_async_measured():
+        # Warm up the connection pool before measuring.
+        await run_async()
+        start = time.perf_counter()
+        await run_async()
+        elapsed = time.perf_counter() - start
+        await async_database.dispose_engine()
+        return elapsed
+
+    results = []
+    for name, run in [("sync sequential", run_sequential),
+                      (f"sync {args.concurrency} threads", run_threads)]:
+        run()
+        start = time.perf_counter()
+        run()
+        results.append((name, time.perf_counter() - start))
+    results.append((f"async {args.concurrency} tasks",
+                    asyncio.run(run_async_measured())))
+    for name, elapsed in results:
+        print(f"{name:>20}: {args.requests / elapsed:8.0f} requests/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compare Python loops with the NumPy columnar snapshot.
+
+Times the stats, sort and filter operations of the CLI for a large
+library, once with the former per-movie Python code and once with
+the vectorized operations of models.columnar.
+
+Usage:
+    python benchmarks/bench_columnar.py --movies 100000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import generate_data
+
+USER_PREFIX = "coluser"
+
+
+def measure_time(func, repeat=5):
+    """Return the fastest of 'repeat' runs of func() in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def python_stats(data):
+    """Return mean, median, best and worst movies using Python loops."""
+    ratings = [movie["rating"] for movie in data.values()]
+    best = max(ratings)
+    worst = min(ratings)
+    return (statistics.mean(ratings), statistics.median(ratings),
+            [imdb_id for imdb_id, movie in data.items()
+             if movie["rating"] == best],
+            [imdb_id for imdb_id, movie in data.items()
+             if movie["rating"] == worst])
+
+
+def columnar_stats(snapshot):
+    """Return mean, median, best and worst movies of the snapshot."""
+    return (snapshot.average_rating(), snapshot.median_rating(),
+            snapshot.best_or_worst_movies(),
+            snapshot.best_or_worst_movies(get_best=False))
+
+
+def python_filter(data, min_rating, year_start, year_end):
+    """Return the matching movies sorted by year using Python loops."""
+    filtered = {imdb_id: movie for imdb_id, movie in data.items()
+                if movie["rating"] >= min_rating
+                and year_start <= movie["year"] <= year_end}
+    return dict(sorted(filtered.items(), key=lambda item: item[1]["year"],
+                       reverse=True))
+
+
+def columnar_filter(snapshot, min_rating, year_start, year_end):
+    """Return the matching movies sorted by year using the snapshot."""
+    mask = snapshot.filter_mask(min_rating, year_start, year_end)
+    return snapshot.select(snapshot.argsort("years", reverse=True, mask=mask))
+
+
+def main():
+    """Print the timings of both implementations."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movies", type=int, default=100000)
+    args = parser.parse_args()
+    db_file = Path(tempfile.mkdtemp()) / "movies.sqlite3"
+    generate_data.generate_database(db_file, generate_data.parse_args([
+        "--users", "1", "--movies", str(args.movies),
+        "--ratings-per-user", str(args.movies), "--library-spread", "0",
+        "--user-prefix", USER_PREFIX]))
+    os.environ["MOVIES_DB_PATH"] = str(db_file)
+    # Import after MOVIES_DB_PATH has been set.
+    from myapp.models import columnar, data_processing
+    if not columnar.is_available():
+        raise SystemExit("NumPy is not installed.")
+    user_id = data_processing.get_user(f"{USER_PREFIX}0").id
+    data = data_processing.get_movies(user_id)
+    snapshot = columnar.RatingsSnapshot(data)
+    filter_args = (7, 1980, 2010)
+    cases = [
+        ("stats",
+         lambda: python_stats(data),
+         lambda: columnar_stats(snapshot)),
+        ("sort by rating",
+         lambda: dict(sorted(data.items(), key=lambda item: item[1]["rating"],
+                             reverse=True)),
+         lambda: snapshot.select(snapshot.argsort("ratings", reverse=True))),
+        ("sort only",
+         lambda: sorted(data.values(), key=lambda movie: movie["rating"],
+                        reverse=True),
+         lambda: snapshot.argsort("ratings", reverse=True)),
+        ("filter + sort",
+         lambda: python_filter(data, *filter_args),
+         lambda: columnar_filter(snapshot, *filter_args)),
+    ]
+    print(f"{len(data)} movies, snapshot built in "
+          f"{measure_time(lambda: columnar.RatingsSnapshot(data)) * 1000:.1f} ms")
+    for name, python_func, columnar_func in cases:
+        python_time = measure_time(python_func)
+        columnar_time = measure_time(columnar_func)
+        print(f"{name:>15}: python {python_time * 1000:8.2f} ms, "
+              f"numpy {columnar_time * 1000:8.2f} ms, "
+              f"speedup {python_time / columnar_time:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
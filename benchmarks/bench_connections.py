@@ -0,0 +1,85 @@
+"""Measure the overhead of acquiring database connections.
+
+Runs the same sequence of small queries (user, movie and rating
+lookups) with every pool type of database.create_db_engine and inside
+one database.transaction() block, which reuses a single connection.
+Also compares the prebuilt statements of db.statements with building
+a new text() clause for every execution.
+
+Usage:
+    python benchmarks/bench_connections.py --calls 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import text
+
+import generate_data
+
+USER_PREFIX = "connuser"
+
+
+def measure_time(func, repeat=3):
+    """Return the fastest of 'repeat' runs of func() in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    """Print the time per query for each pool type."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+    db_file = Path(tempfile.mkdtemp()) / "movies.sqlite3"
+    generate_data.generate_database(db_file, generate_data.parse_args([
+        "--users", "10", "--movies", "1000", "--user-prefix", USER_PREFIX]))
+    os.environ["MOVIES_DB_PATH"] = str(db_file)
+    # Import after MOVIES_DB_PATH has been set.
+    from myapp.db import database as db
+    from myapp.db import db_queries, statements
+    user_name = f"{USER_PREFIX}0"
+    user_id = db.get_user({"user_name": user_name})[0][0]
+    movie_id = db.get_movies({"user_id": user_id})[0][0]
+
+    def lookups():
+        for _ in range(args.calls // 3):
+            db.get_user({"user_name": user_name})
+            db.get_movie({"id": movie_id})
+            db.get_rating({"user_id": user_id, "movie_id": movie_id})
+
+    def lookups_in_transaction():
+        with db.transaction():
+            lookups()
+
+    calls = args.calls // 3 * 3
+    for pool in db.POOL_CLASSES:
+        db.engine.dispose()
+        db.engine = db.create_db_engine(pool)
+        cases = [(pool, lookups), (f"{pool} + transaction",
+                                   lookups_in_transaction)]
+        for name, func in cases:
+            elapsed = measure_time(func)
+            print(f"{name:>24}: {elapsed / calls * 1e6:8.1f} µs per query")
+    params = {"user_id": user_id, "movie_id": movie_id}
+    clause = statements.get(db_queries.GET_RATING).clause
+    with db.engine.connect() as connection:
+        cases = [("text() per call", lambda: connection.execute(
+                     text(db_queries.GET_RATING), params).fetchall()),
+                 ("prebuilt statement", lambda: connection.execute(
+                     clause, params).fetchall())]
+        for name, execute in cases:
+            elapsed = measure_time(lambda: [execute()
+                                            for _ in range(args.calls)])
+            print(f"{name:>24}: {elapsed / args.calls * 1e6:8.1f} µs "
+                  f"per query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure memory and build time of a user's movie library.
+
+Compares the slotted row objects returned by data_processing.get_movies
+with the former dictionary of movie dictionaries built from the same
+database rows.
+
+Usage:
+    python benchmarks/bench_memory.py --movies 100000
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import generate_data
+
+USER_PREFIX = "memuser"
+
+
+def legacy_movies_dict(rows):
+    """Return movies as the former dictionary of dictionaries."""
+    return {movie[1]: {"movie_id": movie[0],
+                       "title": movie[2],
+                       "year": movie[3],
+                       "image_url": movie[4],
+                       "imdb_rating": movie[5],
+                       "rating": movie[6],
+                       "note": movie[7]}
+            for movie in rows}
+
+
+def measure_size(build):
+    """Return the memory retained by the result of build() in bytes."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def measure_time(build, repeat=3):
+    """Return the fastest of 'repeat' runs of build() in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def main():
+    """Print memory per 100k movies for both representations."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--movies", type=int, default=100000)
+    args = parser.parse_args()
+    db_file = Path(tempfile.mkdtemp()) / "movies.sqlite3"
+    generate_data.generate_database(db_file, generate_data.parse_args([
+        "--users", "1", "--movies", str(args.movies),
+        "--ratings-per-user", str(args.movies), "--library-spread", "0",
+        "--user-prefix", USER_PREFIX]))
+    os.environ["MOVIES_DB_PATH"] = str(db_file)
+    # Import after MOVIES_DB_PATH has been set.
+    from myapp.db import database as db
+    from myapp.models import data_processing
+    user_id = data_processing.get_user(f"{USER_PREFIX}0").id
+    params = {"user_id": user_id}
+    scale = 100000 / args.movies
+    # Both versions include fetching the rows from the database.
+    results = [("dict of dicts",
+                lambda: legacy_movies_dict(db.get_movies(params))),
+               ("slotted rows", lambda: data_processing.get_movies(user_id))]
+    for name, build in results:
+        size = measure_size(build)
+        elapsed = measure_time(build)
+        print(f"{name:>14}: {size * scale / 2 ** 20:8.1f} MiB per 100k movies,"
+              f" built in {elapsed * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Measure the OMDB client against the local replay server.
+
+The script synthesizes fixtures (unless they exist), starts the replay
+server and runs searches with detail lookups from several threads.
+It reports throughput, HTTP calls saved by request coalescing and the
+number of failed or short-circuited calls. Error responses of the replay
+server are counted by status code (e.g. 'http 429', 'http 503').
+
+Usage:
+    python benchmarks/bench_omdb_client.py --threads 8 --latency 0.05
+"""
+import argparse
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from omdb_replay import (FIXTURES_PATH, ReplayBehaviour,
+                         start_replay_server, synthesize_fixtures)
+from myapp.api import api_client as api
+from myapp.api.rate_limiter import DailyQuota, SingleFlight, TokenBucket
+
+
+def configure_client(base_url, requests_per_second, response_ttl):
+    """Point the client to the replay server and isolate its state."""
+    api.OMDB_BASE_URL = base_url
+    quota_file = Path(tempfile.mkdtemp()) / "omdb_quota.json"
+    api.omdb_quota = DailyQuota(10 ** 9, quota_file)
+    api.omdb_rate_limiter = TokenBucket(requests_per_second,
+                                        max(1, int(requests_per_second)))
+    api.omdb_requests = SingleFlight(ttl=response_ttl)
+
+
+def search_with_details(search_term) -> Counter:
+    """Search for movies, look up the details of every result
+    and return the counted outcome.
+    """
+    outcomes = Counter()
+    try:
+        results = api.find_movies(search_term)
+        for result in results:
+            api.fetch_movie_details(result["imdbID"])
+        outcomes["lookups"] += 1 + len(results)
+        outcomes["ok"] += 1
+    except api.CircuitOpenError:
+        outcomes["short-circuited"] += 1
+    except api.QuotaExceededError:
+        outcomes["quota exceeded"] += 1
+    except requests.HTTPError as e:
+        outcomes[f"http {e.response.status_code}"] += 1
+    except Exception:  # pylint: disable=broad-exception-caught
+        outcomes["failed"] += 1
+    return outcomes
+
+
+def run(args):
+    """Run the benchmark and return a dictionary of results."""
+    fixtures_path = Path(args.fixtures)
+    if not (fixtures_path / "search").exists():
+        synthesize_fixtures(args.movies, fixtures_path)
+    behaviour = ReplayBehaviour(args.latency, args.jitter, args.error_rate,
+                                args.burst_rate, seed=args.seed)
+    server = start_replay_server(fixtures_path, behaviour=behaviour)
+    configure_client(server.base_url, args.requests_per_second, args.ttl)
+    served_before = api.omdb_quota.usage()[0]
+    # Every thread repeats the same searches to exercise coalescing.
+    pages = max(1, args.movies // 10)
+    search_terms = [f"movie {i % pages}" for i in range(args.searches)]
+    outcomes = Counter()
+    start = time.perf_counter()
+    # Every search counts its own outcome; they are merged here.
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for search_outcomes in executor.map(search_with_details,
+                                            search_terms):
+            outcomes.update(search_outcomes)
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    http_calls = api.omdb_quota.usage()[0] - served_before
+    return {"elapsed_s": round(elapsed, 3),
+            "searches_per_s": round(args.searches / elapsed, 1),
+            "http_calls": http_calls,
+            "calls_saved": max(0, outcomes["lookups"] - http_calls),
+            "circuit_state": api.omdb_circuit.state,
+            **dict(outcomes)}
+
+
+def parse_args():
+    """Return the parsed command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", default=FIXTURES_PATH)
+    parser.add_argument("--movies", type=int, default=200)
+    parser.add_argument("--searches", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests-per-second", type=float, default=1000)
+    parser.add_argument("--ttl", type=float, default=300)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--burst-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    """Print the benchmark results."""
+    for key, value in run(parse_args()).items():
+        print(f"{key:>16}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure building and querying the item-item recommender.
+
+Generates a synthetic database, builds the similarity model once and
+times recommendations for random users from the cached model. The
+user's ratings are read for every request, as in the CLI and the API.
+
+Usage:
+    python benchmarks/bench_recommender.py --users 1000 --movies 10000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import generate_data
+
+USER_PREFIX = "recuser"
+
+
+def percentile(sorted_values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def main():
+    """Print the build time of the model and the request latencies."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--ratings-per-user", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    db_file = Path(tempfile.mkdtemp()) / "movies.sqlite3"
+    generate_data.generate_database(db_file, generate_data.parse_args([
+        "--users", str(args.users), "--movies", str(args.movies),
+        "--ratings-per-user", str(args.ratings_per_user),
+        "--user-prefix", USER_PREFIX]))
+    os.environ["MOVIES_DB_PATH"] = str(db_file)
+    # Import after MOVIES_DB_PATH has been set.
+    from myapp.models import columnar, data_processing, recommender
+    if not recommender.is_available():
+        raise SystemExit("NumPy is not installed.")
+    user_ids = [data_processing.get_user(f"{USER_PREFIX}{i}").id
+                for i in range(args.users)]
+    start = time.perf_counter()
+    ratings = data_processing.get_all_ratings()
+    load_time = time.perf_counter() - start
+    start = time.perf_counter()
+    model = recommender.ItemSimilarityModel(ratings)
+    build_time = time.perf_counter() - start
+    print(f"{len(ratings)} ratings loaded in {load_time * 1000:.0f} ms, "
+          f"model of {len(model)} movies built in {build_time * 1000:.0f} ms")
+    recommender.get_model()
+    rng = random.Random(args.seed)
+    latencies = []
+    for _ in range(args.requests):
+        user_id = rng.choice(user_ids)
+        # Every request reads the user's ratings anew.
+        columnar.clear_snapshots()
+        start = time.perf_counter()
+        recommender.recommend_movies(user_id, args.limit)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"{args.requests} recommendations of {args.limit} movies: "
+          f"p50 {statistics.median(latencies) * 1e3:.2f} ms"
+          f"  p90 {percentile(latencies, 0.90) * 1e3:.2f} ms"
+          f"  p99 {percentile(latencies, 0.99) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compare session token validation with bcrypt password checks.
+
+Times auth.session.validate_token (HMAC check plus revocation lookup
+in an already loaded store), resume_session (which also reads the
+session file) and bcrypt.checkpw at the configured cost factor.
+
+Usage:
+    python benchmarks/bench_sessions.py --rounds 12 --calls 20
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import bcrypt
+
+PASSWORD = b"password"
+
+
+def measure_time(func, calls):
+    """Return the mean seconds per call of func()."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    """Print the time per check for each method."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=12,
+                        help="bcrypt cost factor (default: %(default)s)")
+    parser.add_argument("--calls", type=int, default=20,
+                        help="bcrypt checks; token checks run 1000x as often")
+    args = parser.parse_args()
+    temporary_path = Path(tempfile.mkdtemp())
+    os.environ["MYAPP_SESSIONS_FILE"] = str(temporary_path / "sessions.json")
+    # Import after MYAPP_SESSIONS_FILE has been set.
+    from myapp.auth import session
+    token = session.start_session(1, "benchuser")
+    store = session.load_store()
+    password_hash = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(args.rounds))
+    cases = [
+        (f"bcrypt.checkpw ({args.rounds} rounds)", args.calls,
+         lambda: bcrypt.checkpw(PASSWORD, password_hash)),
+        ("validate_token", args.calls * 1000,
+         lambda: session.validate_token(token, store)),
+        ("resume_session", args.calls * 1000,
+         lambda: session.resume_session(1, "benchuser"))]
+    results = {}
+    for name, calls, func in cases:
+        results[name] = measure_time(func, calls)
+        print(f"{name:>28}: {results[name] * 1e6:10.1f} µs per check")
+    bcrypt_time = results[cases[0][0]]
+    for name, _, _ in cases[1:]:
+        print(f"{name:>28}: {bcrypt_time / results[name]:10.0f}x faster "
+              f"than bcrypt")
+
+
+if __name__ == "__main__":
+    main()
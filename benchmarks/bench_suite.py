@@ -0,0 +1,266 @@
+"""Time the app's hot paths on synthetic libraries of different sizes.
+
+Every library size runs in a fresh subprocess against its own
+temporary database, so caches and memory don't leak between sizes.
+Results are written as JSON and compared against a stored baseline.
+
+Usage:
+    python benchmarks/bench_suite.py --sizes 100 1000 10000
+    python benchmarks/bench_suite.py --save-baseline
+    python benchmarks/bench_suite.py --sizes 1000000 --only get_movies
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import generate_data
+
+BENCHMARKS_ROOT = Path(__file__).resolve().parent
+RESULTS_PATH = (BENCHMARKS_ROOT / "results").resolve()
+DEFAULT_OUTPUT = RESULTS_PATH / "latest.json"
+DEFAULT_BASELINE = RESULTS_PATH / "baseline.json"
+DEFAULT_SIZES = [100, 1000, 10000, 100000, 1000000]
+# Ratio of current to baseline median that counts as a regression
+DEFAULT_THRESHOLD = 1.25
+BENCH_USER_PREFIX = "benchuser"
+BENCH_USER_NAME = f"{BENCH_USER_PREFIX}0"
+
+
+# ---------------------------------------------------------------------
+# SYNTHETIC DATA
+# ---------------------------------------------------------------------
+def seed_database(db_file, ratings, seed=0):
+    """Create a database with one user who rated 'ratings' movies."""
+    options = generate_data.parse_args([
+        "--users", "1", "--movies", str(ratings),
+        "--ratings-per-user", str(ratings), "--library-spread", "0",
+        "--user-prefix", BENCH_USER_PREFIX, "--seed", str(seed)])
+    generate_data.generate_database(db_file, options)
+
+
+# ---------------------------------------------------------------------
+# BENCHMARKS
+# ---------------------------------------------------------------------
+def define_benchmarks(size):
+    """Return (name, function, max_size) tuples for the benchmarks.
+
+    Benchmarks issuing one query per movie are limited by 'max_size',
+    since they would take hours on the largest libraries.
+    """
+    # Import after MOVIES_DB_PATH has been set by the worker.
+    from myapp.db import database as db
+    from myapp.models import data_processing
+    from myapp.models import random_pick
+    from myapp.cli import cli
+    from myapp.web import render_user_page
+
+    user_id = data_processing.get_user(BENCH_USER_NAME)["id"]
+    cli.current_user_id = user_id
+    cli.ask_for_name_part = lambda: "dark"
+    render_user_page.OUTPUT_PATH = Path(tempfile.mkdtemp())
+    movies = data_processing.get_movies(user_id)
+    movies_dict = cli.get_imdb_ids_with_title(movies)
+    rng = random.Random(1)
+    imdb_ids = rng.choices(list(movies), k=100)
+    movie_ids = [movies[imdb_id]["movie_id"] for imdb_id in imdb_ids]
+    # Last movie before the last page of the library sorted by rating
+    last_page_start = data_processing.find_movies(
+        user_id, order_by="rating", descending=True, limit=1,
+        offset=max(len(movies) - 21, 0)).at(0)
+
+    def countries_for_movies():
+        for movie_id in movie_ids:
+            data_processing.get_countries_for_movie(movie_id)
+
+    def crud_reads():
+        for movie_id, imdb_id in zip(movie_ids, imdb_ids):
+            db.get_movie({"imdb_id": imdb_id})
+            db.get_rating({"user_id": user_id, "movie_id": movie_id})
+        db.get_user({"user_name": BENCH_USER_NAME})
+        db.count_ratings_for_user({"user_id": user_id})
+
+    def crud_writes():
+        for movie_id in movie_ids[:20]:
+            params = {"user_id": user_id, "movie_id": movie_id}
+            rating = db.get_rating(params)[0]
+            db.delete_rating(params)
+            db.add_rating({**params, "rating": rating[0], "note": rating[3]})
+            db.update_rating({**params, "rating": rating[0], "note": rating[3]})
+
+    return [
+        ("get_movies", lambda: data_processing.get_movies(user_id), None),
+        ("find_movies_by_rating_page", lambda: data_processing.find_movies(
+            user_id, order_by="rating", descending=True, limit=20), None),
+        ("page_by_offset_last", lambda: data_processing.find_movies(
+            user_id, order_by="rating", descending=True, limit=20,
+            offset=max(len(movies) - 20, 0)), None),
+        ("page_by_keyset_last", lambda: data_processing.find_movies(
+            user_id, order_by="rating", descending=True, limit=20,
+            after=last_page_start), None),
+        ("find_movies_filtered", lambda: data_processing.find_movies(
+            user_id, order_by="year", descending=True, min_rating=8,
+            year_start=1990, year_end=2000), None),
+        ("get_countries_for_movie_x100", countries_for_movies, None),
+        ("crud_reads_x100", crud_reads, None),
+        ("crud_writes_x20", crud_writes, None),
+        ("sequence_matcher", lambda: cli.sequence_matcher(
+            "dark night", movies_dict, 4, 0.3), None),
+        ("get_random_movie", quietly(cli.get_random_movie), None),
+        ("random_pick_weighted_x100", lambda: random_pick.pick_movie_ids(
+            user_id, 100, weighted=True, exclude_recent=False,
+            min_rating=5), None),
+        ("search_movie", quietly(cli.search_movie), 10000),
+        ("get_movie_stats", quietly(cli.get_movie_stats), 100000),
+        ("render_webpage", lambda: render_user_page.render_webpage(user_id),
+         10000),
+    ]
+
+
+def quietly(func):
+    """Return func wrapped to discard anything printed to the console."""
+    def wrapper():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+    return wrapper
+
+
+def time_function(func, repeat):
+    """Return the durations of 'repeat' calls of func in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run_worker(size, repeat, only):
+    """Seed a database, run all benchmarks for one size
+    and print the results as JSON lines.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_file = Path(temp_dir) / "movies.sqlite3"
+        start = time.perf_counter()
+        seed_database(db_file, size)
+        seed_time = time.perf_counter() - start
+        os.environ["MOVIES_DB_PATH"] = str(db_file)
+        print(json.dumps({"name": "seed_database", "size": size,
+                          "repeat": 1, "min_s": seed_time,
+                          "median_s": seed_time}), flush=True)
+        for name, func, max_size in define_benchmarks(size):
+            if only and name not in only:
+                continue
+            if max_size and size > max_size:
+                continue
+            durations = time_function(func, repeat)
+            print(json.dumps({"name": name, "size": size, "repeat": repeat,
+                              "min_s": min(durations),
+                              "median_s": statistics.median(durations)}),
+                  flush=True)
+
+
+# ---------------------------------------------------------------------
+# RESULTS
+# ---------------------------------------------------------------------
+def run_sizes(sizes, repeat, only):
+    """Run the benchmarks for every size in a subprocess
+    and return the collected results.
+    """
+    results = []
+    for size in sizes:
+        command = [sys.executable, __file__, "--worker", "--size", str(size),
+                   "--repeat", str(repeat)]
+        if only:
+            command += ["--only", *only]
+        process = subprocess.run(command, capture_output=True, text=True,
+                                 check=True)
+        for line in process.stdout.splitlines():
+            result = json.loads(line)
+            results.append(result)
+            print(f"{result['name']:>30} {result['size']:>8} "
+                  f"{result['median_s'] * 1000:>12.3f} ms")
+    return results
+
+
+def write_results(results, output_path):
+    """Write the results with some metadata to a JSON file."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    report = {"created_at": datetime.now(timezone.utc).isoformat(),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": results}
+    with open(output_path, "w", encoding="utf-8") as file_obj:
+        json.dump(report, file_obj, indent=2)
+
+
+def compare_with_baseline(results, baseline_path, threshold):
+    """Print the change against the baseline
+    and return the list of regressions.
+    """
+    with open(baseline_path, "r", encoding="utf-8") as file_obj:
+        baseline = json.load(file_obj)["results"]
+    baseline_medians = {(item["name"], item["size"]): item["median_s"]
+                        for item in baseline}
+    regressions = []
+    print(f"\nCompared with baseline {baseline_path}:")
+    for result in results:
+        key = (result["name"], result["size"])
+        if key not in baseline_medians or not baseline_medians[key]:
+            continue
+        ratio = result["median_s"] / baseline_medians[key]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append({**result, "ratio": ratio})
+        print(f"{result['name']:>30} {result['size']:>8} {ratio:>8.2f}x{flag}")
+    return regressions
+
+
+def parse_args():
+    """Return the parsed command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="number of ratings in the benchmark library")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", help="benchmark names to run")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--worker", action="store_true",
+                        help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    """Run the benchmark suite and exit with status 1 on regressions."""
+    args = parse_args()
+    if args.worker:
+        run_worker(args.size, args.repeat, args.only)
+        return
+    results = run_sizes(args.sizes, args.repeat, args.only)
+    write_results(results, args.output)
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        write_results(results, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline.exists():
+        if compare_with_baseline(results, args.baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
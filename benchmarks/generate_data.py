@@ -0,0 +1,306 @@
+"""Generate a large synthetic movie database for load and scale testing.
+
+Users, movies, countries, movie-country links and ratings are written
+with bulk inserts. Movie popularity follows a Zipf distribution, ratings
+follow a skewed beta distribution and note lengths are exponentially
+distributed. The same seed always produces the same database.
+
+Usage:
+    python benchmarks/generate_data.py --output /tmp/movies.sqlite3 \\
+        --users 10000 --movies 50000 --ratings-per-user 100
+    python benchmarks/generate_data.py --users 5
+
+The default output is data/bench.sqlite3, next to the app's database.
+An existing, non-empty file is only written to with '--force', as the
+data is added with durability turned off.
+
+Generated users can log in with the password given by '--password'.
+Their hashes use the lowest bcrypt cost factor (4); the first login
+rehashes them unless MYAPP_BCRYPT_ROUNDS=4 is set.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import bcrypt
+import pycountry
+
+from myapp.db import db_queries
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_OUTPUT = (PROJECT_ROOT / "data" / "bench.sqlite3").resolve()
+SCHEMA_QUERIES = [db_queries.CREATE_TABLE_USERS,
+                  db_queries.CREATE_TABLE_COUNTRIES,
+                  db_queries.CREATE_TABLE_MOVIES,
+                  db_queries.CREATE_TABLE_MOVIES_COUNTRIES,
+                  db_queries.CREATE_TABLE_RATINGS,
+                  db_queries.ADD_DEFAULT_USER]
+# Indexes are built after the bulk inserts, which is faster.
+INDEX_QUERIES = [db_queries.CREATE_INDEX_RATINGS_USER_RATING,
+                 db_queries.CREATE_INDEX_RATINGS_USER_MOVIE,
+                 db_queries.CREATE_INDEX_MOVIES_YEAR,
+                 db_queries.CREATE_INDEX_MOVIES_TITLE,
+                 db_queries.DELETE_DUPLICATE_MOVIES_COUNTRIES,
+                 db_queries.DROP_INDEX_MOVIES_COUNTRIES_MOVIE,
+                 db_queries.CREATE_UNIQUE_INDEX_MOVIES_COUNTRIES,
+                 db_queries.CREATE_INDEX_MOVIES_COUNTRIES_COUNTRY]
+# Keep generated imdb ids clear of the ids used by OMDB.
+IMDB_ID_OFFSET = 90000000
+TITLE_WORDS = ["night", "return", "dark", "love", "city", "last", "star",
+               "king", "river", "ghost", "summer", "war", "secret", "blue",
+               "house", "road", "silent", "golden", "empire", "dream"]
+NOTE_WORDS = ["great", "boring", "acting", "plot", "twist", "ending",
+              "soundtrack", "classic", "slow", "funny", "again", "visuals"]
+BATCH_SIZE = 100000
+RATING_VALUES = [rating / 10 for rating in range(101)]
+NOTE_POOL_SIZE = 4096
+# Cheapest bcrypt cost factor; set MYAPP_BCRYPT_ROUNDS to the same
+# value when logging in as generated users to avoid rehashing.
+BCRYPT_ROUNDS = 4
+SALT_ALPHABET = ("./ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+                 "abcdefghijklmnopqrstuvwxyz0123456789")
+
+
+def seeded_salt(rng, rounds=BCRYPT_ROUNDS):
+    """Return a bcrypt salt drawn from rng, so hashes are reproducible."""
+    chars = rng.choices(SALT_ALPHABET, k=21)
+    # The last character only encodes the remaining two bits.
+    chars.append(rng.choice(".Oeu"))
+    return f"$2b${rounds:02d}${''.join(chars)}".encode("ascii")
+
+
+def zipf_cum_weights(count, exponent):
+    """Return cumulative Zipf weights for 'count' ranked items."""
+    return list(itertools.accumulate(1 / (rank ** exponent)
+                                     for rank in range(1, count + 1)))
+
+
+def generate_countries(connection):
+    """Insert all ISO countries and return their ids."""
+    countries = [{"name": country.name, "code": country.alpha_2}
+                 for country in pycountry.countries]
+    connection.execute(db_queries.ADD_COUNTRIES_OR_IGNORE,
+                       {"countries": json.dumps(countries)}).fetchall()
+    return [row[0] for row in connection.execute(
+        "SELECT id FROM countries ORDER BY id")]
+
+
+def generate_users(connection, rng, count, password_hash, prefix=None):
+    """Insert 'count' users named '<prefix><n>' and return their ids."""
+    if prefix is None:
+        prefix = f"synth{rng.randrange(10 ** 6)}u"
+    rows = ((f"{prefix}{i}", "Synthetic", f"User {i}", password_hash)
+            for i in range(count))
+    connection.executemany(
+        "INSERT OR IGNORE INTO users "
+        "(user_name, first_name, last_name, password_hash) "
+        "VALUES (?, ?, ?, ?)", rows)
+    return [row[0] for row in connection.execute(
+        "SELECT id FROM users WHERE user_name LIKE ? ORDER BY id",
+        (f"{prefix}%",))]
+
+
+def generate_movies(connection, rng, count):
+    """Insert 'count' movies and return their ids."""
+    last_id = connection.execute(
+        "SELECT COALESCE(MAX(id), 0) FROM movies").fetchone()[0]
+
+    def rows():
+        for index in range(last_id, last_id + count):
+            title = " ".join(rng.choices(TITLE_WORDS, k=rng.randint(1, 4)))
+            year = max(1900, 2025 - int(rng.expovariate(1 / 20)))
+            imdb_rating = round(rng.uniform(1, 10), 1)
+            yield (f"tt{IMDB_ID_OFFSET + index}", title.title(), year,
+                   "N/A", imdb_rating)
+
+    connection.executemany(
+        "INSERT OR IGNORE INTO movies "
+        "(imdb_id, title, year, image_url, imdb_rating) "
+        "VALUES (?, ?, ?, ?, ?)", rows())
+    return [row[0] for row in connection.execute(
+        "SELECT id FROM movies WHERE id > ? ORDER BY id", (last_id,))]
+
+
+def generate_movie_countries(connection, rng, movie_ids, country_ids,
+                             exponent):
+    """Link every movie to one to three countries, favouring
+    a few countries over the rest. Return the number of links.
+    """
+    ranked_countries = rng.sample(country_ids, len(country_ids))
+    cum_weights = zipf_cum_weights(len(ranked_countries), exponent)
+    rows = []
+    for movie_id in movie_ids:
+        countries = rng.choices(ranked_countries, cum_weights=cum_weights,
+                                k=rng.randint(1, 3))
+        rows.extend((movie_id, country_id)
+                    for country_id in dict.fromkeys(countries))
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.execute(db_queries.ADD_MOVIES_COUNTRIES_OR_IGNORE,
+                           {"links": json.dumps(rows[start:start + BATCH_SIZE])})
+    return len(rows)
+
+
+def library_size(rng, mean, spread, movie_count):
+    """Return the number of ratings for one user.
+
+    Sizes are log-normally distributed around 'mean';
+    a spread of 0 gives every user exactly 'mean' ratings.
+    """
+    if spread == 0:
+        return min(movie_count, mean)
+    size = rng.lognormvariate(math.log(mean) - spread ** 2 / 2, spread)
+    return min(movie_count, max(1, round(size)))
+
+
+def rating_cum_weights(alpha, beta):
+    """Return cumulative beta distribution weights for RATING_VALUES."""
+    weights = []
+    for rating in RATING_VALUES:
+        # Evaluate the density at the bin centre to avoid 0 and 1.
+        x = (rating + 0.05) / 10.05
+        weights.append(x ** (alpha - 1) * (1 - x) ** (beta - 1))
+    return list(itertools.accumulate(weights))
+
+
+def generate_note_pool(rng, note_rate, note_words):
+    """Return a pool of notes to draw from, including empty notes.
+
+    Notes have exponentially distributed lengths and make up
+    'note_rate' of the pool.
+    """
+    notes = []
+    for _ in range(NOTE_POOL_SIZE):
+        if rng.random() >= note_rate:
+            notes.append("")
+        else:
+            length = max(1, round(rng.expovariate(1 / note_words)))
+            notes.append(" ".join(rng.choices(NOTE_WORDS, k=length)))
+    return notes
+
+
+def generate_ratings(connection, rng, user_ids, movie_ids, options):
+    """Insert ratings for every user and return the number of ratings.
+
+    Movies are picked by Zipf popularity without repetition per user.
+    """
+    ranked_movies = rng.sample(movie_ids, len(movie_ids))
+    movie_weights = zipf_cum_weights(len(ranked_movies), options.zipf_exponent)
+    rating_weights = rating_cum_weights(options.rating_alpha,
+                                        options.rating_beta)
+    note_pool = generate_note_pool(rng, options.note_rate, options.note_words)
+    count = 0
+    rows = []
+    for user_id in user_ids:
+        size = library_size(rng, options.ratings_per_user,
+                            options.library_spread, len(movie_ids))
+        if size == len(movie_ids):
+            picked = ranked_movies
+        else:
+            picked = {}
+            while len(picked) < size:
+                picked.update(dict.fromkeys(rng.choices(
+                    ranked_movies, cum_weights=movie_weights,
+                    k=size - len(picked))))
+        ratings = rng.choices(RATING_VALUES, cum_weights=rating_weights,
+                              k=size)
+        notes = rng.choices(note_pool, k=size)
+        rows.extend(zip(ratings, itertools.repeat(user_id), picked, notes))
+        if len(rows) >= BATCH_SIZE:
+            count += insert_ratings(connection, rows)
+            rows = []
+    count += insert_ratings(connection, rows)
+    return count
+
+
+def insert_ratings(connection, rows):
+    """Bulk insert rating rows and return their number."""
+    connection.executemany(
+        "INSERT INTO ratings (rating, user_id, movie_id, note) "
+        "VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+
+def generate_database(db_file, options):
+    """Fill the database file with synthetic data
+    and return the number of rows per table.
+    """
+    rng = random.Random(options.seed)
+    password_hash = bcrypt.hashpw(options.password.encode("utf-8"),
+                                  seeded_salt(rng)).decode("utf-8")
+    connection = sqlite3.connect(db_file)
+    # Durability is irrelevant while generating throwaway data.
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("PRAGMA journal_mode = MEMORY")
+    for query in SCHEMA_QUERIES:
+        connection.execute(query)
+    country_ids = generate_countries(connection)
+    user_ids = generate_users(connection, rng, options.users, password_hash,
+                              options.user_prefix)
+    movie_ids = generate_movies(connection, rng, options.movies)
+    links = generate_movie_countries(connection, rng, movie_ids, country_ids,
+                                     options.country_exponent)
+    ratings = generate_ratings(connection, rng, user_ids, movie_ids, options)
+    for query in INDEX_QUERIES:
+        connection.execute(query)
+    connection.commit()
+    connection.close()
+    return {"users": len(user_ids), "countries": len(country_ids),
+            "movies": len(movie_ids), "movies_countries": links,
+            "ratings": ratings}
+
+
+def parse_args(args=None):
+    """Return the parsed command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT,
+                        help="database file to fill (created if missing, "
+                             "default: data/bench.sqlite3)")
+    parser.add_argument("--force", action="store_true",
+                        help="write to an existing, non-empty database")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--movies", type=int, default=10000)
+    parser.add_argument("--ratings-per-user", type=int, default=100,
+                        help="mean number of ratings per user")
+    parser.add_argument("--library-spread", type=float, default=1.0,
+                        help="log-normal spread of library sizes (0: none)")
+    parser.add_argument("--zipf-exponent", type=float, default=1.0,
+                        help="skew of movie popularity")
+    parser.add_argument("--country-exponent", type=float, default=1.5,
+                        help="skew of country popularity")
+    parser.add_argument("--rating-alpha", type=float, default=5.0)
+    parser.add_argument("--rating-beta", type=float, default=2.5)
+    parser.add_argument("--note-rate", type=float, default=0.3,
+                        help="share of ratings with a note")
+    parser.add_argument("--note-words", type=float, default=8,
+                        help="mean number of words per note")
+    parser.add_argument("--password", default="password")
+    parser.add_argument("--user-prefix",
+                        help="user names are '<prefix><n>' (default: random)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(args)
+
+
+def main():
+    """Generate the database and print a summary."""
+    options = parse_args()
+    if (not options.force and options.output.exists()
+            and options.output.stat().st_size):
+        sys.exit(f"{options.output} exists and isn't empty; "
+                 "use --force to add the data to it.")
+    start = time.perf_counter()
+    counts = generate_database(options.output, options)
+    elapsed = time.perf_counter() - start
+    for table, count in counts.items():
+        print(f"{table:>17}: {count}")
+    print(f"Generated {sum(counts.values())} rows in {elapsed:.2f}s "
+          f"into {options.output}")
+
+
+if __name__ == "__main__":
+    main()
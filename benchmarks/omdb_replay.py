@@ -0,0 +1,246 @@
+"""Record OMDB responses to fixture files and replay them offline.
+
+Usage:
+- record fixtures from the real OMDB API (requires 'OMDB_API_KEY'):
+  python benchmarks/omdb_replay.py record "matrix" "alien"
+- generate synthetic fixtures without an API key:
+  python benchmarks/omdb_replay.py synthesize --movies 500
+- serve the fixtures with simulated latency and errors:
+  python benchmarks/omdb_replay.py serve --latency 0.05 --error-rate 0.02
+
+Point the app to the replay server by setting the environment
+variable 'OMDB_BASE_URL', e.g. OMDB_BASE_URL=http://127.0.0.1:8765/
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlparse
+
+BENCHMARKS_ROOT = Path(__file__).resolve().parent
+FIXTURES_PATH = (BENCHMARKS_ROOT / "fixtures" / "omdb").resolve()
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+NOT_FOUND_RESPONSE = {"Response": "False", "Error": "Movie not found!"}
+SYNTHETIC_COUNTRIES = ["United States", "United Kingdom", "France",
+                       "Germany", "Japan", "Italy", "Canada", "Spain"]
+
+
+# ---------------------------------------------------------------------
+# FIXTURE FILES
+# ---------------------------------------------------------------------
+def fixture_path(fixtures_path, params) -> Path | None:
+    """Return the fixture file for the given OMDB query parameters."""
+    if params.get("i"):
+        return fixtures_path / "detail" / f"{quote(params['i'], safe='')}.json"
+    if params.get("s"):
+        search_term = params["s"].lower()
+        return fixtures_path / "search" / f"{quote(search_term, safe='')}.json"
+    return None
+
+
+def write_fixture(fixtures_path, params, body):
+    """Write a response body to the fixture file for the given parameters."""
+    file_path = fixture_path(fixtures_path, params)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, "w", encoding="utf-8") as file_obj:
+        json.dump(body, file_obj, indent=2)
+
+
+def load_fixture(fixtures_path, params) -> dict:
+    """Return the recorded response body for the given parameters."""
+    file_path = fixture_path(fixtures_path, params)
+    if file_path is None or not file_path.exists():
+        return NOT_FOUND_RESPONSE
+    with open(file_path, "r", encoding="utf-8") as file_obj:
+        return json.load(file_obj)
+
+
+def record_fixtures(search_terms, fixtures_path=FIXTURES_PATH):
+    """Record search and detail responses from OMDB for the search terms."""
+    # Import here, so serving fixtures works without the app's settings.
+    from myapp.api import api_client as api
+    count = 0
+    for search_term in search_terms:
+        results = api.find_movies(search_term)
+        write_fixture(fixtures_path, {"s": search_term},
+                      {"Search": results,
+                       "totalResults": str(len(results)),
+                       "Response": "True" if results else "False"})
+        count += 1
+        for result in results:
+            details = api.fetch_movie_details(result["imdbID"])
+            if details:
+                write_fixture(fixtures_path, {"i": result["imdbID"]}, details)
+                count += 1
+    return count
+
+
+def synthesize_fixtures(movie_count, fixtures_path=FIXTURES_PATH,
+                        page_size=10, seed=0):
+    """Write deterministic synthetic fixtures for the given number of movies.
+
+    Movies are grouped into searches for 'movie <n>' with 'page_size'
+    results each, mirroring the shape of real OMDB responses.
+    """
+    rng = random.Random(seed)
+    count = 0
+    for page, start in enumerate(range(0, movie_count, page_size)):
+        results = []
+        for number in range(start, min(start + page_size, movie_count)):
+            imdb_id = f"tt{9000000 + number:07d}"
+            title = f"Synthetic Movie {number}"
+            year = str(rng.randint(1930, 2025))
+            countries = ", ".join(rng.sample(SYNTHETIC_COUNTRIES,
+                                             rng.randint(1, 3)))
+            results.append({"Title": title, "Year": year, "imdbID": imdb_id,
+                            "Type": "movie", "Poster": "N/A"})
+            write_fixture(fixtures_path, {"i": imdb_id},
+                          {"Title": title, "Year": year,
+                           "Released": f"01 Jan {year}",
+                           "Country": countries, "Poster": "N/A",
+                           "imdbRating": f"{rng.uniform(1, 10):.1f}",
+                           "imdbID": imdb_id, "Type": "movie",
+                           "Response": "True"})
+            count += 1
+        write_fixture(fixtures_path, {"s": f"movie {page}"},
+                      {"Search": results,
+                       "totalResults": str(len(results)),
+                       "Response": "True"})
+        count += 1
+    return count
+
+
+# ---------------------------------------------------------------------
+# REPLAY SERVER
+# ---------------------------------------------------------------------
+class ReplayBehaviour:
+    """Decide the latency and the status code for each replayed request.
+
+    - 'latency' and 'jitter': seconds added to every response
+    - 'error_rate': probability of a 503 response
+    - 'burst_rate': probability that a burst of 429 responses starts
+    - 'burst_length': number of consecutive 429 responses per burst
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 burst_rate=0.0, burst_length=5, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_rate = burst_rate
+        self.burst_length = burst_length
+        self.rng = random.Random(seed)
+        self.burst_remaining = 0
+        self.lock = threading.Lock()
+
+    def next_response(self) -> tuple[float, int]:
+        """Return delay in seconds and status code for the next request."""
+        with self.lock:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            if self.burst_remaining == 0 and self.rng.random() < self.burst_rate:
+                self.burst_remaining = self.burst_length
+            if self.burst_remaining > 0:
+                self.burst_remaining -= 1
+                return delay, 429
+            if self.rng.random() < self.error_rate:
+                return delay, 503
+            return delay, 200
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """Answer OMDB style GET requests from the fixture files."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve the recorded response for the query parameters."""
+        query = parse_qs(urlparse(self.path).query)
+        params = {key: values[0] for key, values in query.items()}
+        delay, status = self.server.behaviour.next_response()
+        if delay:
+            time.sleep(delay)
+        if status == 200:
+            body = load_fixture(self.server.fixtures_path, params)
+        else:
+            body = {"Response": "False", "Error": f"Simulated status {status}"}
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep the console quiet during benchmarks."""
+
+
+def start_replay_server(fixtures_path=FIXTURES_PATH, host=DEFAULT_HOST,
+                        port=0, behaviour=None):
+    """Start the replay server in a background thread and return it.
+
+    Use port 0 to pick a free port; the base url to pass
+    as 'OMDB_BASE_URL' is available as server.base_url.
+    """
+    server = ThreadingHTTPServer((host, port), ReplayRequestHandler)
+    server.daemon_threads = True
+    server.fixtures_path = Path(fixtures_path)
+    server.behaviour = behaviour or ReplayBehaviour()
+    server.base_url = f"http://{host}:{server.server_address[1]}/"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+# ---------------------------------------------------------------------
+# COMMAND LINE
+# ---------------------------------------------------------------------
+def parse_args(args=None):
+    """Return the parsed command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_PATH,
+                        help="directory of the fixture files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record = subparsers.add_parser("record", help="record fixtures from OMDB")
+    record.add_argument("search_terms", nargs="+")
+    synthesize = subparsers.add_parser("synthesize",
+                                       help="generate synthetic fixtures")
+    synthesize.add_argument("--movies", type=int, default=100)
+    synthesize.add_argument("--seed", type=int, default=0)
+    serve = subparsers.add_parser("serve", help="serve fixtures over HTTP")
+    serve.add_argument("--host", default=DEFAULT_HOST)
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--latency", type=float, default=0.0)
+    serve.add_argument("--jitter", type=float, default=0.0)
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    serve.add_argument("--burst-rate", type=float, default=0.0)
+    serve.add_argument("--burst-length", type=int, default=5)
+    serve.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(args)
+
+
+def main():
+    """Record, synthesize or serve OMDB fixtures."""
+    args = parse_args()
+    if args.command == "record":
+        count = record_fixtures(args.search_terms, args.fixtures)
+        print(f"Recorded {count} responses to {args.fixtures}")
+    elif args.command == "synthesize":
+        count = synthesize_fixtures(args.movies, args.fixtures, seed=args.seed)
+        print(f"Wrote {count} synthetic responses to {args.fixtures}")
+    else:
+        behaviour = ReplayBehaviour(args.latency, args.jitter, args.error_rate,
+                                    args.burst_rate, args.burst_length,
+                                    args.seed)
+        server = start_replay_server(args.fixtures, args.host, args.port,
+                                     behaviour)
+        print(f"Serving {args.fixtures} at {server.base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
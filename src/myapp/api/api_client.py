@@ -1,59 +1,212 @@
 """Provide API connection(s) and fetch data from online services."""
+import os
 from pathlib import Path
+from time import perf_counter
+from urllib.parse import parse_qs, urlparse
 import requests
 from dotenv import dotenv_values
 
+from myapp.api.rate_limiter import (TokenBucket,
+                                    DailyQuota,
+                                    SingleFlight,
+                                    QuotaExceededError)
+from myapp.api.circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from myapp.api import metrics
+
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
 # OMDB
 DOTENV_FILE_PATH = (PROJECT_ROOT / ".env").resolve()
-OMDB_API_KEY = dotenv_values(DOTENV_FILE_PATH).get("OMDB_API_KEY", None)
-OMDB_BASE_URL = "http://www.omdbapi.com/"
+DOTENV = dotenv_values(DOTENV_FILE_PATH)
+OMDB_API_KEY = DOTENV.get("OMDB_API_KEY", None)
+# Set 'OMDB_BASE_URL' (environment or .env) to use e.g. a local replay server.
+OMDB_BASE_URL = (os.environ.get("OMDB_BASE_URL")
+                 or DOTENV.get("OMDB_BASE_URL", "http://www.omdbapi.com/"))
+# OMDB rate limiting (the free tier allows 1000 requests per day)
+OMDB_REQUESTS_PER_SECOND = float(DOTENV.get("OMDB_REQUESTS_PER_SECOND", 5))
+OMDB_BURST_SIZE = int(DOTENV.get("OMDB_BURST_SIZE", 10))
+OMDB_DAILY_LIMIT = int(DOTENV.get("OMDB_DAILY_LIMIT", 1000))
+OMDB_QUOTA_FILE_PATH = (PROJECT_ROOT / "data" / "omdb_quota.json").resolve()
+# Seconds to reuse a successful response for an identical request
+OMDB_RESPONSE_TTL = 300
+# Request parameters that may be shown in error messages
+# (all others, e.g. the API keys, are left out)
+SAFE_PARAMS = ("i", "s", "country")
 # API Ninjas
 AN_API_KEY = dotenv_values(".env").get("API_NINJAS_KEY", None)
 AN_BASE_URL = "https://api.api-ninjas.com/v1/"
 AN_HEADERS = {"X-Api-Key": AN_API_KEY}
 
-TIMEOUT = 4
+# Fail fast on unreachable hosts, but give slow responses more time.
+CONNECT_TIMEOUT = float(DOTENV.get("CONNECT_TIMEOUT", 2))
+READ_TIMEOUT = float(DOTENV.get("READ_TIMEOUT", 4))
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+# Open the circuit after consecutive failures and probe again after cooldown
+OMDB_FAILURE_THRESHOLD = int(DOTENV.get("OMDB_FAILURE_THRESHOLD", 3))
+OMDB_COOLDOWN = float(DOTENV.get("OMDB_COOLDOWN", 30))
+
+omdb_rate_limiter = TokenBucket(OMDB_REQUESTS_PER_SECOND, OMDB_BURST_SIZE)
+omdb_quota = DailyQuota(OMDB_DAILY_LIMIT, OMDB_QUOTA_FILE_PATH)
+omdb_requests = SingleFlight(ttl=OMDB_RESPONSE_TTL)
+omdb_circuit = CircuitBreaker(
+    OMDB_FAILURE_THRESHOLD,
+    OMDB_COOLDOWN,
+    failure_exceptions=(requests.exceptions.Timeout,
+                        requests.exceptions.ConnectionError),
+    is_failure=lambda response: response.status_code >= 500)
 
 
 def retrieve_data_from_api(base_url,
                            endpoint="",
                            headers=None,
-                           payload=None) -> requests.Response | None:
-    """Return response from REST API for given endpoint and payload."""
+                           payload=None,
+                           call_type="other") -> requests.Response | None:
+    """Return response from REST API for given endpoint and payload.
+
+    Record latency, status code and size of the call
+    for the given call type (e.g. search, detail, flag).
+    """
     url = base_url + endpoint
-    return requests.get(url, headers=headers, params=payload, timeout=TIMEOUT)
+    metrics_endpoint = get_metrics_endpoint(url)
+    start = perf_counter()
+    try:
+        response = requests.get(url, headers=headers, params=payload,
+                                timeout=TIMEOUT)
+    except requests.exceptions.Timeout:
+        metrics.observe(metrics_endpoint, call_type, perf_counter() - start,
+                        error="timeout")
+        raise
+    except requests.exceptions.ConnectionError:
+        metrics.observe(metrics_endpoint, call_type, perf_counter() - start,
+                        error="connection")
+        raise
+    metrics.observe(metrics_endpoint, call_type, perf_counter() - start,
+                    status=response.status_code, size=len(response.content))
+    return response
+
+
+def get_metrics_endpoint(url):
+    """Return host and path of an url without the query string."""
+    parsed_url = urlparse(url)
+    return parsed_url.netloc + parsed_url.path
+
+
+def describe_request_error(error) -> str:
+    """Return the class, host and path of a failed request and its
+    safe parameters, leaving out the query string with the API key.
+    """
+    description = type(error).__name__
+    url = getattr(getattr(error, "request", None), "url", None)
+    if not url:
+        return description
+    parsed_url = urlparse(url)
+    params = parse_qs(parsed_url.query)
+    shown = ", ".join(f"{name}={params[name][0]}"
+                      for name in SAFE_PARAMS if name in params)
+    description += f" for {parsed_url.netloc}{parsed_url.path}"
+    return f"{description} ({shown})" if shown else description
+
+
+def get_omdb_call_type(payload):
+    """Return 'search' or 'detail' depending on the OMDB payload."""
+    if payload.get("i"):
+        return "detail"
+    if payload.get("s"):
+        return "search"
+    return "other"
 
 
 def fetch_omdb_api(payload):
-    """Fetch data from the OMDB API."""
+    """Fetch data from the OMDB API.
+
+    Identical requests share one HTTP call, while every call
+    is throttled and counted against the daily quota. Only successful
+    responses are reused for later calls (see is_omdb_success).
+    """
     payload["apikey"] = OMDB_API_KEY
-    return retrieve_data_from_api(OMDB_BASE_URL, payload=payload)
+    key = tuple(sorted(payload.items()))
+    return omdb_requests.do(key, lambda: request_omdb_api(payload),
+                            is_cacheable=is_omdb_success)
+
+
+def is_omdb_success(response) -> bool:
+    """Return True for a successful response with 'Response': 'True'.
+
+    OMDB also answers errors (e.g. the daily limit) with status 200
+    and 'Response': 'False'.
+    """
+    if not response:
+        return False
+    try:
+        return response.json().get("Response") == "True"
+    except (ValueError, AttributeError):
+        return False
+
+
+def request_omdb_api(payload):
+    """Send a rate limited request to the OMDB API.
+
+    Raise QuotaExceededError if the daily quota is used up
+    and CircuitOpenError while the OMDB API is unavailable.
+    """
+    try:
+        return omdb_circuit.call(send_omdb_request, payload)
+    except CircuitOpenError:
+        metrics.count_error(get_metrics_endpoint(OMDB_BASE_URL),
+                            get_omdb_call_type(payload), "circuit_open")
+        raise
+
+
+def send_omdb_request(payload):
+    """Count the request against the quota, throttle and send it."""
+    omdb_quota.consume()
+    omdb_rate_limiter.acquire()
+    return retrieve_data_from_api(OMDB_BASE_URL, payload=payload,
+                                  call_type=get_omdb_call_type(payload))
+
+
+def is_omdb_available():
+    """Return False while the circuit for the OMDB API is open."""
+    return omdb_circuit.state != OPEN
+
+
+def get_omdb_retry_in() -> float:
+    """Return the seconds until the OMDB API will be probed again."""
+    return omdb_circuit.retry_in()
+
+
+def get_omdb_quota_usage() -> tuple[int, int]:
+    """Return the number of OMDB requests used today and the daily limit."""
+    return omdb_quota.usage()
 
 
 def fetch_api_ninjas(payload, endpoint):
     """Fetch data from the API Ninjas."""
     payload["apikey"] = AN_API_KEY
     url = AN_BASE_URL + endpoint
-    return retrieve_data_from_api(url, payload=payload, headers=AN_HEADERS)
+    return retrieve_data_from_api(url, payload=payload, headers=AN_HEADERS,
+                                  call_type=endpoint)
 
 
 def find_movies(search_string):
-    """Return a list of movie objects for the given search string."""
+    """Return a list of movie objects for the given search string.
+
+    Raise requests.HTTPError for error responses (e.g. 429 or 503).
+    """
     payload = {"s": search_string.lower()}
     response = fetch_omdb_api(payload)
-    if response:
-        return response.json().get("Search", [])
-    return []
+    response.raise_for_status()
+    return response.json().get("Search", [])
 
 
 def fetch_movie_details(imdb_id):
-    """Return a movie object for the given imdbID."""
+    """Return a movie object for the given imdbID.
+
+    Raise requests.HTTPError for error responses (e.g. 429 or 503).
+    """
     payload = {"i": imdb_id}
     response = fetch_omdb_api(payload)
-    if response:
-        return response.json()
-    return False
+    response.raise_for_status()
+    return response.json()
 
 
 # It seems that the flag emoji looks much nicer than the svg
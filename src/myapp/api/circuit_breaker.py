@@ -0,0 +1,111 @@
+"""Provide a circuit breaker to fail fast while an API is unavailable.
+
+States:
+- closed: calls pass through, consecutive failures are counted
+- open: calls are short-circuited until the cooldown has passed
+- half-open: a single probe call decides whether to close or reopen
+"""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(BaseException):
+    """Raised when a call is short-circuited by an open circuit."""
+
+
+class CircuitBreaker:
+    """Stop calling a failing service after 'failure_threshold'
+    consecutive failures and probe it again after 'cooldown' seconds.
+
+    Exceptions listed in 'failure_exceptions' and results for which
+    'is_failure' returns True are counted as failures.
+    """
+
+    def __init__(self, failure_threshold, cooldown,
+                 failure_exceptions=(), is_failure=None):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failure_exceptions = tuple(failure_exceptions)
+        self.is_failure = is_failure
+        self.failure_count = 0
+        self.opened_at = None
+        self.is_probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        """Return the current state of the circuit."""
+        with self.lock:
+            return self._state()
+
+    def _state(self):
+        """Return the current state (caller must hold the lock)."""
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return OPEN
+        return HALF_OPEN
+
+    def retry_in(self) -> float:
+        """Return the seconds left until the next probe is allowed."""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            elapsed = time.monotonic() - self.opened_at
+            return max(0.0, self.cooldown - elapsed)
+
+    def _before_call(self):
+        """Raise CircuitOpenError unless the call may pass."""
+        with self.lock:
+            state = self._state()
+            if state == OPEN:
+                raise CircuitOpenError
+            if state == HALF_OPEN:
+                # Only a single probe is allowed while half-open.
+                if self.is_probing:
+                    raise CircuitOpenError
+                self.is_probing = True
+
+    def _record_success(self):
+        """Close the circuit and reset the failure count."""
+        with self.lock:
+            self.failure_count = 0
+            self.opened_at = None
+            self.is_probing = False
+
+    def _record_failure(self):
+        """Count a failure and open the circuit if necessary."""
+        with self.lock:
+            self.failure_count += 1
+            if (self.is_probing
+                    or self.failure_count >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+            self.is_probing = False
+
+    def _release_probe(self):
+        """Allow another probe after a call with an unrelated error."""
+        with self.lock:
+            self.is_probing = False
+
+    def call(self, func, *args, **kwargs):
+        """Return the result of func or raise CircuitOpenError
+        while the circuit is open.
+        """
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.failure_exceptions:
+            self._record_failure()
+            raise
+        except BaseException:
+            self._release_probe()
+            raise
+        if self.is_failure is not None and self.is_failure(result):
+            self._record_failure()
+        else:
+            self._record_success()
+        return result
@@ -0,0 +1,164 @@
+"""Collect metrics for the HTTP calls to external APIs.
+
+Metrics are kept per endpoint and call type (e.g. search, detail, flag):
+- latency histogram
+- number of responses per status code
+- number of timeouts, connection errors and short-circuited calls
+- response sizes in bytes
+
+They can be exported in the Prometheus text format, e.g. for the
+textfile collector of the node exporter.
+"""
+import os
+import threading
+from pathlib import Path
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, float("inf"))
+# Export file for the node exporter, written after every CLI action
+TEXTFILE_PATH = os.environ.get("METRICS_TEXTFILE_PATH")
+METRIC_PREFIX = "myapp_http"
+
+endpoint_metrics = {}
+metrics_lock = threading.Lock()
+
+
+def _get_metrics(endpoint, call_type):
+    """Return the metrics for endpoint and call type
+    (caller must hold the lock).
+    """
+    key = (endpoint, call_type)
+    if key not in endpoint_metrics:
+        endpoint_metrics[key] = {"count": 0,
+                                 "latency_sum": 0.0,
+                                 "buckets": [0] * len(LATENCY_BUCKETS),
+                                 "statuses": {},
+                                 "errors": {},
+                                 "bytes": 0}
+    return endpoint_metrics[key]
+
+
+def observe(endpoint, call_type, elapsed, status=None, size=0, error=None):
+    """Record a finished HTTP call.
+
+    Pass the status code and response size for responses
+    or an error name for calls without a response.
+    """
+    with metrics_lock:
+        metrics = _get_metrics(endpoint, call_type)
+        metrics["count"] += 1
+        metrics["latency_sum"] += elapsed
+        for i, upper_bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= upper_bound:
+                metrics["buckets"][i] += 1
+                break
+        if status is not None:
+            metrics["statuses"][status] = metrics["statuses"].get(status, 0) + 1
+        if error is not None:
+            metrics["errors"][error] = metrics["errors"].get(error, 0) + 1
+        metrics["bytes"] += size
+
+
+def count_error(endpoint, call_type, error):
+    """Record a call that was not sent, e.g. due to an open circuit."""
+    with metrics_lock:
+        metrics = _get_metrics(endpoint, call_type)
+        metrics["errors"][error] = metrics["errors"].get(error, 0) + 1
+
+
+def get_metrics() -> dict:
+    """Return a copy of the metrics keyed by (endpoint, call type)."""
+    with metrics_lock:
+        return {key: {**metrics,
+                      "buckets": list(metrics["buckets"]),
+                      "statuses": dict(metrics["statuses"]),
+                      "errors": dict(metrics["errors"])}
+                for key, metrics in endpoint_metrics.items()}
+
+
+def get_latency_quantile(metrics, quantile) -> float:
+    """Return the bucket upper bound containing the given quantile."""
+    if not metrics["count"]:
+        return 0.0
+    rank = quantile * metrics["count"]
+    cumulative = 0
+    for upper_bound, count in zip(LATENCY_BUCKETS, metrics["buckets"]):
+        cumulative += count
+        if cumulative >= rank:
+            return upper_bound
+    return LATENCY_BUCKETS[-1]
+
+
+def escape_label(value):
+    """Return a label value escaped for the Prometheus text format."""
+    return (str(value).replace("\\", "\\\\")
+            .replace('"', '\\"').replace("\n", "\\n"))
+
+
+def format_prometheus() -> str:
+    """Return all metrics in the Prometheus text exposition format."""
+    metrics_items = sorted(get_metrics().items())
+    lines = [f"# HELP {METRIC_PREFIX}_request_duration_seconds "
+             "Latency of HTTP calls to external APIs.",
+             f"# TYPE {METRIC_PREFIX}_request_duration_seconds histogram"]
+    for (endpoint, call_type), metrics in metrics_items:
+        labels = (f'endpoint="{escape_label(endpoint)}",'
+                  f'call_type="{escape_label(call_type)}"')
+        cumulative = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS, metrics["buckets"]):
+            cumulative += count
+            bound = "+Inf" if upper_bound == float("inf") else f"{upper_bound:g}"
+            lines.append(f"{METRIC_PREFIX}_request_duration_seconds_bucket"
+                         f'{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{METRIC_PREFIX}_request_duration_seconds_sum"
+                     f"{{{labels}}} {metrics['latency_sum']:.6f}")
+        lines.append(f"{METRIC_PREFIX}_request_duration_seconds_count"
+                     f"{{{labels}}} {metrics['count']}")
+    counters = [("responses_total", "HTTP responses per status code.",
+                 "statuses", "status"),
+                ("errors_total", "HTTP calls failed without a response.",
+                 "errors", "error")]
+    for name, description, field, label_name in counters:
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {description}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+        for (endpoint, call_type), metrics in metrics_items:
+            for value, count in sorted(metrics[field].items()):
+                lines.append(f"{METRIC_PREFIX}_{name}"
+                             f'{{endpoint="{escape_label(endpoint)}",'
+                             f'call_type="{escape_label(call_type)}",'
+                             f'{label_name}="{escape_label(value)}"}} {count}')
+    lines.append(f"# HELP {METRIC_PREFIX}_response_bytes_total "
+                 "Bytes received in HTTP responses.")
+    lines.append(f"# TYPE {METRIC_PREFIX}_response_bytes_total counter")
+    for (endpoint, call_type), metrics in metrics_items:
+        lines.append(f"{METRIC_PREFIX}_response_bytes_total"
+                     f'{{endpoint="{escape_label(endpoint)}",'
+                     f'call_type="{escape_label(call_type)}"}} '
+                     f"{metrics['bytes']}")
+    return "\n".join(lines) + "\n"
+
+
+def export_textfile(path=None):
+    """Write the metrics to a '.prom' file and return its path.
+
+    The file is replaced atomically, so the node exporter
+    never reads a partially written file.
+    Return None if no path is given or configured.
+    """
+    path = path or TEXTFILE_PATH
+    if not path:
+        return None
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, "w", encoding="utf-8") as file_obj:
+        file_obj.write(format_prometheus())
+    os.replace(temp_path, path)
+    return path
+
+
+def reset():
+    """Forget all collected metrics."""
+    with metrics_lock:
+        endpoint_metrics.clear()
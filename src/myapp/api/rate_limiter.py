@@ -0,0 +1,160 @@
+"""Provide client-side rate limiting and request coalescing for APIs.
+
+Main features:
+- token bucket to throttle the number of requests per second
+- daily request quota with a counter persisted to a JSON file
+- single-flight coalescing, so identical requests share one call
+"""
+import json
+import threading
+import time
+from datetime import date
+
+
+class QuotaExceededError(BaseException):
+    """Raised when the daily request quota has been used up."""
+
+
+class TokenBucket:
+    """Throttle calls to a steady rate while allowing short bursts.
+
+    The bucket holds up to 'capacity' tokens and is refilled
+    with 'rate' tokens per second.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        """Add the tokens accumulated since the last refill."""
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Block until a token is available and consume it."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class DailyQuota:
+    """Count requests per calendar day and persist the counter,
+    so the quota survives restarts of the program.
+    """
+
+    def __init__(self, limit, file_path):
+        self.limit = limit
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.day, self.count = self._load()
+
+    def _load(self):
+        """Return day and count stored in the quota file."""
+        today = date.today().isoformat()
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as file_obj:
+                data = json.load(file_obj)
+        except (OSError, ValueError):
+            return today, 0
+        if data.get("day") != today:
+            return today, 0
+        return today, int(data.get("count", 0))
+
+    def _save(self):
+        """Write day and count to the quota file."""
+        with open(self.file_path, "w", encoding="utf-8") as file_obj:
+            json.dump({"day": self.day, "count": self.count}, file_obj)
+
+    def _reset_on_new_day(self):
+        """Start counting from zero when the day has changed."""
+        today = date.today().isoformat()
+        if self.day != today:
+            self.day = today
+            self.count = 0
+
+    def consume(self):
+        """Count one request or raise QuotaExceededError
+        if the limit for today has been reached.
+        """
+        with self.lock:
+            self._reset_on_new_day()
+            if self.count >= self.limit:
+                raise QuotaExceededError
+            self.count += 1
+            self._save()
+
+    def usage(self) -> tuple[int, int]:
+        """Return the number of requests used today and the limit."""
+        with self.lock:
+            self._reset_on_new_day()
+            return self.count, self.limit
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one call.
+
+    Callers arriving while a call is in flight wait for its result.
+    Successful results are kept for 'ttl' seconds, so repeated
+    lookups shortly after each other don't trigger a new call.
+    """
+
+    def __init__(self, ttl=0):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.results = {}
+
+    def do(self, key, func, is_cacheable=bool):
+        """Return the result of func() shared by all callers of key."""
+        with self.lock:
+            cached = self.results.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+            call = self.in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self.in_flight[key] = call
+        if not is_leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+        try:
+            call["result"] = func()
+        except BaseException as error:
+            call["error"] = error
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if (self.ttl and call["error"] is None
+                        and is_cacheable(call["result"])):
+                    self._prune_expired()
+                    self.results[key] = (time.monotonic(), call["result"])
+            call["done"].set()
+        return call["result"]
+
+    def _prune_expired(self):
+        """Drop results older than the time to live."""
+        now = time.monotonic()
+        expired = [key for key, (stored_at, _) in self.results.items()
+                   if now - stored_at >= self.ttl]
+        for key in expired:
+            del self.results[key]
+
+    def clear(self):
+        """Forget all cached results."""
+        with self.lock:
+            self.results.clear()
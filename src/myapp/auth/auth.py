@@ -1,23 +1,112 @@
 """Provide user authentication."""
+import os
+import time
+
 import bcrypt
 
-from myapp.models.data_processing import get_user
+from myapp.models.data_processing import get_user, update_password_hash
+
+# bcrypt cost factor between 4 and 31: hashing takes 2**rounds
+# iterations (environment variable 'MYAPP_BCRYPT_ROUNDS',
+# see calibrate_rounds)
+DEFAULT_BCRYPT_ROUNDS = 12
+MIN_BCRYPT_ROUNDS = 4
+MAX_BCRYPT_ROUNDS = 31
+DEFAULT_TARGET_MS = 250
+CALIBRATION_PASSWORD = b"calibration password"
+
+
+def get_configured_rounds() -> int:
+    """Return the cost factor set by 'MYAPP_BCRYPT_ROUNDS' or the default.
+
+    Raise ValueError if it isn't an integer between MIN_BCRYPT_ROUNDS
+    and MAX_BCRYPT_ROUNDS.
+    """
+    value = os.environ.get("MYAPP_BCRYPT_ROUNDS", DEFAULT_BCRYPT_ROUNDS)
+    try:
+        rounds = int(value)
+    except ValueError:
+        rounds = None
+    if rounds is None or not MIN_BCRYPT_ROUNDS <= rounds <= MAX_BCRYPT_ROUNDS:
+        raise ValueError(f"MYAPP_BCRYPT_ROUNDS must be an integer between "
+                         f"{MIN_BCRYPT_ROUNDS} and {MAX_BCRYPT_ROUNDS}, "
+                         f"got {value!r}.")
+    return rounds
 
 
-def hash_password(password):
-    """Return a hashed password as byte decoded string."""
+BCRYPT_ROUNDS = get_configured_rounds()
+
+
+def hash_password(password, rounds=None):
+    """Return a hashed password as byte decoded string.
+
+    Use the configured cost factor unless rounds are given.
+    """
     pw_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(pw_bytes, salt)
     return hashed_password.decode("utf-8")
 
 
+def get_hash_rounds(password_hash) -> int | None:
+    """Return the cost factor of a bcrypt hash ('$2b$<rounds>$...')."""
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash) -> bool:
+    """Return True if the hash doesn't use the configured cost factor."""
+    return get_hash_rounds(password_hash) != BCRYPT_ROUNDS
+
+
 def authenticate_user(user_name, password):
     """Return True if user could be authenticated
-    against credentials stored in the database."""
+    against credentials stored in the database.
+
+    Rehash the password with the configured cost factor
+    if the stored hash uses a different one.
+    """
     user_obj = get_user(user_name)
-    return bcrypt.checkpw(password.encode("utf-8"),
-                          user_obj["password_hash"].encode("utf-8"))
+    if user_obj is None or not user_obj["password_hash"]:
+        return False
+    password_hash = user_obj["password_hash"]
+    if not bcrypt.checkpw(password.encode("utf-8"),
+                          password_hash.encode("utf-8")):
+        return False
+    if needs_rehash(password_hash):
+        update_password_hash(user_obj["id"], hash_password(password))
+    return True
+
+
+def measure_hash_time(rounds) -> float:
+    """Return the seconds needed to hash a password with the cost factor."""
+    salt = bcrypt.gensalt(rounds=rounds)
+    start = time.perf_counter()
+    bcrypt.hashpw(CALIBRATION_PASSWORD, salt)
+    return time.perf_counter() - start
+
+
+def calibrate_rounds(target_ms=DEFAULT_TARGET_MS) -> tuple[int, dict]:
+    """Return the highest cost factor hashing within target_ms
+    on this host and the measured milliseconds per cost factor.
+
+    Every additional round doubles the time, so measuring stops
+    at the first cost factor exceeding the target.
+    """
+    timings = {}
+    rounds = MIN_BCRYPT_ROUNDS
+    for rounds_to_try in range(MIN_BCRYPT_ROUNDS, MAX_BCRYPT_ROUNDS + 1):
+        # Take the fastest of a few runs for the cheap cost factors.
+        runs = 3 if rounds_to_try < 10 else 1
+        elapsed_ms = min(measure_hash_time(rounds_to_try)
+                         for _ in range(runs)) * 1000
+        timings[rounds_to_try] = round(elapsed_ms, 1)
+        if elapsed_ms > target_ms:
+            break
+        rounds = rounds_to_try
+    return rounds, timings
 
 
 def main():
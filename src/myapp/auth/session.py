@@ -0,0 +1,239 @@
+"""Provide signed session tokens for logged in users.
+
+After a successful password check the CLI stores a session token for
+the user and the current terminal, so switching back to that user in
+the same terminal is verified with an HMAC instead of bcrypt.
+
+Tokens look like '<payload>.<signature>', both base64url encoded:
+the payload holds user id, session id, issue and expiry time, the
+signature is an HMAC-SHA256 of the payload with a secret key. The key
+is read from 'MYAPP_SESSION_SECRET' or created once in 'data/'.
+
+Tokens are stored in 'data/sessions.json' together with the session
+ids revoked by logging out. CLI processes in several terminals share
+the file; it is read, modified and written under an exclusive lock on
+'data/sessions.lock' (where fcntl is available), so a logout can't be
+overwritten by a login in another terminal.
+"""
+import base64
+import getpass
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sessions are only locked per process
+    fcntl = None
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+# Seconds a session stays valid (0 disables sessions)
+SESSION_TTL = int(os.environ.get("MYAPP_SESSION_TTL", 3600))
+SESSIONS_FILE_PATH = Path(os.environ.get("MYAPP_SESSIONS_FILE")
+                          or PROJECT_ROOT / "data" / "sessions.json").resolve()
+SECRET_FILE_PATH = SESSIONS_FILE_PATH.with_name("session_secret")
+LOCK_FILE_PATH = SESSIONS_FILE_PATH.with_suffix(".lock")
+SECRET_SIZE = 32
+
+_secret = None
+_store_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------
+# TOKENS
+# ---------------------------------------------------------------------
+def get_secret() -> bytes:
+    """Return the signing key, creating the key file on first use."""
+    global _secret
+    if _secret is None:
+        configured = os.environ.get("MYAPP_SESSION_SECRET")
+        if configured:
+            _secret = configured.encode("utf-8")
+        else:
+            _secret = load_or_create_secret(SECRET_FILE_PATH)
+    return _secret
+
+
+def load_or_create_secret(file_path) -> bytes:
+    """Return the key stored in the file or a new one saved to it."""
+    try:
+        with open(file_path, "rb") as file_obj:
+            secret = file_obj.read()
+        if len(secret) >= SECRET_SIZE:
+            return secret
+    except OSError:
+        pass
+    secret = secrets.token_bytes(SECRET_SIZE)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    # Readable by the owner only
+    file_descriptor = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                              0o600)
+    with os.fdopen(file_descriptor, "wb") as file_obj:
+        file_obj.write(secret)
+    return secret
+
+
+def encode(data) -> str:
+    """Return bytes as unpadded base64url string."""
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def decode(text) -> bytes:
+    """Return the bytes of an unpadded base64url string."""
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign(payload) -> str:
+    """Return the signature of the encoded payload."""
+    digest = hmac.new(get_secret(), payload.encode("ascii"), hashlib.sha256)
+    return encode(digest.digest())
+
+
+def issue_token(user_id, ttl=None) -> str:
+    """Return a new signed token for the user."""
+    now = time.time()
+    claims = {"uid": user_id,
+              "sid": secrets.token_hex(8),
+              "iat": round(now, 3),
+              "exp": int(now) + (ttl or SESSION_TTL)}
+    payload = encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{sign(payload)}"
+
+
+def read_token(token) -> dict | None:
+    """Return the claims of a token with a valid signature
+    that hasn't expired, else None.
+
+    Revocation is checked by validate_token.
+    """
+    try:
+        payload, signature = token.split(".")
+    except (AttributeError, ValueError):
+        return None
+    if not hmac.compare_digest(sign(payload), signature):
+        return None
+    try:
+        claims = json.loads(decode(payload))
+    except ValueError:
+        return None
+    if claims["exp"] <= time.time():
+        return None
+    return claims
+
+
+def validate_token(token, store=None) -> dict | None:
+    """Return the claims of a valid, unrevoked token, else None."""
+    claims = read_token(token)
+    if claims is None:
+        return None
+    if store is None:
+        store = load_store()
+    if claims["sid"] in store["revoked"]:
+        return None
+    return claims
+
+
+# ---------------------------------------------------------------------
+# SESSION STORE
+# ---------------------------------------------------------------------
+def get_terminal_id() -> str:
+    """Return an id for the current OS user and terminal."""
+    try:
+        terminal = os.ttyname(sys.stdin.fileno())
+    except (OSError, AttributeError, ValueError):
+        terminal = os.environ.get("MYAPP_TERMINAL_ID", "no-tty")
+    return f"{getpass.getuser()}@{terminal}"
+
+
+def load_store() -> dict:
+    """Return the stored sessions and revocations."""
+    try:
+        with open(SESSIONS_FILE_PATH, "r", encoding="utf-8") as file_obj:
+            store = json.load(file_obj)
+    except (OSError, ValueError):
+        store = {}
+    for key in ("terminals", "revoked"):
+        store.setdefault(key, {})
+    return store
+
+
+@contextmanager
+def locked_store():
+    """Yield the store and save it at the end of the block, holding
+    a lock against other threads and processes in between.
+    """
+    with _store_lock:
+        LOCK_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor = os.open(LOCK_FILE_PATH, os.O_RDWR | os.O_CREAT,
+                                  0o600)
+        try:
+            if fcntl is not None:
+                fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+            store = load_store()
+            yield store
+            save_store(store)
+        finally:
+            # Closing the file releases the lock.
+            os.close(file_descriptor)
+
+
+def save_store(store):
+    """Write the store, dropping expired entries."""
+    now = time.time()
+    store["revoked"] = {sid: expiry for sid, expiry in store["revoked"].items()
+                        if expiry > now}
+    for tokens in store["terminals"].values():
+        for user_name in [user_name for user_name, token in tokens.items()
+                          if read_token(token) is None]:
+            del tokens[user_name]
+    store["terminals"] = {terminal: tokens
+                          for terminal, tokens in store["terminals"].items()
+                          if tokens}
+    SESSIONS_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = SESSIONS_FILE_PATH.with_suffix(".tmp")
+    file_descriptor = os.open(temporary_path,
+                              os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(file_descriptor, "w", encoding="utf-8") as file_obj:
+        json.dump(store, file_obj)
+    os.replace(temporary_path, SESSIONS_FILE_PATH)
+
+
+def start_session(user_id, user_name) -> str | None:
+    """Store a new token for the user in this terminal and return it."""
+    if SESSION_TTL <= 0:
+        return None
+    token = issue_token(user_id)
+    with locked_store() as store:
+        store["terminals"].setdefault(get_terminal_id(), {})[user_name] = token
+    return token
+
+
+def resume_session(user_id, user_name) -> dict | None:
+    """Return the claims of the user's valid session in this terminal."""
+    if SESSION_TTL <= 0:
+        return None
+    store = load_store()
+    token = store["terminals"].get(get_terminal_id(), {}).get(user_name)
+    if token is None:
+        return None
+    claims = validate_token(token, store)
+    if claims is None or claims["uid"] != user_id:
+        return None
+    return claims
+
+
+def end_session(user_name):
+    """Revoke and forget the user's session in this terminal."""
+    with locked_store() as store:
+        token = store["terminals"].get(get_terminal_id(), {}).pop(user_name,
+                                                                  None)
+        claims = read_token(token) if token else None
+        if claims is not None:
+            store["revoked"][claims["sid"]] = claims["exp"]
@@ -1,13 +1,17 @@
 """Provide CLI menu and user interaction dialogues."""
-import random
+import os
+import sys
 import difflib
 import statistics
-from datetime import date
+from datetime import date, datetime
 
 from sqlalchemy.exc import SQLAlchemyError
 from requests import exceptions as requests_exceptions
 
 from myapp.models import data_processing
+from myapp.models import columnar
+from myapp.models import random_pick
+from myapp.models import recommender
 from myapp.cli.cli_style import (cprint_default,
                                  cprint_info,
                                  cprint_error,
@@ -18,10 +22,18 @@ from myapp.cli.cli_style import (cprint_default,
                                  cprompt_pw,
                                  clear_screen)
 from myapp.api import api_client as api
+from myapp.api import metrics as api_metrics
 from myapp.auth import auth
+from myapp.auth import session
+from myapp.db import query_stats
+from myapp.db import statements
+from myapp.cli import profiling
+from myapp.cli import pager
 from myapp.web.render_user_page import render_webpage
 
 DEFAULT_USER_ID = 1
+# Show long lists page by page (disable with 'MYAPP_PAGER=0')
+PAGER_ENABLED = os.environ.get("MYAPP_PAGER", "1") != "0"
 current_user_id = DEFAULT_USER_ID
 
 MENU_ENTRIES = [
@@ -37,11 +49,14 @@ MENU_ENTRIES = [
     " 9. Sort movies by year",
     "10. Filter movies",
     "11. Generate website",
-    "12. Log in / Switch user"
+    "12. Log in / Switch user",
+    "13. Diagnostics",
+    "14. Log out",
+    "15. Recommendations"
 ]
 
-MENU_INDICES_ON_NO_DATA = {0, 2, 12}
-MENU_INDICES_ON_NO_USER = {0, 12}
+MENU_INDICES_ON_NO_DATA = {0, 2, 12, 13, 14}
+MENU_INDICES_ON_NO_USER = {0, 12, 13}
 ALL_MENU_INDICES = set(range(len(MENU_ENTRIES)))
 DEACTIVATED_MENU_INDICES_ON_NO_DATA = ALL_MENU_INDICES - MENU_INDICES_ON_NO_DATA
 DEACTIVATED_MENU_INDICES_ON_NO_USER = ALL_MENU_INDICES - MENU_INDICES_ON_NO_USER
@@ -86,7 +101,8 @@ def show_menu(active="0"):
     # Display the heading always with the menu.
     cprint_default("********** My Movies Database **********")
     cprint_default("Currently logged in: ", end="")
-    cprint_output(f"{current_username}\n")
+    cprint_output(f"{current_username}")
+    show_omdb_quota_usage()
     cprint_default("Menu:")
     # Build the menu entries from a list of menu items.
     for i, entry in enumerate(MENU_ENTRIES):
@@ -105,6 +121,20 @@ def show_menu(active="0"):
             cprint_default(entry)
 
 
+def show_omdb_quota_usage():
+    """Display the number of OMDB requests used today."""
+    used, limit = api.get_omdb_quota_usage()
+    cprint_default("OMDB requests today: ", end="")
+    if used >= limit:
+        cprint_error(f"{used}/{limit}")
+    else:
+        cprint_output(f"{used}/{limit}")
+    if not api.is_omdb_available():
+        cprint_error(f"OMDB is unavailable, retrying in "
+                     f"{api.get_omdb_retry_in():.0f}s.")
+    print()
+
+
 def update_dispatch_table_and_choices_str(indices:set) -> tuple[dict, str]:
     """Return updated dispatch table and choices string
     for the given indices.
@@ -402,13 +432,42 @@ def list_api_search_results(search_term: str) -> tuple[str, dict]:
     return output, dispatch_table
 
 
+def list_catalog_search_results(search_term: str) -> tuple[str, dict]:
+    """Return movies rated by any user matching the search term
+    as a formatted string and a dispatch table to allow user to select.
+    """
+    dispatch_table = {}
+    output = ""
+    data = data_processing.get_movies()
+    movies_dict = get_imdb_ids_with_title(data)
+    matches = {imdb_id: title for imdb_id, title in movies_dict.items()
+               if search_term.lower() in title.lower()}
+    if not matches:
+        matches = sequence_matcher(search_term, movies_dict, 4, 0.3)
+    for i, imdb_id in enumerate(matches, start=1):
+        movie = data[imdb_id]
+        title = movie["title"]
+        year = movie["year"]
+        emojis = " ".join(
+            data_processing.get_country_emojis_for_movie(movie["movie_id"]))
+        dispatch_table[str(i)] = (imdb_id, title)
+        output += (f"\n{i:>3}: {title} ({year}) - {emojis}")
+    return output, dispatch_table
+
+
 def select_movie_from_api_or_db(search_term=None, source="api"):
     """Return imdb_id and title or id and title for a specific movie
     selected from a list of movies retrieved via API / DB.
+
+    Use source 'catalog' to search all movies in the database
+    instead of the movies rated by the current user.
     """
     if source == "api":
         message = f"\nMovies matching search term '{search_term}':"
         results = list_api_search_results(search_term)
+    elif source == "catalog":
+        message = f"\nMovies in the database matching '{search_term}':"
+        results = list_catalog_search_results(search_term)
     else:
         message = "\nMovies matching your search:"
         imdb_ids = list(fuzzy_search_movie_in_db(search_term))
@@ -433,9 +492,31 @@ def select_movie_from_api_or_db(search_term=None, source="api"):
             cprint_info(f"Online search couldn't "
                         f"find any movies matching '{search_term}'.")
             raise NoMoviesFoundError
+        if source == "catalog":
+            cprint_info(f"The database doesn't contain "
+                        f"any movies matching '{search_term}'.")
+            raise NoMoviesFoundError
     return (False, False)
 
 
+def select_movie_for_rating(search_term):
+    """Return imdb_id and title for a movie selected from the API search.
+
+    Fall back to searching the movies in the database
+    while the OMDB API is unavailable.
+    """
+    if api.is_omdb_available():
+        try:
+            return select_movie_from_api_or_db(search_term)
+        except (api.CircuitOpenError,
+                requests_exceptions.Timeout,
+                requests_exceptions.ConnectionError):
+            pass
+    cprint_error("The OMDB API is currently unavailable.")
+    cprint_info("Searching the movies already in the database instead...")
+    return select_movie_from_api_or_db(search_term, source="catalog")
+
+
 def get_movie_details_from_api(imdb_id):
     """Return movie object for the given imdbID."""
     movie_object_raw = api.fetch_movie_details(imdb_id)
@@ -524,6 +605,15 @@ def login_or_switch_user():
             should_create_new_user = True
         else:
             raise CancelDialog
+    else:
+        # Skip the password for a valid session in this terminal.
+        user_id = data_processing.get_user(username)["id"]
+        claims = session.resume_session(user_id, username)
+        if claims:
+            current_user_id = user_id
+            expires = datetime.fromtimestamp(claims["exp"]).strftime("%H:%M")
+            cprint_info(f"Welcome back! Your session is valid until {expires}.")
+            return True
     # -----------------------------------------------------------------
     # Prompt for password and add or authenticate user
     while True:
@@ -537,10 +627,12 @@ def login_or_switch_user():
     if should_create_new_user:
         hashed_password = auth.hash_password(password)
         current_user_id = data_processing.add_user(username, hashed_password)
+        session.start_session(current_user_id, username)
         cprint_info(f"New user '{username}' has been added and logged in.")
         return True
     if auth.authenticate_user(username, password):
         current_user_id = data_processing.get_user(username)["id"]
+        session.start_session(current_user_id, username)
         cprint_info("You were successfully authenticated and logged in.")
         return True
     cprint_error("Authentication failed for the provided credentials!")
@@ -553,26 +645,87 @@ def format_movie_entry(title, year, rating, emojis):
     return f"{title} ({year}) - {rating:.1f} - {emojis_str}"
 
 
-def list_movies(*data, nested_call=False):
-    """Show all the movies in the database with their details.
+def print_movies(movies, emojis=None):
+    """Print the movies with their details.
+
+    Country emojis for all movies are retrieved with one query
+    unless they are passed as a dictionary by movie id.
+    """
+    if emojis is None:
+        emojis = data_processing.get_country_emojis_for_movies(
+            [movie.movie_id for movie in movies.values()])
+    for movie in movies.values():
+        cprint_output(format_movie_entry(movie.title,
+                                         movie.year,
+                                         movie.rating,
+                                         emojis[movie.movie_id]))
+
+
+def is_pager_enabled():
+    """Return True if long lists are shown page by page."""
+    return PAGER_ENABLED and sys.stdout.isatty()
+
+
+def show_movies(order_by=None, descending=False, total=None, **filters):
+    """Show the user's movies matching the filters in the given order.
 
-    The function can also be called by the sort or search function.
+    Use the pager if the movies don't fit on one page.
     """
+    if total is None and is_pager_enabled():
+        total = data_processing.count_movies(current_user_id, **filters)
+    if total is None or total <= pager.PAGE_SIZE or not is_pager_enabled():
+        print_movies(data_processing.find_movies(current_user_id,
+                                                 order_by,
+                                                 descending,
+                                                 **filters))
+        return
+    movie_pager = pager.MoviePager(current_user_id, total, order_by,
+                                   descending, **filters)
+    try:
+        page_through_movies(movie_pager)
+    finally:
+        movie_pager.close()
+
+
+def page_through_movies(movie_pager):
+    """Show the pages of the pager until the user quits."""
+    page = 0
+    while True:
+        movies, emojis = movie_pager.get_page(page)
+        print()
+        print_movies(movies, emojis)
+        page = ask_for_page(page, movie_pager.page_count)
+        if page is None:
+            return
+
+
+def ask_for_page(page, page_count):
+    """Ask the user for the page to show next and return its index
+    or None if the user wants to quit.
+    """
+    while True:
+        prompt = (f"\nPage {page + 1}/{page_count} - [Enter] next, "
+                  f"[p] previous, [1-{page_count}] jump, [q] quit: ")
+        choice = cprompt(prompt).lower()
+        if choice in ("q", ".."):
+            return None
+        if choice in ("", "n"):
+            if page + 1 < page_count:
+                return page + 1
+            return None
+        if choice == "p":
+            return max(page - 1, 0)
+        if choice.isdigit() and 1 <= int(choice) <= page_count:
+            return int(choice) - 1
+        cprint_error("Invalid input")
+
+
+def list_movies():
+    """Show all the movies in the database with their details."""
     print()
-    if not nested_call:
-        data = data_processing.get_movies(current_user_id)
-        cprint_output(f"{len(data)} movies in total:\n")
-    else:
-        # Because we passed the data as an optional argument...
-        # ...we need to unpack tuple of one element.
-        data = data[0]
-    for _, details in data.items():
-        movie_id = details["movie_id"]
-        title = details["title"]
-        year = details["year"]
-        rating = details["rating"]
-        emojis = data_processing.get_country_emojis_for_movie(movie_id)
-        cprint_output(f"{format_movie_entry(title, year, rating, emojis)}")
+    total = data_processing.count_movies(current_user_id)
+    cprint_output(f"{total} movies in total:\n")
+    show_movies(total=total)
 
 
 def add_movie_rating():
@@ -585,7 +738,7 @@ def add_movie_rating():
     # -----------------------------------------------------------------
     # Dynamically retrieve movie suggestions
     # for the given title via API
-    selected_movie = select_movie_from_api_or_db(movie_title)
+    selected_movie = select_movie_for_rating(movie_title)
     imdb_id, movie_title = selected_movie
     # -----------------------------------------------------------------
     # Check if current user already rated the movie.
@@ -615,22 +768,18 @@ def add_movie_rating():
         imdb_rating = movie_obj["imdb_rating"]
         countries = movie_obj["country"]
         cprint_info("Movie details complete. Adding movie to database...")
-        # Add movie to the database.
-        movie_id = data_processing.add_movie(imdb_id,
-                                             movie_title,
-                                             year,
-                                             image_url,
-                                             imdb_rating)
-        cprint_info(f"Successfully added '{movie_title}'. (ID: {movie_id})")
-        # Finally add new country objects to the database...
-        # ...and create movie-country relationships.
-        cprint_info("Processing country details...")
-        for country in countries:
-            add_country_if_new(country)
-            country_id = data_processing.get_country_by_name(country)["id"]
-            data_processing.add_movie_country_relationship(movie_id, country_id)
-            cprint_info(f"Successfully created movie-country "
-                        f"relationship for '{country}'.")
+        # Add the movie, new countries and the movie-country
+        # relationships in one transaction, so a failure doesn't
+        # leave a movie without countries.
+        movie_id = data_processing.add_movie_with_countries(imdb_id,
+                                                            movie_title,
+                                                            year,
+                                                            image_url,
+                                                            imdb_rating,
+                                                            countries)
+        cprint_info(f"Successfully added '{movie_title}' with "
+                    f"{len(countries)} country relationship(s). "
+                    f"(ID: {movie_id})")
     # -----------------------------------------------------------------
     # Finally ask for rating / note and store it in the database.
     rating = ask_for_rating()
@@ -644,25 +793,6 @@ def add_movie_rating():
     return True
 
 
-def add_country_if_new(country_name):
-    """Add the given country object to the database
-    and return its id.
-    """
-    country_object = data_processing.get_country_by_name(country_name)
-    country_id = country_object["id"]
-    # Only new countries receive a temporary id (-1)
-    # should be added to the database.
-    if country_id == -1:
-        cprint_info("Adding country data to database...")
-        name = country_object["name"]
-        code = country_object["code"]
-        country_id = data_processing.add_country(name, code)
-        cprint_info(f"Successfully added country data for"
-                    f" '{name}'. (ID: {country_id})")
-        return country_id
-    return False
-
-
 def delete_movie_rating():
     """Delete a movie's rating from the database."""
     imdb_id, movie_title = select_movie_from_api_or_db(source="db")
@@ -754,12 +884,20 @@ def get_movie_stats():
     best and worst movies.
     """
     # Get the data
-    data = data_processing.get_movies(current_user_id)
-    ratings = get_ratings(data)
-    average_rating = get_average_rating(ratings)
-    median_rating = get_median_rating(ratings)
-    best_movies = get_best_or_worst_movies(data)
-    worst_movies = get_best_or_worst_movies(data, get_best=False)
+    if columnar.is_available():
+        snapshot = columnar.get_snapshot(current_user_id)
+        data = snapshot.movies
+        average_rating = round(snapshot.average_rating(), 1)
+        median_rating = round(snapshot.median_rating(), 1)
+        best_movies = snapshot.best_or_worst_movies()
+        worst_movies = snapshot.best_or_worst_movies(get_best=False)
+    else:
+        data = data_processing.get_movies(current_user_id)
+        ratings = get_ratings(data)
+        average_rating = get_average_rating(ratings)
+        median_rating = get_median_rating(ratings)
+        best_movies = get_best_or_worst_movies(data)
+        worst_movies = get_best_or_worst_movies(data, get_best=False)
     # Show stats...
     cprint_output(f"\nAverage rating: {average_rating}")
     cprint_output(f"Median rating: {median_rating}")
@@ -787,17 +925,16 @@ def get_movie_stats():
 
 
 def get_random_movie():
-    """Show the details for a random movie."""
-    data = data_processing.get_movies(current_user_id)
-    imdb_ids = get_imdb_ids(data)
-    random_imdb_id = random.choice(imdb_ids)
-    random_title = data[random_imdb_id]["title"]
-    rating = data[random_imdb_id]["rating"]
-    year = data[random_imdb_id]["year"]
-    movie_id = data[random_imdb_id]["movie_id"]
-    emojis = " ".join(data_processing.get_country_emojis_for_movie(movie_id))
+    """Show the details for a random movie not picked recently."""
+    movies = random_pick.pick_movies(current_user_id)
+    if not movies:
+        cprint_info("\nThere are no movies to pick from yet.")
+        return
+    movie = movies[0]
+    emojis = " ".join(data_processing.get_country_emojis_for_movie(
+        movie.movie_id))
     cprint_output(f"\nYour movie for tonight: "
-          f"{random_title} ({year}) - {emojis}, it's rated {rating}")
+          f"{movie.title} ({movie.year}) - {emojis}, it's rated {movie.rating}")
 
 
 def search_movie():
@@ -809,22 +946,12 @@ def search_movie():
     If movie's title could not be found,
     display suggestions received by fuzzy search.
     """
-    data = data_processing.get_movies(current_user_id)
     search_term = ask_for_name_part()
-    found = False
-    for imdb_id, details in data.items():
-        movie_id = details["movie_id"]
-        title = details["title"]
-        year = details["year"]
-        rating = details["rating"]
-        emojis = data_processing.get_country_emojis_for_movie(movie_id)
-        if search_term.lower() in title.lower():
-            cprint_output(f"{format_movie_entry(title,
-                                                year,
-                                                rating,
-                                                emojis)}")
-            found = True
-    if not found:
+    found = data_processing.count_movies(current_user_id, title=search_term)
+    if found:
+        show_movies(total=found, title=search_term)
+    else:
+        data = data_processing.get_movies(current_user_id)
         # suggest titles by fuzzy search
         cprint_info(f"A movie containing '{search_term}' could not be found.")
         # look for alternatives using fuzzy search
@@ -833,23 +960,14 @@ def search_movie():
         # show only if fuzzy search finds alternatives
         if len(suggestions) != 0:
             cprint_output("\nDid you mean:\n")
-            for imdb_id, title in suggestions.items():
-                movie_id = data[imdb_id]["movie_id"]
-                title = data[imdb_id]["title"]
-                year = data[imdb_id]["year"]
-                rating = data[imdb_id]["rating"]
-                emojis = data_processing.get_country_emojis_for_movie(movie_id)
-                cprint_output(format_movie_entry(title, year, rating, emojis))
+            print_movies({imdb_id: data[imdb_id] for imdb_id in suggestions})
     return True
 
 
 def sort_movies_by_rating():
     """Sort movies in descending order by their rating."""
-    data = data_processing.get_movies(current_user_id)
-    movies_sorted = dict(sorted(data.items(),
-                           key=lambda item: item[1]["rating"],
-                           reverse=True))
-    list_movies(movies_sorted, nested_call=True)
+    print()
+    show_movies(order_by="rating", descending=True)
 
 
 def sort_movies_by_year():
@@ -860,24 +978,8 @@ def sort_movies_by_year():
     """
     sort_order = ask_for_sort_order()
     is_reverse = bool(sort_order == "first")
-    data = data_processing.get_movies(current_user_id)
-    movies_sorted = dict(sorted(data.items(),
-                           key=lambda item: item[1]["year"],
-                           reverse=is_reverse))
-    list_movies(movies_sorted, nested_call=True)
-
-
-def apply_filter(pair, *args):
-    """Return True if all filter conditions are met."""
-    _, value = pair
-    year_start, year_end, rating_threshold = args
-    if rating_threshold and value["rating"] < rating_threshold:
-        return False
-    if year_start is not None and value["year"] < year_start:
-        return False
-    if year_end is not None and value["year"] > year_end:
-        return False
-    return True
+    print()
+    show_movies(order_by="year", descending=is_reverse)
 
 
 def filter_movies():
@@ -893,19 +995,35 @@ def filter_movies():
     year_end = ask_for_year(
         allow_blank=True,
         prompt="Enter end year (leave blank for no end year): ")
-    data = data_processing.get_movies(current_user_id)
-    filtered_movies = dict(filter(
-        lambda movie: apply_filter(
-            movie,
-            year_start,
-            year_end,
-            rating_threshold), data.items()))
     cprint_output("\nFiltered Movies:")
+    print()
     # sort movies by year (descending)
-    filtered_movies_sorted = dict(sorted(filtered_movies.items(),
-                                         key=lambda item: item[1]["year"],
-                                         reverse=True))
-    list_movies(filtered_movies_sorted, nested_call=True)
+    show_movies(order_by="year",
+                descending=True,
+                min_rating=rating_threshold or None,
+                year_start=year_start,
+                year_end=year_end)
+
+
+def show_recommendations():
+    """Show movies the user hasn't rated yet, predicted from
+    the ratings of users with a similar taste.
+    """
+    if not recommender.is_available():
+        cprint_error("\nRecommendations require NumPy (pip install numpy).")
+        return
+    recommendations = recommender.recommend_movies(current_user_id)
+    if not recommendations:
+        cprint_info("\nThere are no movies to recommend yet.")
+        return
+    cprint_output("\nRecommended for you:\n")
+    emojis = data_processing.get_country_emojis_for_movies(
+        [movie.id for movie, _ in recommendations])
+    for movie, predicted_rating in recommendations:
+        reason = (f"predicted rating {predicted_rating:.1f}"
+                  if predicted_rating is not None else "popular")
+        emojis_str = " ".join(emojis.get(movie.id, []))
+        cprint_output(f"{movie.title} ({movie.year}) - {reason} - {emojis_str}")
 
 
 def generate_website():
@@ -915,6 +1033,78 @@ def generate_website():
     cprint_info(f"\nWebsite for '{username}' was generated successfully.")
 
 
+def log_out():
+    """End the current user's session in this terminal and log out."""
+    global current_user_id
+    username = data_processing.get_user(current_user_id, find_by_id=True)["user_name"]
+    session.end_session(username)
+    current_user_id = DEFAULT_USER_ID
+    cprint_info(f"\n'{username}' was logged out.")
+
+
+def show_diagnostics():
+    """Show the queries with the highest total time
+    and the number of queries per action.
+    """
+    cprint_output("\nTop queries by total time:\n")
+    cprint_default(f"{'Statement':<28}{'Calls':>8}{'Total ms':>11}"
+                   f"{'Avg ms':>9}{'Max ms':>9}{'Rows':>9}")
+    for name, stats in query_stats.get_top_statements():
+        avg_ms = stats["total_s"] / stats["calls"] * 1000
+        cprint_output(f"{name[:27]:<28}{stats['calls']:>8}"
+                      f"{stats['total_s'] * 1000:>11.1f}{avg_ms:>9.2f}"
+                      f"{stats['max_s'] * 1000:>9.2f}{stats['rows']:>9}")
+    cprint_output("\nQueries per action:\n")
+    cprint_default(f"{'Action':<28}{'Runs':>8}{'Queries':>9}"
+                   f"{'Last run':>10}{'Query ms':>10}{'Total ms':>10}")
+    for name, stats in query_stats.get_action_stats():
+        cprint_output(f"{name[:27]:<28}{stats['runs']:>8}"
+                      f"{stats['queries']:>9}{stats['last_queries']:>10}"
+                      f"{stats['query_s'] * 1000:>10.1f}"
+                      f"{stats['total_s'] * 1000:>10.1f}")
+    execution_counts = statements.get_execution_counts()
+    cprint_info(f"\n{len(statements.statements)} prepared statements, "
+                f"{sum(1 for count in execution_counts.values() if count)} "
+                f"used, {sum(execution_counts.values())} executions")
+    cprint_info(f"Queries slower than {query_stats.SLOW_QUERY_THRESHOLD_MS:g} ms "
+                f"are logged to {query_stats.SLOW_QUERY_LOG_PATH}")
+    show_http_metrics()
+
+
+def show_http_metrics():
+    """Show latency, status codes, errors and bytes per API endpoint."""
+    cprint_output("\nHTTP calls per endpoint:\n")
+    cprint_default(f"{'Endpoint':<28}{'Type':<8}{'Calls':>6}{'Avg ms':>8}"
+                   f"{'p95 <=':>8}{'KiB':>8}  Status / errors")
+    for (endpoint, call_type), metrics in sorted(api_metrics.get_metrics().items()):
+        calls = metrics["count"]
+        avg_ms = metrics["latency_sum"] / calls * 1000 if calls else 0
+        p95 = api_metrics.get_latency_quantile(metrics, 0.95)
+        outcomes = ", ".join(
+            [f"{status}: {count}" for status, count
+             in sorted(metrics["statuses"].items())]
+            + [f"{error}: {count}" for error, count
+               in sorted(metrics["errors"].items())])
+        cprint_output(f"{endpoint[:27]:<28}{call_type[:7]:<8}{calls:>6}"
+                      f"{avg_ms:>8.0f}{p95:>7g}s{metrics['bytes'] / 1024:>8.1f}"
+                      f"  {outcomes}")
+    textfile_path = export_metrics()
+    if textfile_path:
+        cprint_info(f"\nHTTP metrics exported to {textfile_path}")
+
+
+def export_metrics():
+    """Write the HTTP metrics textfile (if configured) and return its path.
+
+    A failed write is reported instead of ending the menu loop.
+    """
+    try:
+        return api_metrics.export_textfile()
+    except OSError as e:
+        cprint_error(f"Couldn't export the HTTP metrics: {e}")
+        return None
+
+
 # ---------------------------------------------------------------------
 # SIMPLE LIST AND DICT RETURNING FUNCTIONS
 # ---------------------------------------------------------------------
@@ -929,11 +1119,6 @@ def get_imdb_ids_with_title(data):
     return {imdb_id: details["title"] for imdb_id, details in data.items()}
 
 
-def get_imdb_ids(data):
-    """Return a list of all movie imdb_ids."""
-    return list(data)
-
-
 # ---------------------------------------------------------------------
 # PRINT HELPER FUNCTIONS
 # ---------------------------------------------------------------------
@@ -1034,7 +1219,10 @@ DISPATCH_TABLE = {
     "9": sort_movies_by_year,
     "10": filter_movies,
     "11": generate_website,
-    "12": login_or_switch_user
+    "12": login_or_switch_user,
+    "13": show_diagnostics,
+    "14": log_out,
+    "15": show_recommendations
 }
 
 
@@ -1056,20 +1244,33 @@ def execute_user_choice(choice, dispatch_table=None):
         invalid_choice()
         return False
     try:
-        dispatch_table[choice]()
+        action = dispatch_table[choice]
+        with (query_stats.track_action(action.__name__),
+              profiling.profile_action(action.__name__)):
+            action()
     except CancelDialog:
         print_action_cancelled()
     except MovieRatingNotFoundError:
         pass
     except NoMoviesFoundError:
         pass
+    except api.CircuitOpenError:
+        cprint_error("The OMDB API is currently unavailable, "
+                     "please try again later.")
+    except api.QuotaExceededError:
+        cprint_error("The daily OMDB request quota has been used up.")
     except requests_exceptions.Timeout:
         cprint_error("Connection to the OMDB API has timed out.")
     except requests_exceptions.ConnectionError:
         cprint_error("Couldn't connect to the OMDB API.")
+    except requests_exceptions.HTTPError as e:
+        cprint_error(f"The OMDB API answered with status "
+                     f"{e.response.status_code}, please try again later.")
     except SQLAlchemyError as e:
         cprint_error("The following exception was raised during a database operation:")
         cprint_inactive(f"{e}")
+    finally:
+        export_metrics()
     return True
 
 
@@ -0,0 +1,365 @@
+"""Run single commands without the interactive menu.
+
+Every command authenticates the user once, calls data_processing
+directly and writes its result as JSON to stdout, e.g. for cron jobs
+and pipelines. Errors are written as JSON to stderr with exit code 1;
+reports that fail a check (see 'maintain') exit with 1 as well.
+
+The user is given by '--user' (or 'MYAPP_USER'), the password is read
+from 'MYAPP_PASSWORD' or prompted for if a terminal is attached.
+"""
+import getpass
+import json
+import os
+import sys
+
+import requests
+from sqlalchemy.exc import SQLAlchemyError
+
+from myapp.api import api_client as api
+from myapp.auth import auth
+from myapp.db import maintenance
+from myapp.models import data_processing
+from myapp.models import library
+from myapp.models import random_pick
+from myapp.models import recommender
+from myapp.models.rows import MovieCollection
+from myapp.web import render_user_page
+
+EXPORT_PAGE_SIZE = 1000
+
+
+class HeadlessError(BaseException):
+    """Raised when a command can't be completed."""
+
+
+def add_subcommands(parser):
+    """Add the headless commands as subcommands to the parser."""
+    parser.add_argument("--user", default=os.environ.get("MYAPP_USER"),
+                        help="user name for the commands below "
+                             "(default: MYAPP_USER)")
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND",
+                                       help="run a single command and "
+                                            "print the result as JSON")
+    list_parser = subparsers.add_parser("list", help="list rated movies")
+    add_query_arguments(list_parser)
+    list_parser.add_argument("--limit", type=int)
+    list_parser.add_argument("--offset", type=int, default=0)
+    subparsers.add_parser("stats", help="show rating statistics")
+    search_parser = subparsers.add_parser("search",
+                                          help="search rated movies by title")
+    search_parser.add_argument("term")
+    search_parser.add_argument("--limit", type=int)
+    add_parser = subparsers.add_parser("add", help="rate a movie")
+    add_parser.add_argument("--imdb-id", required=True)
+    add_parser.add_argument("--rating", type=float, required=True)
+    add_parser.add_argument("--note", default="")
+    batch_parser = subparsers.add_parser(
+        "rate-batch", help="add or update ratings from JSON lines "
+                           '({"imdb_id": ..., "rating": ..., "note": ...})')
+    batch_parser.add_argument("file", help="JSON lines file or '-' for stdin")
+    batch_parser.add_argument("--skip-missing", action="store_true",
+                              help="skip movies not in the database instead "
+                                   "of fetching them from OMDB")
+    export_parser = subparsers.add_parser("export",
+                                          help="export all rated movies")
+    add_query_arguments(export_parser)
+    export_parser.add_argument("--format", choices=("json", "jsonl"),
+                               default="json")
+    export_parser.add_argument("--output", help="file (default: stdout)")
+    random_parser = subparsers.add_parser(
+        "random", help="pick different random movies matching the filters")
+    add_filter_arguments(random_parser)
+    random_parser.add_argument("--count", type=int, default=1)
+    random_parser.add_argument("--weighted", action="store_true",
+                               help="pick higher rated movies more often")
+    recommend_parser = subparsers.add_parser(
+        "recommend", help="recommend unrated movies from similar ratings")
+    recommend_parser.add_argument("--limit", type=int,
+                                  default=recommender.DEFAULT_COUNT)
+    subparsers.add_parser("render", help="render the user's web page")
+    calibrate_parser = subparsers.add_parser(
+        "calibrate-bcrypt", help="find the bcrypt cost factor for a target "
+                                 "login latency on this host (no login)")
+    calibrate_parser.add_argument("--target-ms", type=float,
+                                  default=auth.DEFAULT_TARGET_MS,
+                                  help="maximum time to hash a password "
+                                       "(default: %(default)s)")
+    maintain_parser = subparsers.add_parser(
+        "maintain", help="check, analyze and vacuum the database and "
+                         "report its size (no login)")
+    maintain_parser.add_argument("--vacuum", choices=maintenance.VACUUM_MODES,
+                                 default="incremental",
+                                 help="'full' rewrites the file and enables "
+                                      "incremental vacuum for later runs "
+                                      "(default: %(default)s)")
+    maintain_parser.add_argument("--full-analyze", action="store_true",
+                                 help="run ANALYZE instead of PRAGMA optimize")
+    maintain_parser.add_argument("--quick", action="store_true",
+                                 help="run quick_check instead of "
+                                      "integrity_check")
+    maintain_parser.add_argument("--no-checks", action="store_true",
+                                 help="skip the integrity checks")
+
+
+def add_query_arguments(parser):
+    """Add sort and filter options of data_processing.find_movies."""
+    parser.add_argument("--order-by", choices=("rating", "year", "title"))
+    parser.add_argument("--desc", action="store_true",
+                        help="sort in descending order")
+    add_filter_arguments(parser)
+
+
+def add_filter_arguments(parser):
+    """Add filter options of data_processing.find_movies."""
+    parser.add_argument("--min-rating", type=float)
+    parser.add_argument("--year-start", type=int)
+    parser.add_argument("--year-end", type=int)
+    parser.add_argument("--country", help="country name or code")
+    parser.add_argument("--title", help="part of the title")
+
+
+def get_filters(args) -> dict:
+    """Return the filters given on the command line."""
+    return {"min_rating": args.min_rating,
+            "year_start": args.year_start,
+            "year_end": args.year_end,
+            "country": args.country,
+            "title": args.title}
+
+
+def run_command(args):
+    """Run the selected command and print its result as JSON.
+
+    Return the exit code.
+    """
+    try:
+        user = None
+        if args.command not in ANONYMOUS_COMMANDS:
+            user = login(args.user)
+        command = COMMANDS[args.command]
+        result = command(user, args)
+    except requests.RequestException as e:
+        # The message of e holds the request URL with the API key
+        # (checked first, as requests' exceptions are OSErrors).
+        write_json({"error": "Request failed: "
+                             f"{api.describe_request_error(e)}"},
+                   sys.stderr)
+        return 1
+    except (HeadlessError, library.LibraryError, OSError) as e:
+        write_json({"error": str(e)}, sys.stderr)
+        return 1
+    except SQLAlchemyError as e:
+        write_json({"error": str(getattr(e, "orig", None) or e)}, sys.stderr)
+        return 1
+    if result is not None:
+        write_json(result, sys.stdout)
+    # Reports with "ok": false (e.g. a failed check) exit with 1 as well.
+    if isinstance(result, dict) and result.get("ok") is False:
+        return 1
+    return 0
+
+
+def write_json(result, file_obj):
+    """Write the result as one line of JSON."""
+    file_obj.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def login(user_name):
+    """Return the user after checking the password."""
+    if not user_name:
+        raise HeadlessError("No user given (use --user or MYAPP_USER).")
+    user = data_processing.get_user(user_name.lower())
+    if user is None or not user.password_hash:
+        raise HeadlessError(f"User '{user_name}' does not exist "
+                            "or has no password.")
+    password = os.environ.get("MYAPP_PASSWORD")
+    if password is None:
+        if not sys.stdin.isatty():
+            raise HeadlessError("No password given (set MYAPP_PASSWORD).")
+        password = getpass.getpass(f"Password for {user.user_name}: ")
+    if not auth.authenticate_user(user.user_name, password):
+        raise HeadlessError("Authentication failed.")
+    return user
+
+
+# ---------------------------------------------------------------------
+# COMMANDS
+# ---------------------------------------------------------------------
+def list_movies(user, args) -> dict:
+    """Return the user's movies matching the filters."""
+    filters = get_filters(args)
+    total = data_processing.count_movies(user.id, **filters)
+    movies = data_processing.find_movies(user.id, args.order_by, args.desc,
+                                         limit=args.limit, offset=args.offset,
+                                         **filters)
+    return {"total": total, "movies": library.serialize_movies(movies)}
+
+
+def get_stats(user, args) -> dict:
+    """Return count, average and median rating, best and worst movies."""
+    return library.get_rating_stats(user.id)
+
+
+def search_movies(user, args) -> dict:
+    """Return the user's movies with the search term in their title."""
+    total = data_processing.count_movies(user.id, title=args.term)
+    movies = data_processing.find_movies(user.id, limit=args.limit,
+                                         title=args.term)
+    return {"total": total, "movies": library.serialize_movies(movies)}
+
+
+def add_rating(user, args) -> dict:
+    """Rate a movie, fetching its details from OMDB if needed."""
+    library.check_rating(args.rating)
+    movie, is_new_movie = library.get_or_add_movie(args.imdb_id)
+    with data_processing.transaction():
+        if data_processing.get_rating(user.id, movie.id) is not None:
+            raise HeadlessError(f"'{movie.title}' is already rated.")
+        data_processing.add_rating(user.id, movie.id, args.rating, args.note)
+    return {"imdb_id": movie.imdb_id,
+            "movie_id": movie.id,
+            "title": movie.title,
+            "rating": args.rating,
+            "note": args.note,
+            "movie_added": is_new_movie}
+
+
+def rate_batch(user, args) -> dict:
+    """Add or update ratings read from a JSON lines file."""
+    entries = read_rating_entries(args.file)
+    movies = data_processing.get_movies_by_imdb_ids(
+        entry["imdb_id"] for entry in entries)
+    missing = list(dict.fromkeys(entry["imdb_id"] for entry in entries
+                                 if entry["imdb_id"] not in movies))
+    if missing and not args.skip_missing:
+        # Add all movies fetched from OMDB with one batch.
+        movie_ids = data_processing.add_movies_with_countries(
+            [library.fetch_movie(imdb_id) for imdb_id in missing])
+        movies.update(data_processing.get_movies_by_imdb_ids(movie_ids))
+        missing = []
+    ratings = [(movies[entry["imdb_id"]].id, entry["rating"],
+                entry.get("note", ""))
+               for entry in entries if entry["imdb_id"] in movies]
+    added, updated = data_processing.rate_movies(user.id, ratings)
+    return {"added": added, "updated": updated, "missing": missing}
+
+
+def export_movies(user, args):
+    """Write all movies matching the filters to a file or stdout.
+
+    Movies are read page by page, so memory use doesn't grow
+    with the size of the library.
+    """
+    filters = get_filters(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file_obj:
+            count = write_export(file_obj, user, args, filters)
+        return {"exported": count, "output": args.output}
+    write_export(sys.stdout, user, args, filters)
+    return None
+
+
+def pick_random_movies(user, args) -> dict:
+    """Return different random movies matching the filters."""
+    movies = random_pick.pick_movies(user.id, args.count, args.weighted,
+                                     **get_filters(args))
+    return {"movies": library.serialize_movies(MovieCollection(movies))}
+
+
+def recommend_movies(user, args) -> dict:
+    """Return movies the user hasn't rated, best predicted first."""
+    return library.get_recommendations(user.id, args.limit)
+
+
+def render_page(user, args) -> dict:
+    """Render the user's web page and return its path."""
+    render_user_page.render_webpage(user.id)
+    path = render_user_page.OUTPUT_PATH / f"{user.user_name}.html"
+    return {"path": str(path)}
+
+
+def calibrate_bcrypt(user, args) -> dict:
+    """Return the bcrypt cost factor meeting the target latency."""
+    rounds, timings = auth.calibrate_rounds(args.target_ms)
+    return {"rounds": rounds,
+            "target_ms": args.target_ms,
+            "timings_ms": timings,
+            "current_rounds": auth.BCRYPT_ROUNDS,
+            "setting": f"MYAPP_BCRYPT_ROUNDS={rounds}"}
+
+
+def maintain_database(user, args) -> dict:
+    """Return the report of the database maintenance steps."""
+    return maintenance.run_maintenance(args.vacuum, args.full_analyze,
+                                       args.quick, not args.no_checks)
+
+
+COMMANDS = {"list": list_movies,
+            "stats": get_stats,
+            "search": search_movies,
+            "add": add_rating,
+            "rate-batch": rate_batch,
+            "export": export_movies,
+            "random": pick_random_movies,
+            "recommend": recommend_movies,
+            "render": render_page,
+            "calibrate-bcrypt": calibrate_bcrypt,
+            "maintain": maintain_database}
+# Commands that don't need a logged in user
+ANONYMOUS_COMMANDS = {"calibrate-bcrypt", "maintain"}
+
+
+# ---------------------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------------------
+def read_rating_entries(file_name) -> list[dict]:
+    """Return the rating entries of a JSON lines file or stdin."""
+    if file_name == "-":
+        lines = sys.stdin.readlines()
+    else:
+        try:
+            with open(file_name, "r", encoding="utf-8") as file_obj:
+                lines = file_obj.readlines()
+        except OSError as e:
+            raise HeadlessError(f"Can't read '{file_name}': {e}") from None
+    entries = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            entry["rating"] = float(entry["rating"])
+            library.check_rating(entry["rating"])
+            entry["imdb_id"] = str(entry["imdb_id"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise HeadlessError(f"Line {line_number}: invalid entry "
+                                f"({e!r})") from None
+        entries.append(entry)
+    return entries
+
+
+def write_export(file_obj, user, args, filters) -> int:
+    """Write the movies page by page and return their number."""
+    count = 0
+    after = None
+    if args.format == "json":
+        file_obj.write("[")
+    while True:
+        movies = data_processing.find_movies(user.id, args.order_by,
+                                             args.desc,
+                                             limit=EXPORT_PAGE_SIZE,
+                                             after=after, **filters)
+        for movie in library.serialize_movies(movies):
+            if args.format == "json":
+                file_obj.write(",\n" if count else "\n")
+                file_obj.write(json.dumps(movie, ensure_ascii=False))
+            else:
+                file_obj.write(json.dumps(movie, ensure_ascii=False) + "\n")
+            count += 1
+        if len(movies) < EXPORT_PAGE_SIZE:
+            break
+        after = movies.at(len(movies) - 1)
+    if args.format == "json":
+        file_obj.write("\n]\n")
+    return count
@@ -0,0 +1,71 @@
+"""Page through long movie lists in the CLI.
+
+Pages are fetched with keyset pagination: a page starts after the last
+movie of the previous page, so the database doesn't scan all skipped
+rows like it does with OFFSET. Jumping to a page whose previous page
+hasn't been seen yet falls back to OFFSET. While the user reads a page,
+the following page and its country flags are fetched in the background.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from myapp.models import data_processing
+
+PAGE_SIZE = 20
+
+
+class MoviePager:
+    """Fetch pages of a user's movies matching a query.
+
+    The query arguments are passed on to data_processing.find_movies.
+    Pages are numbered from 0.
+    """
+
+    def __init__(self, user_id, total, order_by=None, descending=False,
+                 page_size=PAGE_SIZE, **filters):
+        self.user_id = user_id
+        self.total = total
+        self.order_by = order_by
+        self.descending = descending
+        self.page_size = page_size
+        self.filters = filters
+        self.page_count = max(1, math.ceil(total / page_size))
+        # Last movie before a page, None for the first page
+        self.page_starts = {0: None}
+        self.prefetched = {}
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def fetch(self, page):
+        """Return movies and their country emojis for the page."""
+        if page in self.page_starts:
+            movies = data_processing.find_movies(
+                self.user_id, self.order_by, self.descending,
+                limit=self.page_size, after=self.page_starts[page],
+                **self.filters)
+        else:
+            movies = data_processing.find_movies(
+                self.user_id, self.order_by, self.descending,
+                limit=self.page_size, offset=page * self.page_size,
+                **self.filters)
+        if len(movies) == self.page_size:
+            self.page_starts[page + 1] = movies.at(len(movies) - 1)
+        emojis = data_processing.get_country_emojis_for_movies(
+            [movie.movie_id for movie in movies.values()])
+        return movies, emojis
+
+    def get_page(self, page):
+        """Return the page and start fetching the following page."""
+        future = self.prefetched.pop(page, None)
+        # Prefetched pages other than the requested one are obsolete.
+        for obsolete in self.prefetched.values():
+            obsolete.cancel()
+        self.prefetched.clear()
+        result = future.result() if future else self.fetch(page)
+        if page + 1 < self.page_count:
+            self.prefetched[page + 1] = self.executor.submit(self.fetch,
+                                                             page + 1)
+        return result
+
+    def close(self):
+        """Stop fetching pages in the background."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
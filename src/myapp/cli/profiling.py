@@ -0,0 +1,84 @@
+"""Profile CLI actions with cProfile and tracemalloc.
+
+Profiling is opt-in: set the environment variable 'MYAPP_PROFILE=1'
+or start the app with '--profile'. For every action a '.prof' file
+(open it with pstats or snakeviz) and a text summary with the top
+functions and memory allocations are written to the profiling folder.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+DEFAULT_PROFILE_PATH = (PROJECT_ROOT / "data" / "profiles").resolve()
+TOP_N = 25
+
+is_enabled = os.environ.get("MYAPP_PROFILE", "") not in ("", "0")
+profile_path = Path(os.environ.get("MYAPP_PROFILE_DIR", DEFAULT_PROFILE_PATH))
+
+
+def enable(path=None):
+    """Turn on profiling and optionally change the output folder."""
+    global is_enabled, profile_path
+    is_enabled = True
+    if path:
+        profile_path = Path(path)
+
+
+def profile_action(name):
+    """Return a context manager profiling the named action
+    or doing nothing while profiling is disabled.
+    """
+    if not is_enabled:
+        return nullcontext()
+    return _profile(name)
+
+
+@contextmanager
+def _profile(name):
+    """Profile the enclosed code and write the results to files."""
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    snapshot_before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot_after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+        write_results(name, profiler, snapshot_before, snapshot_after, peak)
+
+
+def write_results(name, profiler, snapshot_before, snapshot_after, peak):
+    """Write the '.prof' file and a text summary for the action."""
+    profile_path.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", name)
+    base_path = profile_path / f"{timestamp}_{safe_name}"
+    profiler.dump_stats(f"{base_path}.prof")
+    summary = io.StringIO()
+    summary.write(f"Action: {name}\n")
+    summary.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n\n")
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_N)
+    summary.write(f"Top {TOP_N} allocations by size:\n")
+    # Ignore memory allocated by tracemalloc itself.
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__),)
+    differences = snapshot_after.filter_traces(ignore).compare_to(
+        snapshot_before.filter_traces(ignore), "lineno")
+    for difference in differences[:TOP_N]:
+        summary.write(f"{difference}\n")
+    with open(f"{base_path}.txt", "w", encoding="utf-8") as file_obj:
+        file_obj.write(summary.getvalue())
@@ -0,0 +1,224 @@
+"""Provide an async query interface to the database.
+
+Mirrors the CRUD functions of the 'database' module as coroutines using
+SQLAlchemy's async engine over aiosqlite, e.g. for a web front end
+serving many users at once. Queries are shared with the sync module
+through db_queries and the prebuilt statements of 'statements'.
+
+aiosqlite is optional: it is only required once the async engine is
+created. Importing this module initializes the database schema through
+the sync 'database' module.
+"""
+import json
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from sqlalchemy import event
+
+from myapp.db import database
+from myapp.db import db_queries
+from myapp.db import query_stats
+from myapp.db import statements
+
+ASYNC_DB_URL = f"sqlite+aiosqlite:///{database.db_path.as_posix()}"
+
+engine = None
+current_connection = ContextVar("current_async_connection", default=None)
+
+
+def get_engine():
+    """Return the async engine, creating it on first use."""
+    global engine
+    if engine is None:
+        # Raises ImportError if aiosqlite isn't installed.
+        from sqlalchemy.ext.asyncio import create_async_engine
+        engine = create_async_engine(
+            ASYNC_DB_URL,
+            echo=database.ECHO_SQL,
+            pool_size=database.DB_POOL_SIZE,
+            max_overflow=database.DB_MAX_OVERFLOW,
+            pool_pre_ping=database.DB_POOL_PRE_PING,
+            pool_recycle=database.DB_POOL_RECYCLE,
+            query_cache_size=database.DB_QUERY_CACHE_SIZE)
+        event.listen(engine.sync_engine, "connect",
+                     database.set_sqlite_pragma)
+        event.listen(engine.sync_engine, "connect",
+                     database.add_sql_functions)
+    return engine
+
+
+async def dispose_engine():
+    """Close all connections of the async engine."""
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
+
+
+@asynccontextmanager
+async def transaction():
+    """Share one connection and transaction between the enclosed calls.
+
+    Commit at the end of the block or roll back on an exception.
+    Nested blocks join the outermost transaction.
+    """
+    connection = current_connection.get()
+    if connection is not None:
+        yield connection
+        return
+    async with get_engine().begin() as connection:
+        token = current_connection.set(connection)
+        try:
+            yield connection
+        finally:
+            current_connection.reset(token)
+
+
+async def modify_database(query, params):
+    """Modify database with the given sql query
+    to produce permanent changes like
+    adding, updating, or deleting objects.
+    """
+    statement = statements.get(query)
+    start = perf_counter()
+    connection = current_connection.get()
+    if connection is not None:
+        result = await connection.execute(statement.clause, params)
+    else:
+        async with get_engine().connect() as connection:
+            result = await connection.execute(statement.clause, params)
+            await connection.commit()
+    statements.count_execution(statement)
+    query_stats.record(query, perf_counter() - start, result.rowcount)
+
+
+async def query_database(query, params):
+    """Return results for the given query from a database."""
+    statement = statements.get(query)
+    start = perf_counter()
+    connection = current_connection.get()
+    if connection is not None:
+        rows = (await connection.execute(statement.clause, params)).fetchall()
+    else:
+        async with get_engine().connect() as connection:
+            result = await connection.execute(statement.clause, params)
+            rows = result.fetchall()
+    statements.count_execution(statement)
+    query_stats.record(query, perf_counter() - start, len(rows))
+    return rows
+
+
+# ---------------------------------------------------------------------
+# CRUD OPERATIONS
+# ---------------------------------------------------------------------
+async def get_user(params):
+    """Return a user's record from the database by id or username."""
+    if params.get("id"):
+        query = db_queries.GET_USER_BY_ID
+    else:
+        query = db_queries.GET_USER_BY_USERNAME
+    return await query_database(query, params)
+
+
+async def get_movies(params=None):
+    """Return movies from the database (for the given user).
+
+    Include rating information only when querying by user.
+    """
+    if params:
+        return await query_database(db_queries.GET_MOVIES, params)
+    return await query_database(db_queries.GET_MOVIES_ALL_USERS, params={})
+
+
+async def find_movies(params, order_by=None, descending=False):
+    """Return a user's movies matching the filters in params."""
+    query, params = database.build_movies_query(params, order_by, descending)
+    return await query_database(query, params)
+
+
+async def count_movies(params):
+    """Return the number of a user's movies matching the filters."""
+    query, params = database.build_count_query(params)
+    return await query_database(query, params)
+
+
+async def get_movie(params):
+    """Return a single movie from the database."""
+    if params.get("id"):
+        query = db_queries.GET_MOVIE_BY_ID
+    elif params.get("imdb_id"):
+        query = db_queries.GET_MOVIE_BY_IMDBID
+    else:
+        query = db_queries.GET_MOVIE_BY_TITLE
+    return await query_database(query, params)
+
+
+async def add_user(params):
+    """Add user record to the users table."""
+    await modify_database(db_queries.ADD_USER, params)
+
+
+async def add_movie(params):
+    """Add movie to the movies table."""
+    await modify_database(db_queries.ADD_MOVIE, params)
+
+
+async def get_country(params):
+    """Return country object from the countries table."""
+    if params.get("id"):
+        query = db_queries.GET_COUNTRY_BY_ID
+    elif params.get("code"):
+        query = db_queries.GET_COUNTRY_BY_CODE
+    else:
+        query = db_queries.GET_COUNTRY_BY_NAME
+    return await query_database(query, params)
+
+
+async def get_countries_for_movie(params):
+    """Return countries for a given movie id."""
+    return await query_database(db_queries.GET_COUNTRIES_FOR_MOVIE, params)
+
+
+async def get_countries_for_movies(params):
+    """Return countries with their movie id for a list of movie ids."""
+    params = {"movie_ids": json.dumps(params["movie_ids"])}
+    return await query_database(db_queries.GET_COUNTRIES_FOR_MOVIES, params)
+
+
+async def add_country(params):
+    """Add country to the countries table."""
+    await modify_database(db_queries.ADD_COUNTRY, params)
+
+
+async def add_movie_country_relationship(params):
+    """Add movie-country relationship to movies_countries table."""
+    await modify_database(db_queries.ADD_MOVIE_COUNTRY, params)
+
+
+async def add_rating(params):
+    """Add rating to the ratings table."""
+    await modify_database(db_queries.ADD_RATING, params)
+
+
+async def get_rating(params):
+    """Return a single rating from the ratings table."""
+    return await query_database(db_queries.GET_RATING, params)
+
+
+async def delete_rating(params):
+    """Delete a movie's rating in the database."""
+    await modify_database(db_queries.DELETE_RATING, params)
+
+
+async def update_rating(params):
+    """Update a movie's rating in the database."""
+    await modify_database(db_queries.UPDATE_RATING, params)
+
+
+# ---------------------------------------------------------------------
+# OTHER QUERIES
+# ---------------------------------------------------------------------
+async def count_ratings_for_user(params):
+    """Return the number of movie's rated by a user."""
+    return await query_database(db_queries.COUNT_RATINGS_FOR_USER, params)
@@ -1,18 +1,47 @@
 """Provide query interface to the database."""
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from sqlalchemy import create_engine, text
+from time import perf_counter
+from sqlalchemy import create_engine
 from sqlalchemy import event
-from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool, QueuePool, SingletonThreadPool
 from myapp.db import db_queries
+from myapp.db import query_stats
+from myapp.db import statements
 
 # Get the project root and go up three levels
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
-# Set path to database
-db_path = (PROJECT_ROOT / "data" / "movies.sqlite3").resolve()
+# Set path to database (override with the environment variable
+# 'MOVIES_DB_PATH', e.g. to run benchmarks against a separate file)
+db_path = Path(os.environ.get("MOVIES_DB_PATH")
+               or PROJECT_ROOT / "data" / "movies.sqlite3").resolve()
 # Use 3 slashes for absolute path; ensure POSIX format
 DB_URL = f"sqlite:///{db_path.as_posix()}"
 # Show SQL queries in the CLI
 ECHO_SQL = False
+# Connection pool settings (environment variables 'MOVIES_DB_POOL', ...)
+# - queue: up to DB_POOL_SIZE + DB_MAX_OVERFLOW shared connections
+# - singleton: one long-lived connection per thread; only for up to
+#   DB_POOL_SIZE threads in total, as it closes the connections of
+#   other threads beyond that (not for the CLI, whose pager and
+#   background rebuilds start new threads)
+# - null: a new connection for every call (for comparison only)
+DB_POOL = os.environ.get("MOVIES_DB_POOL")
+DEFAULT_POOL = "queue"
+DB_POOL_SIZE = int(os.environ.get("MOVIES_DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("MOVIES_DB_MAX_OVERFLOW", 10))
+# Test connections before use (pointless for a local file by default)
+DB_POOL_PRE_PING = os.environ.get("MOVIES_DB_POOL_PRE_PING", "0") != "0"
+# Replace connections older than this many seconds (-1: never)
+DB_POOL_RECYCLE = int(os.environ.get("MOVIES_DB_POOL_RECYCLE", -1))
+# Number of compiled statements cached by the engine
+DB_QUERY_CACHE_SIZE = int(os.environ.get("MOVIES_DB_QUERY_CACHE_SIZE", 500))
+POOL_CLASSES = {"singleton": SingletonThreadPool,
+                "queue": QueuePool,
+                "null": NullPool}
 # Queries for database initialization
 DB_INIT_QUERIES = [
     db_queries.CREATE_TABLE_USERS,
@@ -22,42 +51,195 @@ DB_INIT_QUERIES = [
     db_queries.CREATE_TABLE_RATINGS,
     db_queries.ADD_DEFAULT_USER
 ]
+# Indexes are created after the tables (see db_queries)
+DB_INDEX_QUERIES = [
+    db_queries.CREATE_INDEX_RATINGS_USER_RATING,
+    db_queries.CREATE_INDEX_RATINGS_USER_MOVIE,
+    db_queries.CREATE_INDEX_MOVIES_YEAR,
+    db_queries.CREATE_INDEX_MOVIES_TITLE,
+    db_queries.CREATE_UNIQUE_INDEX_MOVIES_COUNTRIES,
+    db_queries.CREATE_INDEX_MOVIES_COUNTRIES_COUNTRY
+]
 
-# Create the engine
-engine = create_engine(DB_URL, echo=ECHO_SQL)
+# Run before the unique index on movies_countries is created
+DB_MIGRATION_QUERIES = [
+    db_queries.DELETE_DUPLICATE_MOVIES_COUNTRIES,
+    db_queries.DROP_INDEX_MOVIES_COUNTRIES_MOVIE
+]
+UNIQUE_MOVIES_COUNTRIES_INDEX = "idx_movies_countries_unique"
+
+# Connection of the enclosing transaction() block, if any
+current_connection = ContextVar("current_connection", default=None)
 
 
-@event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     """Enforce foreign key constraints with listener function."""
     dbapi_connection.execute("PRAGMA foreign_keys=ON")
 
 
+def casefold(value):
+    """Return the value with Unicode case folding, e.g. for 'Ä' and 'ä'."""
+    return value.casefold() if isinstance(value, str) else value
+
+
+def add_sql_functions(dbapi_connection, connection_record):
+    """Add Python functions to SQL (SQLite's LIKE ignores the case
+    of ASCII letters only).
+    """
+    dbapi_connection.create_function("casefold", 1, casefold,
+                                     deterministic=True)
+
+
+def create_db_engine(pool=None, url=DB_URL):
+    """Return an engine using the given pool type (see POOL_CLASSES).
+
+    Use the configured or default pool type if None is given.
+    """
+    pool = pool or DB_POOL or DEFAULT_POOL
+    options = {"poolclass": POOL_CLASSES[pool],
+               "pool_pre_ping": DB_POOL_PRE_PING,
+               "pool_recycle": DB_POOL_RECYCLE,
+               "query_cache_size": DB_QUERY_CACHE_SIZE}
+    if pool == "singleton":
+        # Number of threads keeping a connection
+        options["pool_size"] = DB_POOL_SIZE
+    elif pool == "queue":
+        options["pool_size"] = DB_POOL_SIZE
+        options["max_overflow"] = DB_MAX_OVERFLOW
+        # sqlite3 connections may be used by any thread of the pool.
+        options["connect_args"] = {"check_same_thread": False}
+    new_engine = create_engine(url, echo=ECHO_SQL, **options)
+    # Run only for new connections of this engine.
+    event.listen(new_engine, "connect", set_sqlite_pragma)
+    event.listen(new_engine, "connect", add_sql_functions)
+    return new_engine
+
+
+# Create the engine
+engine = create_db_engine()
+
+
+def configure_engine(pool):
+    """Replace the engine with one using the given pool type,
+    unless a pool type is configured by 'MOVIES_DB_POOL'.
+    """
+    global engine
+    if DB_POOL:
+        return
+    engine.dispose()
+    engine = create_db_engine(pool)
+
+
+@contextmanager
+def transaction():
+    """Share one connection and transaction between the enclosed calls.
+
+    Commit at the end of the block or roll back on an exception.
+    Nested blocks join the outermost transaction.
+    """
+    connection = current_connection.get()
+    if connection is not None:
+        yield connection
+        return
+    with engine.begin() as connection:
+        token = current_connection.set(connection)
+        try:
+            yield connection
+        finally:
+            current_connection.reset(token)
+
+
+@contextmanager
+def autocommit():
+    """Share one connection between the enclosed calls and run every
+    statement outside a transaction, e.g. VACUUM, which can't run in one.
+    """
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        token = current_connection.set(connection)
+        try:
+            yield connection
+        finally:
+            current_connection.reset(token)
+
+
 def modify_database(query, params):
     """Modify database with the given sql query
     to produce permanent changes like
     adding, updating, or deleting objects.
+
+    Pass a list of parameter dictionaries to execute the query
+    for each of them at once (executemany).
+
+    Inside a transaction() block the changes are committed
+    at the end of the block.
     """
-    with engine.connect() as connection:
-        connection.execute(text(query), params)
-        connection.commit()
+    statement = statements.get(query)
+    start = perf_counter()
+    connection = current_connection.get()
+    if connection is not None:
+        result = connection.execute(statement.clause, params)
+    else:
+        with engine.connect() as connection:
+            result = connection.execute(statement.clause, params)
+            connection.commit()
+    statements.count_execution(statement)
+    query_stats.record(query, perf_counter() - start, result.rowcount)
+
+
+def modify_database_returning(query, params):
+    """Modify the database like modify_database and return
+    the rows of the query's RETURNING clause.
+    """
+    statement = statements.get(query)
+    start = perf_counter()
+    connection = current_connection.get()
+    if connection is not None:
+        rows = connection.execute(statement.clause, params).fetchall()
+    else:
+        with engine.connect() as connection:
+            rows = connection.execute(statement.clause, params).fetchall()
+            connection.commit()
+    statements.count_execution(statement)
+    query_stats.record(query, perf_counter() - start, len(rows))
+    return rows
 
 
 def query_database(query, params):
     """Return results for the given query from a database."""
-    with engine.connect() as connection:
-        results = connection.execute(text(query), params)
-    return results.fetchall()
+    statement = statements.get(query)
+    start = perf_counter()
+    connection = current_connection.get()
+    if connection is not None:
+        rows = connection.execute(statement.clause, params).fetchall()
+    else:
+        with engine.connect() as connection:
+            rows = connection.execute(statement.clause, params).fetchall()
+    statements.count_execution(statement)
+    query_stats.record(query, perf_counter() - start, len(rows))
+    return rows
 
 
 def initialize_database(queries=None):
-    """Initialize database with the given list of queries."""
+    """Initialize database with the given list of queries.
+
+    Duplicate movie-country links are removed once,
+    before the unique index is created.
+    """
     if queries is None:
-        queries = DB_INIT_QUERIES
+        queries = list(DB_INIT_QUERIES)
+        if not has_index(UNIQUE_MOVIES_COUNTRIES_INDEX):
+            queries += DB_MIGRATION_QUERIES
+        queries += DB_INDEX_QUERIES
     for query in queries:
         modify_database(query, params={})
 
 
+def has_index(name):
+    """Return True if the database has an index with the name."""
+    return bool(query_database(db_queries.GET_INDEX, {"name": name}))
+
+
 # ---------------------------------------------------------------------
 # CRUD OPERATIONS
 # ---------------------------------------------------------------------
@@ -85,6 +267,120 @@ def get_movies(params=None):
     return movies
 
 
+def escape_like(value):
+    """Return value with the LIKE wildcards escaped."""
+    return (value.replace("\\", "\\\\")
+            .replace("%", "\\%").replace("_", "\\_"))
+
+
+def build_movie_conditions(params):
+    """Return the filter conditions for the values given in params
+    and the params with the title prepared for LIKE.
+    """
+    params = dict(params)
+    conditions = [condition
+                  for name, condition in db_queries.MOVIE_FILTERS.items()
+                  if params.get(name) is not None]
+    if params.get("title") is not None:
+        params["title"] = f"%{escape_like(casefold(params['title']))}%"
+    return conditions, params
+
+
+def build_movies_query(params, order_by=None, descending=False):
+    """Return query and parameters for a user's movies
+    matching the filters given in params.
+
+    Filters (see db_queries.MOVIE_FILTERS) are only applied if their
+    value is not None. Sort by 'rating', 'year' or 'title' and return
+    a page of the results with 'limit' and 'offset', or with keyset
+    pagination after the movie given by 'after_id' and 'after_value'
+    (the sort column's value of that movie, which may be None).
+    """
+    conditions, params = build_movie_conditions(params)
+    direction = "DESC" if descending else "ASC"
+    if params.get("after_id") is not None:
+        operator = "<" if descending else ">"
+        if order_by is None:
+            conditions.append(db_queries.KEYSET_AFTER_ID.format(
+                operator=operator))
+        else:
+            keyset = (db_queries.KEYSET_AFTER_NULL
+                      if params.get("after_value") is None
+                      else db_queries.KEYSET_AFTER)
+            conditions.append(keyset[operator].format(
+                sort_column=db_queries.MOVIE_SORT_COLUMNS[order_by]))
+    # Ties are sorted by movie id in the same direction,
+    # so the index on (user_id, rating, movie_id) covers the sort.
+    order_columns = f"ratings.movie_id {direction}"
+    if order_by is not None:
+        order_columns = (f"{db_queries.MOVIE_SORT_COLUMNS[order_by]} "
+                         f"{direction}, {order_columns}")
+    if params.get("limit") is None:
+        # A negative limit returns all rows in SQLite.
+        params["limit"] = -1
+    params.setdefault("offset", 0)
+    query = db_queries.GET_MOVIES_FILTERED.format(
+        conditions="".join(f"\n        AND {condition}"
+                           for condition in conditions),
+        order_by=order_columns)
+    query_stats.register_statement(query, "GET_MOVIES_FILTERED")
+    return query, params
+
+
+def find_movies(params, order_by=None, descending=False):
+    """Return a user's movies matching the filters in params."""
+    query, params = build_movies_query(params, order_by, descending)
+    movies = query_database(query, params)
+    return movies
+
+
+def build_count_query(params):
+    """Return query and parameters counting a user's movies
+    matching the filters given in params.
+    """
+    conditions, params = build_movie_conditions(params)
+    query = db_queries.COUNT_MOVIES_FILTERED.format(
+        conditions="".join(f"\n        AND {condition}"
+                           for condition in conditions))
+    query_stats.register_statement(query, "COUNT_MOVIES_FILTERED")
+    return query, params
+
+
+def count_movies(params):
+    """Return the number of a user's movies matching the filters."""
+    query, params = build_count_query(params)
+    movies_count = query_database(query, params)
+    return movies_count
+
+
+def build_movie_ids_query(params):
+    """Return query and parameters for the ids and ratings
+    of a user's movies matching the filters given in params.
+    """
+    conditions, params = build_movie_conditions(params)
+    query = db_queries.GET_MOVIE_IDS_FILTERED.format(
+        conditions="".join(f"\n        AND {condition}"
+                           for condition in conditions))
+    query_stats.register_statement(query, "GET_MOVIE_IDS_FILTERED")
+    return query, params
+
+
+def find_movie_ids(params):
+    """Return movie id and rating of a user's movies
+    matching the filters in params.
+    """
+    query, params = build_movie_ids_query(params)
+    movie_ids = query_database(query, params)
+    return movie_ids
+
+
+def get_rated_movie(params):
+    """Return a single movie with the user's rating."""
+    query = db_queries.GET_RATED_MOVIE
+    movie = query_database(query, params)
+    return movie
+
+
 def get_movie(params):
     """Return a single movie from the database."""
     if params.get("id"):
@@ -97,12 +393,34 @@ def get_movie(params):
     return movie
 
 
+def get_movies_by_imdb_ids(params):
+    """Return the movies for a list of imdb ids."""
+    query = db_queries.GET_MOVIES_BY_IMDBIDS
+    params = {"imdb_ids": json.dumps(params["imdb_ids"])}
+    movies = query_database(query, params)
+    return movies
+
+
+def get_movies_by_ids(params):
+    """Return the movies for a list of movie ids."""
+    query = db_queries.GET_MOVIES_BY_IDS
+    params = {"movie_ids": json.dumps(params["movie_ids"])}
+    movies = query_database(query, params)
+    return movies
+
+
 def add_user(params):
     """Add user record to the users table."""
     query = db_queries.ADD_USER
     modify_database(query, params)
 
 
+def update_user_password_hash(params):
+    """Replace a user's password hash."""
+    query = db_queries.UPDATE_USER_PASSWORD_HASH
+    modify_database(query, params)
+
+
 def add_movie(params):
     """Add movie to the movies table."""
     query = db_queries.ADD_MOVIE
@@ -121,6 +439,20 @@ def get_country(params):
     return country
 
 
+def get_all_countries():
+    """Return id, name and code of all countries."""
+    query = db_queries.GET_ALL_COUNTRIES
+    return query_database(query, params={})
+
+
+def get_country_ids_for_movies(params):
+    """Return movie id and country id for a list of movie ids."""
+    query = db_queries.GET_COUNTRY_IDS_FOR_MOVIES
+    params = {"movie_ids": json.dumps(params["movie_ids"])}
+    country_ids = query_database(query, params)
+    return country_ids
+
+
 def get_countries_for_movie(params):
     """Return countries for a given movie id."""
     query = db_queries.GET_COUNTRIES_FOR_MOVIE
@@ -128,10 +460,18 @@ def get_countries_for_movie(params):
     return countries
 
 
+def get_countries_for_movies(params):
+    """Return countries with their movie id for a list of movie ids."""
+    query = db_queries.GET_COUNTRIES_FOR_MOVIES
+    params = {"movie_ids": json.dumps(params["movie_ids"])}
+    countries = query_database(query, params)
+    return countries
+
+
 def add_country(params):
-    """Add country to the countries table."""
-    query = db_queries.ADD_COUNTRY
-    modify_database(query, params)
+    """Add country to the countries table and return its id."""
+    query = db_queries.ADD_COUNTRY_RETURNING_ID
+    return modify_database_returning(query, params)[0][0]
 
 
 def add_movie_country_relationship(params):
@@ -140,12 +480,45 @@ def add_movie_country_relationship(params):
     modify_database(query, params)
 
 
+def add_movies(params):
+    """Add a list of movie dicts, ignoring existing imdb ids,
+    and return id and imdb id of the added movies.
+    """
+    query = db_queries.ADD_MOVIES_OR_IGNORE
+    params = {"movies": json.dumps(params["movies"])}
+    return modify_database_returning(query, params)
+
+
+def add_countries(params):
+    """Add a list of country dicts (name, code), ignoring existing
+    countries, and return the added countries.
+    """
+    query = db_queries.ADD_COUNTRIES_OR_IGNORE
+    params = {"countries": json.dumps(params["countries"])}
+    return modify_database_returning(query, params)
+
+
+def add_movie_country_relationships(params):
+    """Add a list of (movie_id, country_id) links,
+    ignoring existing ones.
+    """
+    query = db_queries.ADD_MOVIES_COUNTRIES_OR_IGNORE
+    params = {"links": json.dumps(params["links"])}
+    modify_database(query, params)
+
+
 def add_rating(params):
     """Add rating to the ratings table."""
     query = db_queries.ADD_RATING
     modify_database(query, params)
 
 
+def add_ratings(params_list):
+    """Add several ratings to the ratings table at once."""
+    query = db_queries.ADD_RATING
+    modify_database(query, params_list)
+
+
 def get_rating(params):
     """Return a single rating from the ratings table."""
     query = db_queries.GET_RATING
@@ -165,6 +538,12 @@ def update_rating(params):
     modify_database(query, params)
 
 
+def update_ratings(params_list):
+    """Update several ratings in the database at once."""
+    query = db_queries.UPDATE_RATING
+    modify_database(query, params_list)
+
+
 # ---------------------------------------------------------------------
 # OTHER QUERIES
 # ---------------------------------------------------------------------
@@ -176,6 +555,24 @@ def count_ratings_for_user(params):
     return ratings_count
 
 
+def get_all_ratings():
+    """Return user id, movie id and rating of all ratings."""
+    query = db_queries.GET_ALL_RATINGS
+    return query_database(query, params={})
+
+
+def get_ratings_fingerprint():
+    """Return count, highest rowid and sum of all ratings."""
+    query = db_queries.GET_RATINGS_FINGERPRINT
+    return query_database(query, params={})
+
+
+def get_user_ratings_fingerprint(params):
+    """Return count, highest rowid and sum of a user's ratings."""
+    query = db_queries.GET_USER_RATINGS_FINGERPRINT
+    return query_database(query, params)
+
+
 initialize_database()
 
 
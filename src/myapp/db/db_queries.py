@@ -100,6 +100,37 @@ CREATE_TABLE_RATINGS = """
         FOREIGN KEY(movie_id) REFERENCES movies(id)
     )"""
 ADD_DEFAULT_USER = "INSERT OR IGNORE INTO users (user_name) VALUES ('default')"
+# Indexes for the user's library sorted / filtered by rating
+# and for the lookups by movie, year, title and country.
+CREATE_INDEX_RATINGS_USER_RATING = """
+    CREATE INDEX IF NOT EXISTS idx_ratings_user_rating
+    ON ratings (user_id, rating, movie_id)"""
+CREATE_INDEX_RATINGS_USER_MOVIE = """
+    CREATE INDEX IF NOT EXISTS idx_ratings_user_movie
+    ON ratings (user_id, movie_id)"""
+CREATE_INDEX_MOVIES_YEAR = """
+    CREATE INDEX IF NOT EXISTS idx_movies_year ON movies (year)"""
+CREATE_INDEX_MOVIES_TITLE = """
+    CREATE INDEX IF NOT EXISTS idx_movies_title
+    ON movies (title COLLATE NOCASE)"""
+# Links are unique, so adding them again is ignored.
+CREATE_UNIQUE_INDEX_MOVIES_COUNTRIES = """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_countries_unique
+    ON movies_countries (movie_id, country_id)"""
+CREATE_INDEX_MOVIES_COUNTRIES_COUNTRY = """
+    CREATE INDEX IF NOT EXISTS idx_movies_countries_country
+    ON movies_countries (country_id, movie_id)"""
+# Migration of databases created before the unique index:
+# keep the first of duplicate links and drop the former index.
+GET_INDEX = """
+    SELECT name FROM sqlite_master WHERE type = 'index' AND name = :name"""
+DELETE_DUPLICATE_MOVIES_COUNTRIES = """
+    DELETE FROM movies_countries
+    WHERE rowid NOT IN (
+        SELECT MIN(rowid) FROM movies_countries
+        GROUP BY movie_id, country_id)"""
+DROP_INDEX_MOVIES_COUNTRIES_MOVIE = """
+    DROP INDEX IF EXISTS idx_movies_countries_movie"""
 # ---------------------------------------------------------------------
 # CREATE
 # ---------------------------------------------------------------------
@@ -112,14 +143,43 @@ ADD_USER = """
            VALUES (:user_name, :first_name, :last_name, :password_hash)
 """
 ADD_COUNTRY = "INSERT INTO countries (name, code) VALUES (:name, :code)"
+ADD_COUNTRY_RETURNING_ID = """
+    INSERT INTO countries (name, code) VALUES (:name, :code)
+    RETURNING id
+"""
 ADD_MOVIE = ("INSERT INTO movies (imdb_id, title, year, image_url, imdb_rating)"
              "VALUES (:imdb_id, :title, :year, :image_url, :imdb_rating)")
 ADD_RATING = ("INSERT INTO ratings (user_id, movie_id, rating, note)"
               "VALUES (:user_id, :movie_id, :rating, :note)")
 ADD_MOVIE_COUNTRY = """
-    INSERT INTO movies_countries (movie_id, country_id)
+    INSERT OR IGNORE INTO movies_countries (movie_id, country_id)
     VALUES (:movie_id, :country_id)
 """
+# Batched inserts taking JSON arrays; rows that exist already are
+# ignored, so they can be retried. RETURNING yields the added rows only.
+ADD_MOVIES_OR_IGNORE = """
+    INSERT OR IGNORE INTO movies (imdb_id, title, year, image_url, imdb_rating)
+    SELECT
+        json_extract(value, '$.imdb_id'),
+        json_extract(value, '$.title'),
+        json_extract(value, '$.year'),
+        json_extract(value, '$.image_url'),
+        json_extract(value, '$.imdb_rating')
+    FROM json_each(:movies)
+    RETURNING id, imdb_id
+"""
+ADD_COUNTRIES_OR_IGNORE = """
+    INSERT OR IGNORE INTO countries (name, code)
+    SELECT json_extract(value, '$.name'), json_extract(value, '$.code')
+    FROM json_each(:countries)
+    RETURNING id, name, code
+"""
+# Links as JSON array of [movie_id, country_id] pairs
+ADD_MOVIES_COUNTRIES_OR_IGNORE = """
+    INSERT OR IGNORE INTO movies_countries (movie_id, country_id)
+    SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]')
+    FROM json_each(:links)
+"""
 # ---------------------------------------------------------------------
 # READ
 # ---------------------------------------------------------------------
@@ -185,6 +245,119 @@ GET_MOVIE_BY_IMDBID = """
     FROM movies
     WHERE movies.imdb_id = :imdb_id
 """
+# The user's movies with optional filters, sort order and page.
+# The placeholders are filled by database.build_movies_query().
+GET_MOVIES_FILTERED = """
+    SELECT
+        movies.id,
+        movies.imdb_id,
+        movies.title,
+        movies.year,
+        movies.image_url,
+        movies.imdb_rating,
+        ratings.rating,
+        ratings.note
+    FROM ratings
+    JOIN
+        movies ON ratings.movie_id = movies.id
+    WHERE ratings.user_id = :user_id{conditions}
+    ORDER BY {order_by}
+    LIMIT :limit OFFSET :offset
+"""
+# Filter conditions for GET_MOVIES_FILTERED by parameter name
+MOVIE_FILTERS = {
+    "min_rating": "ratings.rating >= :min_rating",
+    "year_start": "movies.year >= :year_start",
+    "year_end": "movies.year <= :year_end",
+    # casefold() is added by database.add_sql_functions.
+    "title": r"casefold(movies.title) LIKE :title ESCAPE '\'",
+    "country": """EXISTS (
+        SELECT 1 FROM movies_countries
+        JOIN
+            countries ON movies_countries.country_id = countries.id
+        WHERE movies_countries.movie_id = movies.id
+            AND (countries.name = :country COLLATE NOCASE
+                 OR countries.code = UPPER(:country)))""",
+}
+# Count of the movies matching the filters of GET_MOVIES_FILTERED
+COUNT_MOVIES_FILTERED = """
+    SELECT COUNT(*)
+    FROM ratings
+    JOIN
+        movies ON ratings.movie_id = movies.id
+    WHERE ratings.user_id = :user_id{conditions}
+"""
+# Ids and ratings of the user's movies matching the filters of
+# GET_MOVIES_FILTERED, e.g. to pick movies at random
+GET_MOVIE_IDS_FILTERED = """
+    SELECT ratings.movie_id, ratings.rating
+    FROM ratings
+    JOIN
+        movies ON ratings.movie_id = movies.id
+    WHERE ratings.user_id = :user_id{conditions}
+"""
+# A single movie with the user's rating and note
+GET_RATED_MOVIE = """
+    SELECT
+        movies.id,
+        movies.imdb_id,
+        movies.title,
+        movies.year,
+        movies.image_url,
+        movies.imdb_rating,
+        ratings.rating,
+        ratings.note
+    FROM ratings
+    JOIN
+        movies ON ratings.movie_id = movies.id
+    WHERE ratings.user_id = :user_id AND ratings.movie_id = :movie_id
+"""
+# Keyset conditions to continue after the last movie of a page, by
+# operator ('>' ascending, '<' descending). SQLite sorts NULLs first
+# in ascending order, and a row value comparison with NULL is never
+# true, so movies with a NULL sort value are matched explicitly.
+KEYSET_AFTER = {
+    ">": "({sort_column}, ratings.movie_id) > (:after_value, :after_id)",
+    "<": """(({sort_column}, ratings.movie_id) < (:after_value, :after_id)
+             OR {sort_column} IS NULL)""",
+}
+# ... if the last movie's sort value is NULL
+KEYSET_AFTER_NULL = {
+    ">": "({sort_column} IS NOT NULL OR ratings.movie_id > :after_id)",
+    "<": "({sort_column} IS NULL AND ratings.movie_id < :after_id)",
+}
+KEYSET_AFTER_ID = "ratings.movie_id {operator} :after_id"
+# Sort columns for GET_MOVIES_FILTERED; ties are sorted by movie id.
+MOVIE_SORT_COLUMNS = {
+    "rating": "ratings.rating",
+    "year": "movies.year",
+    "title": "movies.title COLLATE NOCASE",
+}
+# Movies for a list of imdb ids passed as a JSON array
+GET_MOVIES_BY_IMDBIDS = """
+    SELECT
+        movies.id,
+        movies.imdb_id,
+        movies.title,
+        movies.year,
+        movies.image_url,
+        movies.imdb_rating
+    FROM movies
+    WHERE movies.imdb_id IN (SELECT value FROM json_each(:imdb_ids))
+"""
+# Movies for a list of movie ids passed as a JSON array
+GET_MOVIES_BY_IDS = """
+    SELECT
+        movies.id,
+        movies.imdb_id,
+        movies.title,
+        movies.year,
+        movies.image_url,
+        movies.imdb_rating
+    FROM movies
+    WHERE movies.id IN (SELECT value FROM json_each(:movie_ids))
+"""
+GET_ALL_COUNTRIES = "SELECT id, name, code FROM countries"
 GET_COUNTRY_BY_CODE = "SELECT * FROM countries WHERE code = :code"
 GET_COUNTRY_BY_NAME = "SELECT * FROM countries WHERE name = :name"
 GET_COUNTRY_BY_ID = "SELECT * FROM countries WHERE id = :id"
@@ -197,6 +370,26 @@ GET_COUNTRIES_FOR_MOVIE = """
     WHERE movies.id = :id
         
 """
+# Countries for a list of movie ids passed as a JSON array
+GET_COUNTRIES_FOR_MOVIES = """
+    SELECT
+        movies_countries.movie_id,
+        countries.id,
+        countries.name,
+        countries.code
+    FROM movies_countries
+    JOIN
+        countries ON movies_countries.country_id = countries.id
+    WHERE movies_countries.movie_id IN (SELECT value FROM json_each(:movie_ids))
+    ORDER BY countries.name
+"""
+# Country ids for a list of movie ids passed as a JSON array
+# (read from the index on movies_countries only)
+GET_COUNTRY_IDS_FOR_MOVIES = """
+    SELECT movie_id, country_id
+    FROM movies_countries
+    WHERE movie_id IN (SELECT value FROM json_each(:movie_ids))
+"""
 GET_RATING = """
     SELECT * FROM ratings
     WHERE user_id = :user_id AND movie_id = :movie_id
@@ -205,6 +398,11 @@ GET_RATING = """
 # UPDATE
 # ---------------------------------------------------------------------
 UPDATE_USER = ""
+UPDATE_USER_PASSWORD_HASH = """
+    UPDATE users
+    SET password_hash = :password_hash
+    WHERE id = :id
+"""
 UPDATE_MOVIE = """
     UPDATE movies 
     SET imdb_id = :imdb_id, title = :title, year = :year, image_url = :image_url, imdb_rating = :imdb_rating
@@ -226,4 +424,52 @@ DELETE_RATING = """
 # ---------------------------------------------------------------------
 # COUNT
 # ---------------------------------------------------------------------
+# All users' ratings, e.g. to build the recommendation model
+GET_ALL_RATINGS = "SELECT user_id, movie_id, rating FROM ratings"
+# Changes with almost every change of the ratings table, also by other
+# processes (read from the index on (user_id, rating, movie_id) only)
+GET_RATINGS_FINGERPRINT = """
+    SELECT COUNT(*), MAX(rowid), TOTAL(rating) FROM ratings"""
+GET_USER_RATINGS_FINGERPRINT = """
+    SELECT COUNT(*), MAX(rowid), TOTAL(rating) FROM ratings
+    WHERE user_id = :user_id"""
 COUNT_RATINGS_FOR_USER = "SELECT COUNT(*) FROM ratings WHERE user_id = :user_id"
+# ---------------------------------------------------------------------
+# MAINTENANCE
+# ---------------------------------------------------------------------
+# Run without a transaction (see database.autocommit)
+INTEGRITY_CHECK = "PRAGMA integrity_check"
+QUICK_CHECK = "PRAGMA quick_check"
+FOREIGN_KEY_CHECK = "PRAGMA foreign_key_check"
+ANALYZE = "ANALYZE"
+# Analyze tables whose statistics are missing or outdated;
+# 0x10000 includes tables not used by this connection (SQLite >= 3.46).
+OPTIMIZE = "PRAGMA optimize = 0x10002"
+GET_STATISTICS_TABLE = """
+    SELECT name FROM sqlite_master
+    WHERE type = 'table' AND name = 'sqlite_stat1'"""
+GET_AUTO_VACUUM = "PRAGMA auto_vacuum"
+# Takes effect with the next VACUUM on the same connection
+SET_AUTO_VACUUM_INCREMENTAL = "PRAGMA auto_vacuum = INCREMENTAL"
+INCREMENTAL_VACUUM = "PRAGMA incremental_vacuum"
+VACUUM = "VACUUM"
+GET_PAGE_SIZE = "PRAGMA page_size"
+GET_PAGE_COUNT = "PRAGMA page_count"
+GET_FREELIST_COUNT = "PRAGMA freelist_count"
+# Pages and bytes of every table and index (needs the dbstat table)
+GET_OBJECT_SIZES = """
+    SELECT dbstat.name,
+           COALESCE(sqlite_master.type, 'table') AS type,
+           COALESCE(sqlite_master.tbl_name, dbstat.name) AS table_name,
+           dbstat.pageno AS pages,
+           dbstat.pgsize AS size,
+           dbstat.unused
+    FROM dbstat
+    LEFT JOIN sqlite_master ON sqlite_master.name = dbstat.name
+    WHERE dbstat.aggregate = TRUE
+    ORDER BY dbstat.pgsize DESC"""
+# Tables and indexes without sizes, if dbstat isn't available
+GET_SCHEMA_OBJECTS = """
+    SELECT name, type, tbl_name AS table_name FROM sqlite_master
+    WHERE type IN ('table', 'index')
+    ORDER BY tbl_name, type DESC, name"""
@@ -0,0 +1,172 @@
+"""Check, analyze and compact the database.
+
+run_maintenance runs the steps below on one connection outside
+a transaction and returns a report with the duration of every step:
+
+- integrity: PRAGMA integrity_check (or the faster quick_check)
+  and PRAGMA foreign_key_check
+- analyze: ANALYZE if the database has no statistics yet (or if
+  requested), else PRAGMA optimize, which only analyzes tables whose
+  statistics are missing or outdated
+- vacuum: 'incremental' returns the free pages to the file system if
+  the database uses incremental auto-vacuum; 'full' rebuilds the file
+  with VACUUM and switches it to incremental auto-vacuum, so later
+  runs can free pages without rewriting the whole file
+- size: page size, page count, free pages and file size, and the pages
+  and bytes of every table and index (from the dbstat table if SQLite
+  was compiled with it)
+
+A step that fails (e.g. because another process locks the database)
+is reported with its error; the remaining steps still run.
+"""
+from time import perf_counter
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from myapp.db import database as db
+from myapp.db import db_queries
+from myapp.db import query_stats
+
+VACUUM_MODES = ("none", "incremental", "full")
+# Value of PRAGMA auto_vacuum for incremental auto-vacuum
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def get_value(query):
+    """Return the single value returned by the query."""
+    return db.query_database(query, params={})[0][0]
+
+
+def get_page_counts() -> dict:
+    """Return page size, page count, free pages and file size."""
+    return {"page_size": get_value(db_queries.GET_PAGE_SIZE),
+            "page_count": get_value(db_queries.GET_PAGE_COUNT),
+            "free_pages": get_value(db_queries.GET_FREELIST_COUNT),
+            "file_bytes": db.db_path.stat().st_size}
+
+
+def check_integrity(quick=False) -> dict:
+    """Return the problems found by the integrity and foreign key checks."""
+    query = db_queries.QUICK_CHECK if quick else db_queries.INTEGRITY_CHECK
+    messages = [message for message,
+                in db.query_database(query, params={})]
+    violations = [{"table": table, "rowid": rowid, "parent": parent,
+                   "foreign_key": foreign_key}
+                  for table, rowid, parent, foreign_key
+                  in db.query_database(db_queries.FOREIGN_KEY_CHECK,
+                                       params={})]
+    errors = [message for message in messages if message != "ok"]
+    return {"ok": not errors and not violations,
+            "check": "quick_check" if quick else "integrity_check",
+            "errors": errors,
+            "foreign_key_violations": violations}
+
+
+def analyze(full=False) -> dict:
+    """Update the query planner's statistics and return the mode used."""
+    if full or not db.query_database(db_queries.GET_STATISTICS_TABLE,
+                                     params={}):
+        db.modify_database(db_queries.ANALYZE, params={})
+        return {"mode": "analyze"}
+    db.query_database(db_queries.OPTIMIZE, params={})
+    return {"mode": "optimize"}
+
+
+def vacuum(mode="incremental") -> dict:
+    """Free unused pages as given by mode (see VACUUM_MODES)
+    and return the pages and bytes before and after.
+    """
+    if mode not in VACUUM_MODES:
+        raise ValueError(f"Unknown vacuum mode: {mode}")
+    before = get_page_counts()
+    result = {"mode": mode}
+    if mode == "full":
+        db.modify_database(db_queries.SET_AUTO_VACUUM_INCREMENTAL, params={})
+        db.modify_database(db_queries.VACUUM, params={})
+    elif mode == "incremental":
+        if get_value(db_queries.GET_AUTO_VACUUM) != AUTO_VACUUM_INCREMENTAL:
+            result["skipped"] = ("auto_vacuum is not incremental; "
+                                 "run a full vacuum once")
+        elif before["free_pages"]:
+            free_pages()
+    after = get_page_counts()
+    result.update({"freed_pages": before["page_count"] - after["page_count"],
+                   "freed_bytes": before["file_bytes"] - after["file_bytes"],
+                   "before": before,
+                   "after": after})
+    return result
+
+
+def free_pages():
+    """Return all free pages to the file system (incremental auto-vacuum).
+
+    Every step of the statement frees one page, but SQLAlchemy closes
+    statements without result columns after the first step, so the
+    statement is run to the end on the DBAPI cursor.
+    """
+    query = db_queries.INCREMENTAL_VACUUM
+    start = perf_counter()
+    cursor = db.current_connection.get().connection.cursor()
+    try:
+        steps = len(cursor.execute(query).fetchall())
+    finally:
+        cursor.close()
+    query_stats.record(query, perf_counter() - start, steps)
+
+
+def get_object_sizes() -> list[dict]:
+    """Return the pages and bytes of every table and index, largest
+    first, or only their names if dbstat isn't available.
+    """
+    try:
+        rows = db.query_database(db_queries.GET_OBJECT_SIZES, params={})
+    except SQLAlchemyError:
+        rows = db.query_database(db_queries.GET_SCHEMA_OBJECTS, params={})
+    return [row._asdict() for row in rows]
+
+
+def get_size_report() -> dict:
+    """Return the page counts and the sizes of all tables and indexes."""
+    report = get_page_counts()
+    objects = get_object_sizes()
+    report["tables"] = [entry for entry in objects if entry["type"] == "table"]
+    report["indexes"] = [entry for entry in objects if entry["type"] == "index"]
+    return report
+
+
+def run_step(name, func, *args) -> dict:
+    """Run func and return its result with the step's name and duration.
+
+    A database error ends the step and is reported as its result.
+    """
+    start = perf_counter()
+    try:
+        result = func(*args)
+    except SQLAlchemyError as e:
+        result = {"ok": False, "error": str(getattr(e, "orig", None) or e)}
+    return {"step": name,
+            "ms": round((perf_counter() - start) * 1000, 1),
+            **result}
+
+
+def run_maintenance(vacuum_mode="incremental", full_analyze=False,
+                    quick=False, checks=True) -> dict:
+    """Run the maintenance steps and return the report.
+
+    'ok' is False if a check found problems or a step failed.
+    """
+    if vacuum_mode not in VACUUM_MODES:
+        raise ValueError(f"Unknown vacuum mode: {vacuum_mode}")
+    start = perf_counter()
+    steps = []
+    with db.autocommit():
+        if checks:
+            steps.append(run_step("integrity", check_integrity, quick))
+        steps.append(run_step("analyze", analyze, full_analyze))
+        if vacuum_mode != "none":
+            steps.append(run_step("vacuum", vacuum, vacuum_mode))
+        steps.append(run_step("size", get_size_report))
+    return {"ok": all(step.get("ok", True) for step in steps),
+            "database": str(db.db_path),
+            "total_ms": round((perf_counter() - start) * 1000, 1),
+            "steps": steps}
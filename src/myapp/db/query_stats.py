@@ -0,0 +1,127 @@
+"""Collect timing statistics for the queries sent to the database.
+
+Main features:
+- per statement timing, call and row counts, named after db_queries
+- per action query counters (e.g. one CLI menu action)
+- slow query log written to a rotating file
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from time import perf_counter
+
+from myapp.db import db_queries
+
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+SLOW_QUERY_LOG_PATH = (PROJECT_ROOT / "data" / "slow_queries.log").resolve()
+# Queries taking longer than this are written to the slow query log.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG_MAX_BYTES = 1_000_000
+SLOW_QUERY_LOG_BACKUPS = 3
+# Map every query string to its constant's name in db_queries
+# (queries built at runtime are added by register_statement).
+STATEMENT_NAMES = {value: name for name, value in vars(db_queries).items()
+                   if name.isupper() and isinstance(value, str) and value}
+
+statement_stats = {}
+action_stats = {}
+current_action = ContextVar("current_action", default=None)
+stats_lock = threading.Lock()
+slow_query_logger = logging.getLogger("myapp.db.slow_queries")
+
+
+def register_statement(query, name):
+    """Report the query, built at runtime, under the given name."""
+    with stats_lock:
+        STATEMENT_NAMES.setdefault(query, name)
+
+
+def get_statement_name(query):
+    """Return the db_queries name of a query or a shortened query."""
+    name = STATEMENT_NAMES.get(query)
+    if name:
+        return name
+    return " ".join(query.split())[:60]
+
+
+def setup_slow_query_log():
+    """Attach the rotating file handler on first use."""
+    if slow_query_logger.handlers:
+        return
+    SLOW_QUERY_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(SLOW_QUERY_LOG_PATH,
+                                  maxBytes=SLOW_QUERY_LOG_MAX_BYTES,
+                                  backupCount=SLOW_QUERY_LOG_BACKUPS,
+                                  encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.WARNING)
+    slow_query_logger.propagate = False
+
+
+def record(query, elapsed, row_count):
+    """Record the execution of a query taking 'elapsed' seconds."""
+    name = get_statement_name(query)
+    with stats_lock:
+        stats = statement_stats.setdefault(
+            name, {"calls": 0, "total_s": 0.0, "max_s": 0.0, "rows": 0})
+        stats["calls"] += 1
+        stats["total_s"] += elapsed
+        stats["max_s"] = max(stats["max_s"], elapsed)
+        stats["rows"] += max(row_count, 0)
+    action = current_action.get()
+    if action is not None:
+        action["queries"] += 1
+        action["query_s"] += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        setup_slow_query_log()
+        action_name = action["name"] if action else "-"
+        slow_query_logger.warning("%s took %.1f ms, %d rows (action: %s)",
+                                  name, elapsed * 1000, row_count, action_name)
+
+
+@contextmanager
+def track_action(name):
+    """Count the queries issued while running the named action."""
+    action = {"name": name, "queries": 0, "query_s": 0.0}
+    token = current_action.set(action)
+    start = perf_counter()
+    try:
+        yield action
+    finally:
+        current_action.reset(token)
+        elapsed = perf_counter() - start
+        with stats_lock:
+            stats = action_stats.setdefault(
+                name, {"runs": 0, "queries": 0, "query_s": 0.0, "total_s": 0.0,
+                       "last_queries": 0})
+            stats["runs"] += 1
+            stats["queries"] += action["queries"]
+            stats["query_s"] += action["query_s"]
+            stats["total_s"] += elapsed
+            stats["last_queries"] = action["queries"]
+
+
+def get_top_statements(n=10) -> list[tuple[str, dict]]:
+    """Return the n statements with the highest total time."""
+    with stats_lock:
+        items = [(name, dict(stats)) for name, stats in statement_stats.items()]
+    return sorted(items, key=lambda item: item[1]["total_s"], reverse=True)[:n]
+
+
+def get_action_stats() -> list[tuple[str, dict]]:
+    """Return query statistics per action, most queries first."""
+    with stats_lock:
+        items = [(name, dict(stats)) for name, stats in action_stats.items()]
+    return sorted(items, key=lambda item: item[1]["queries"], reverse=True)
+
+
+def reset():
+    """Forget all collected statistics."""
+    with stats_lock:
+        statement_stats.clear()
+        action_stats.clear()
@@ -0,0 +1,191 @@
+"""Keep the queries of db_queries as prebuilt SQLAlchemy statements.
+
+Each query string is turned into a TextClause once, with declared types
+for its bind parameters and, for known SELECTs, its result columns.
+Executing the same clause object lets SQLAlchemy reuse the compiled
+form from the engine's statement cache instead of parsing the SQL again.
+
+All bind parameters must have a declared type in PARAM_TYPES; unknown
+names are reported when the module is imported.
+"""
+import threading
+
+from sqlalchemy import bindparam, column, text
+from sqlalchemy.types import NULLTYPE, Float, Integer, String
+
+from myapp.db import db_queries
+from myapp.db import query_stats
+
+# Types of all bind parameter names used in db_queries
+PARAM_TYPES = {
+    "id": Integer,
+    "user_id": Integer,
+    "movie_id": Integer,
+    "country_id": Integer,
+    "user_name": String,
+    "first_name": String,
+    "last_name": String,
+    "password_hash": String,
+    "imdb_id": String,
+    "title": String,
+    # Year and IMDb rating may hold text from OMDB ('' or 'N/A'),
+    # which Integer / Float would try to convert.
+    "year": NULLTYPE,
+    "image_url": String,
+    "imdb_rating": NULLTYPE,
+    "rating": Float,
+    "note": String,
+    "name": String,
+    "code": String,
+    "min_rating": Float,
+    "year_start": Integer,
+    "year_end": Integer,
+    "country": String,
+    "limit": Integer,
+    "offset": Integer,
+    "after_id": Integer,
+    # Value of the sort column (rating, year or title)
+    "after_value": NULLTYPE,
+    # JSON arrays of movie ids / imdb ids
+    "movie_ids": String,
+    "imdb_ids": String,
+    # JSON arrays of movies, countries and [movie_id, country_id] links
+    "movies": String,
+    "countries": String,
+    "links": String,
+}
+USER_COLUMNS = (("id", Integer), ("user_name", String),
+                ("first_name", String), ("last_name", String),
+                ("password_hash", String))
+MOVIE_COLUMNS = (("id", Integer), ("imdb_id", String), ("title", String),
+                 ("year", NULLTYPE), ("image_url", String),
+                 ("imdb_rating", NULLTYPE))
+RATED_MOVIE_COLUMNS = MOVIE_COLUMNS + (("rating", Float), ("note", String))
+COUNTRY_COLUMNS = (("id", Integer), ("name", String), ("code", String))
+# Result columns of the SELECT statements by name
+RESULT_COLUMNS = {
+    "GET_USER_BY_USERNAME": USER_COLUMNS,
+    "GET_USER_BY_ID": USER_COLUMNS,
+    "GET_MOVIES": RATED_MOVIE_COLUMNS,
+    "GET_MOVIES_FILTERED": RATED_MOVIE_COLUMNS,
+    "GET_MOVIES_ALL_USERS": MOVIE_COLUMNS,
+    "GET_MOVIE_BY_TITLE": MOVIE_COLUMNS,
+    "GET_MOVIE_BY_ID": MOVIE_COLUMNS,
+    "GET_MOVIE_BY_IMDBID": MOVIE_COLUMNS,
+    "GET_MOVIES_BY_IMDBIDS": MOVIE_COLUMNS,
+    "GET_MOVIES_BY_IDS": MOVIE_COLUMNS,
+    "GET_ALL_COUNTRIES": COUNTRY_COLUMNS,
+    "GET_COUNTRY_BY_CODE": COUNTRY_COLUMNS,
+    "GET_COUNTRY_BY_NAME": COUNTRY_COLUMNS,
+    "GET_COUNTRY_BY_ID": COUNTRY_COLUMNS,
+    "GET_COUNTRIES_FOR_MOVIES": (("movie_id", Integer),) + COUNTRY_COLUMNS,
+    "GET_COUNTRY_IDS_FOR_MOVIES": (("movie_id", Integer),
+                                   ("country_id", Integer)),
+    "ADD_COUNTRY_RETURNING_ID": (("id", Integer),),
+    "ADD_MOVIES_OR_IGNORE": (("id", Integer), ("imdb_id", String)),
+    "ADD_COUNTRIES_OR_IGNORE": COUNTRY_COLUMNS,
+    "GET_INDEX": (("name", String),),
+    "GET_RATING": (("rating", Float), ("user_id", Integer),
+                   ("movie_id", Integer), ("note", String)),
+    "COUNT_RATINGS_FOR_USER": (("count", Integer),),
+    "GET_ALL_RATINGS": (("user_id", Integer), ("movie_id", Integer),
+                        ("rating", Float)),
+    "GET_RATINGS_FINGERPRINT": (("count", Integer), ("max_rowid", Integer),
+                                ("total", Float)),
+    "GET_USER_RATINGS_FINGERPRINT": (("count", Integer),
+                                     ("max_rowid", Integer),
+                                     ("total", Float)),
+    "COUNT_MOVIES_FILTERED": (("count", Integer),),
+    "GET_MOVIE_IDS_FILTERED": (("movie_id", Integer), ("rating", Float)),
+    "GET_RATED_MOVIE": RATED_MOVIE_COLUMNS,
+    "GET_OBJECT_SIZES": (("name", String), ("type", String),
+                         ("table_name", String), ("pages", Integer),
+                         ("size", Integer), ("unused", Integer)),
+    "GET_SCHEMA_OBJECTS": (("name", String), ("type", String),
+                           ("table_name", String)),
+}
+# Limit for statements built at runtime (e.g. filter combinations)
+MAX_STATEMENTS = 1000
+
+
+class StatementRegistryError(BaseException):
+    """Raised when a statement uses an undeclared bind parameter."""
+
+
+class Statement:
+    """A prebuilt statement with its number of executions."""
+    __slots__ = ("name", "sql", "clause", "executions")
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.clause = build_clause(name, sql)
+        self.executions = 0
+
+
+statements = {}
+statements_lock = threading.Lock()
+
+
+def build_clause(name, sql):
+    """Return the TextClause for sql with typed parameters and columns."""
+    clause = text(sql)
+    unknown = sorted(set(clause._bindparams) - set(PARAM_TYPES))
+    if unknown:
+        raise StatementRegistryError(f"{name}: undeclared parameter(s) "
+                                     f"{', '.join(unknown)}")
+    clause = clause.bindparams(*(bindparam(param, type_=PARAM_TYPES[param])
+                                 for param in clause._bindparams))
+    if name in RESULT_COLUMNS:
+        clause = clause.columns(*(column(column_name, column_type)
+                                  for column_name, column_type
+                                  in RESULT_COLUMNS[name]))
+    return clause
+
+
+def register(sql, name):
+    """Build and register the statement for sql and return it."""
+    statement = Statement(name, sql)
+    with statements_lock:
+        if len(statements) < MAX_STATEMENTS:
+            statement = statements.setdefault(sql, statement)
+    return statement
+
+
+def get(sql) -> Statement:
+    """Return the registered statement for sql,
+    registering statements built at runtime on first use.
+    """
+    statement = statements.get(sql)
+    if statement is None:
+        statement = register(sql, query_stats.get_statement_name(sql))
+    return statement
+
+
+def count_execution(statement):
+    """Count one execution of the statement."""
+    with statements_lock:
+        statement.executions += 1
+
+
+def get_execution_counts() -> dict[str, int]:
+    """Return the number of executions per statement name."""
+    counts = {}
+    with statements_lock:
+        for statement in statements.values():
+            counts[statement.name] = (counts.get(statement.name, 0)
+                                      + statement.executions)
+    return counts
+
+
+def register_queries():
+    """Register all query constants of db_queries.
+
+    Templates with placeholders are registered once they are filled in.
+    """
+    for name, sql in vars(db_queries).items():
+        if name.isupper() and isinstance(sql, str) and sql and "{" not in sql:
+            register(sql, name)
+
+
+register_queries()
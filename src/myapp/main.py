@@ -1,4 +1,28 @@
 """Command line interface to manage a movie database."""
+import argparse
+import sys
+
+from myapp.cli import headless
+from myapp.cli import profiling
 from myapp.cli.cli import run_cli_with_input_listener
 
+
+def parse_args():
+    """Return the parsed command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profile", action="store_true",
+                        help="profile every menu action with cProfile "
+                             "and tracemalloc")
+    parser.add_argument("--profile-dir",
+                        help="folder for the profiling results "
+                             "(default: data/profiles)")
+    headless.add_subcommands(parser)
+    return parser.parse_args()
+
+
+args = parse_args()
+if args.command:
+    sys.exit(headless.run_command(args))
+if args.profile or args.profile_dir:
+    profiling.enable(args.profile_dir)
 run_cli_with_input_listener()
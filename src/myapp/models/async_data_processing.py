@@ -0,0 +1,188 @@
+"""Provide preprocessed data from the database as coroutines.
+
+Async counterparts of the CRUD functions in 'data_processing', built on
+the 'async_database' module. They return the same row objects and keep
+the ratings versions of 'data_processing' up to date, so caches stay
+valid no matter which layer changed a rating.
+"""
+from myapp.db import async_database as db
+from myapp.models import data_processing
+from myapp.models.rows import (User,
+                               Movie,
+                               RatedMovie,
+                               Rating,
+                               Country,
+                               MovieCollection)
+
+
+def transaction():
+    """Return an async context manager running the enclosed calls
+    on one database connection in a single transaction.
+    """
+    return db.transaction()
+
+
+# ---------------------------------------------------------------------
+# CRUD OPERATIONS
+# ---------------------------------------------------------------------
+async def get_user(search_value, find_by_id=False) -> User | None:
+    """Return a user object for the given 'id' or 'user_name'."""
+    if find_by_id:
+        params = {"id": search_value}
+    else:
+        params = {"user_name": search_value}
+    user = await db.get_user(params)
+    if user:
+        return User(*user[0])
+    return None
+
+
+async def add_user(user_name, password_hash, first_name="",
+                   last_name="") -> int:
+    """Add a user to the database and return the user id."""
+    params = {'user_name': user_name,
+              'first_name': first_name,
+              'last_name': last_name,
+              'password_hash': password_hash}
+    await db.add_user(params)
+    return (await get_user(user_name)).id
+
+
+async def get_movies(user_id=None) -> MovieCollection:
+    """Return a collection of movies indexed by imdb_id for the given user.
+
+    If user id is None return all movies (without rating and note).
+    """
+    if user_id:
+        movies = await db.get_movies({"user_id": user_id})
+    else:
+        movies = await db.get_movies()
+    return MovieCollection(RatedMovie(*movie) for movie in movies)
+
+
+async def find_movies(user_id, order_by=None, descending=False, limit=None,
+                      offset=0, after=None, **filters) -> MovieCollection:
+    """Return the user's movies matching the filters, sorted in SQL.
+
+    See data_processing.find_movies for filters and pagination.
+    """
+    params = {"user_id": user_id, "limit": limit, "offset": offset,
+              **filters}
+    if after is not None:
+        params["after_id"] = after.movie_id
+        params["after_value"] = after[order_by] if order_by else None
+    movies = await db.find_movies(params, order_by, descending)
+    return MovieCollection(RatedMovie(*movie) for movie in movies)
+
+
+async def count_movies(user_id, **filters) -> int:
+    """Return the number of the user's movies matching the filters."""
+    params = {"user_id": user_id, **filters}
+    return (await db.count_movies(params))[0][0]
+
+
+async def get_movie(search_value, find_by_id=False) -> Movie:
+    """Return a movie object for the given 'id' or 'imdb_id'."""
+    if find_by_id:
+        params = {"id": search_value}
+    else:
+        params = {"imdb_id": search_value}
+    return Movie(*(await db.get_movie(params))[0])
+
+
+async def get_country_by_name(search_string) -> Country:
+    """Return a country object for the given search value."""
+    country = await db.get_country({"name": search_string})
+    if country:
+        country_id, name, code = country[0]
+        return Country(country_id, name, code,
+                       data_processing.get_country_emoji(name))
+    return data_processing.generate_country(search_string)
+
+
+async def get_countries_for_movie(movie_id) -> list[Country]:
+    """Return a list of country objects for the given movie id."""
+    countries = await db.get_countries_for_movie({"id": movie_id})
+    countries_list = [Country(country[0],
+                              country[1],
+                              country[2],
+                              data_processing.get_country_emoji(country[1]))
+                      for country in countries]
+    return sorted(countries_list, key=lambda item: item.name)
+
+
+async def get_country_emojis_for_movies(movie_ids) -> dict[int, list]:
+    """Return the country emojis for each of the given movie ids
+    with a single query.
+    """
+    emojis = {movie_id: [] for movie_id in movie_ids}
+    countries = await db.get_countries_for_movies({"movie_ids": list(emojis)})
+    for movie_id, _, name, _ in countries:
+        emojis[movie_id].append(data_processing.get_country_emoji(name))
+    return emojis
+
+
+async def add_country(name, code):
+    """Add country to the database and return the id."""
+    await db.add_country({"name": name, "code": code})
+    return (await get_country_by_name(name)).id
+
+
+async def add_movie_country_relationship(movie_id, country_id):
+    """Add movie-country relationship to the database."""
+    await db.add_movie_country_relationship({"movie_id": movie_id,
+                                             "country_id": country_id})
+
+
+async def add_movie(imdb_id, title, year, image_url, imdb_rating):
+    """Add movie to the database and return the id."""
+    params = {"imdb_id": imdb_id,
+              "title": title,
+              "year": year,
+              "image_url": image_url,
+              "imdb_rating": imdb_rating}
+    await db.add_movie(params)
+    return (await get_movie(imdb_id)).id
+
+
+async def get_rating(user_id, movie_id) -> Rating | None:
+    """Return the user's rating for a movie."""
+    params = {"user_id": user_id, "movie_id": movie_id}
+    rating = await db.get_rating(params)
+    if rating:
+        return Rating(*rating[0])
+    return None
+
+
+async def add_rating(user_id, movie_id, rating, note=""):
+    """Add movie rating to the database."""
+    params = {"user_id": user_id,
+              "movie_id": movie_id,
+              "rating": rating,
+              "note": note
+              }
+    await db.add_rating(params)
+    data_processing.bump_ratings_version(user_id)
+
+
+async def delete_rating(user_id, movie_id):
+    """Delete rating for a movie from the database."""
+    await db.delete_rating({"user_id": user_id, "movie_id": movie_id})
+    data_processing.bump_ratings_version(user_id)
+
+
+async def update_rating(user_id, movie_id, rating, note):
+    """Update rating for a movie in the database."""
+    params = {"user_id": user_id,
+              "movie_id": movie_id,
+              "rating": rating,
+              "note": note
+              }
+    await db.update_rating(params)
+    data_processing.bump_ratings_version(user_id)
+
+
+async def count_movie_ratings_for_user(user_id):
+    """Return the number of rated movies for the given user id."""
+    result = await db.count_ratings_for_user({"user_id": user_id})
+    return result[0][0]
@@ -0,0 +1,144 @@
+"""Provide a columnar snapshot of a user's movie library.
+
+The snapshot stores movie ids, years, ratings and IMDb ratings in NumPy
+arrays, so filtering, sorting and statistics run vectorized instead of
+calling a Python function per movie. Snapshots are cached per user
+(the SNAPSHOT_CACHE_SIZE most recently used) and rebuilt lazily after
+the user's ratings have changed. Changes by other processes are found
+by checking the ratings table at most every SNAPSHOT_CHECK_INTERVAL
+seconds (see data_processing.RatingsStamp).
+
+NumPy is optional: if it isn't installed, is_available() returns False
+and callers fall back to plain Python.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from myapp.models import data_processing
+
+# Number of cached snapshots (least recently used are dropped)
+SNAPSHOT_CACHE_SIZE = int(os.environ.get("MYAPP_SNAPSHOT_CACHE_SIZE", 64))
+# Seconds until a snapshot is checked for changes by other processes
+SNAPSHOT_CHECK_INTERVAL = float(
+    os.environ.get("MYAPP_SNAPSHOT_CHECK_INTERVAL", 5))
+
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def is_available():
+    """Return True if NumPy is installed."""
+    return np is not None
+
+
+def to_float(value):
+    """Return value as float or NaN for missing values like 'N/A'."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class RatingsSnapshot:
+    """Column arrays for the movies of one user's library.
+
+    Position i of every array belongs to movies.at(i).
+    """
+    __slots__ = ("movies", "movie_ids", "years", "ratings", "imdb_ratings",
+                 "imdb_ids", "titles")
+
+    def __init__(self, movies):
+        self.movies = movies
+        rows = movies.values()
+        count = len(rows)
+        self.movie_ids = np.fromiter((row.movie_id for row in rows),
+                                     dtype=np.int64, count=count)
+        self.years = np.fromiter((to_float(row.year) for row in rows),
+                                 dtype=np.float64, count=count)
+        self.ratings = np.fromiter((to_float(row.rating) for row in rows),
+                                   dtype=np.float64, count=count)
+        self.imdb_ratings = np.fromiter((to_float(row.imdb_rating)
+                                         for row in rows),
+                                        dtype=np.float64, count=count)
+        self.imdb_ids = np.array(list(movies), dtype=object)
+        self.titles = np.array([row.title for row in rows], dtype=object)
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def filter_mask(self, min_rating=None, year_start=None, year_end=None):
+        """Return a boolean array of the movies matching all conditions."""
+        mask = np.ones(len(self), dtype=bool)
+        if min_rating:
+            mask &= self.ratings >= min_rating
+        if year_start is not None:
+            mask &= self.years >= year_start
+        if year_end is not None:
+            mask &= self.years <= year_end
+        return mask
+
+    def argsort(self, column, reverse=False, mask=None):
+        """Return the positions of the movies sorted by a column.
+
+        Equal values keep their library order, like sorted() does.
+        """
+        positions = np.arange(len(self))
+        if mask is not None:
+            positions = positions[mask]
+        values = getattr(self, column)[positions]
+        if reverse:
+            values = -values
+        return positions[np.argsort(values, kind="stable")]
+
+    def select(self, positions) -> dict:
+        """Return the movies at the positions as a dictionary by imdb_id."""
+        movies = self.movies.movies
+        return {movies[i].imdb_id: movies[i] for i in positions.tolist()}
+
+    def average_rating(self):
+        """Return the average rating."""
+        return float(np.nanmean(self.ratings))
+
+    def median_rating(self):
+        """Return the median rating."""
+        return float(np.nanmedian(self.ratings))
+
+    def best_or_worst_movies(self, get_best=True) -> list:
+        """Return the imdb_ids of the best / worst rated movie(s)."""
+        if get_best:
+            extreme = np.nanmax(self.ratings)
+        else:
+            extreme = np.nanmin(self.ratings)
+        return list(self.imdb_ids[self.ratings == extreme])
+
+
+def get_snapshot(user_id) -> RatingsSnapshot:
+    """Return the cached snapshot for the user,
+    rebuilding it if the user's ratings have changed.
+    """
+    with _snapshots_lock:
+        cached = _snapshots.get(user_id)
+        if cached is not None:
+            _snapshots.move_to_end(user_id)
+    if cached is not None and cached[0].is_current(SNAPSHOT_CHECK_INTERVAL):
+        return cached[1]
+    stamp = data_processing.RatingsStamp(user_id)
+    snapshot = RatingsSnapshot(data_processing.get_movies(user_id))
+    with _snapshots_lock:
+        _snapshots[user_id] = (stamp, snapshot)
+        _snapshots.move_to_end(user_id)
+        while len(_snapshots) > SNAPSHOT_CACHE_SIZE:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def clear_snapshots():
+    """Drop all cached snapshots."""
+    with _snapshots_lock:
+        _snapshots.clear()
@@ -0,0 +1,142 @@
+"""Keep the small countries table in memory.
+
+All countries are loaded with one query on first use and kept with
+their flag emoji, indexed by id, name and code, so resolving countries
+costs no database round trips. Countries added by this process are
+written through (see add_country); a lookup that misses reloads the
+table, so countries added by other processes are found as well. Misses
+reload the table at most once per MIN_RELOAD_INTERVAL, so repeated
+lookups of unknown values don't read the table every time.
+"""
+import functools
+import threading
+from time import monotonic
+
+import pycountry
+
+from myapp.db import database as db
+from myapp.models.rows import Country
+
+INDEX_FIELDS = ("id", "name", "code")
+# Seconds between reloads of the table caused by lookup misses
+MIN_RELOAD_INTERVAL = 1.0
+
+# Countries by field name and value, None until loaded
+_indexes = None
+# Time of the last load (monotonic clock)
+_loaded_at = 0.0
+_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1024)
+def get_country_emoji(country_name):
+    """Return the country flag emoji for a country."""
+    try:
+        return pycountry.countries.lookup(country_name).flag
+    except LookupError:
+        return country_name
+
+
+def load_countries():
+    """Read all countries from the database into the indexes."""
+    global _indexes, _loaded_at
+    countries = [Country(country_id, name, code, get_country_emoji(name))
+                 for country_id, name, code in db.get_all_countries()]
+    indexes = {field: {country[field]: country for country in countries}
+               for field in INDEX_FIELDS}
+    with _lock:
+        _indexes = indexes
+        _loaded_at = monotonic()
+
+
+def can_reload() -> bool:
+    """Return whether the last load is older than MIN_RELOAD_INTERVAL."""
+    return monotonic() - _loaded_at >= MIN_RELOAD_INTERVAL
+
+
+def lookup(field, value) -> Country | None:
+    """Return the country with the field's value, reloading on a miss
+    unless the table was loaded within MIN_RELOAD_INTERVAL.
+    """
+    indexes = _indexes
+    country = indexes[field].get(value) if indexes is not None else None
+    if country is None and (indexes is None or can_reload()):
+        load_countries()
+        country = _indexes[field].get(value)
+    return country
+
+
+def get_country(country_id) -> Country | None:
+    """Return the country with the id."""
+    return lookup("id", country_id)
+
+
+def get_country_by_name(name) -> Country | None:
+    """Return the country with the exact name."""
+    return lookup("name", name)
+
+
+def get_country_by_code(code) -> Country | None:
+    """Return the country with the code."""
+    return lookup("code", code)
+
+
+def get_cached_country(name) -> Country | None:
+    """Return the country with the exact name without reloading."""
+    if _indexes is None:
+        load_countries()
+    return _indexes["name"].get(name)
+
+
+def add_country(name, code) -> Country:
+    """Add the country to the database and the indexes."""
+    country_id = db.add_country({"name": name, "code": code})
+    country = Country(country_id, name, code, get_country_emoji(name))
+    store_countries([country])
+    return country
+
+
+def add_countries(countries) -> dict[str, Country]:
+    """Return the countries for (name, code) pairs by name, adding
+    the missing ones to the database with one statement.
+
+    A country whose name or code exists already is resolved to the
+    stored country, so the call can be retried.
+    """
+    countries = dict(countries)
+    found = {name: country for name in countries
+             if (country := get_cached_country(name)) is not None}
+    missing = [{"name": name, "code": code}
+               for name, code in countries.items() if name not in found]
+    if not missing:
+        return found
+    added = [Country(country_id, name, code, get_country_emoji(name))
+             for country_id, name, code
+             in db.add_countries({"countries": missing})]
+    store_countries(added)
+    found.update((country.name, country) for country in added)
+    if len(found) < len(countries):
+        # Added by another process or existing under another name
+        load_countries()
+        for name, code in countries.items():
+            if name not in found:
+                found[name] = (_indexes["name"].get(name)
+                               or _indexes["code"].get(code))
+    return found
+
+
+def store_countries(countries):
+    """Add countries written to the database to the indexes."""
+    with _lock:
+        if _indexes is None:
+            return
+        for country in countries:
+            for field in INDEX_FIELDS:
+                _indexes[field][country[field]] = country
+
+
+def clear_countries():
+    """Drop the indexes; they are reloaded on next use."""
+    global _indexes
+    with _lock:
+        _indexes = None
@@ -1,18 +1,51 @@
 """Provide preprocessed data retrieved from database and API.
 
-Designed to work without relying on traditional object-oriented
-programming or SQLAlchemy's ORM.
+Designed to work without relying on SQLAlchemy's ORM. Records are
+returned as compact row objects defined in the 'rows' module.
 """
+import threading
+from contextlib import contextmanager
+from time import monotonic
+
 import pycountry
 from myapp.db import database as db
+from myapp.models import countries as country_cache
+from myapp.models.rows import (User,
+                               Movie,
+                               RatedMovie,
+                               Rating,
+                               Country,
+                               MovieCollection)
 
 YEAR_STR_LENGTH = 4
+# Columns of the movies table set by add_movies_with_countries
+MOVIE_FIELDS = ("imdb_id", "title", "year", "image_url", "imdb_rating")
+# Incremented on every rating change, so caches can tell stale data.
+ratings_versions = {}
+# Incremented on rating changes of any user
+all_ratings_version = 0
+# Guards the version counters against concurrent updates
+_versions_lock = threading.Lock()
 
 
 # ---------------------------------------------------------------------
 # CRUD OPERATIONS
 # ---------------------------------------------------------------------
-def get_user(search_value, find_by_id=False) -> dict:
+@contextmanager
+def transaction():
+    """Run the enclosed calls on one database connection
+    in a single transaction.
+    """
+    try:
+        with db.transaction() as connection:
+            yield connection
+    except BaseException:
+        # Countries added in the rolled back transaction don't exist.
+        country_cache.clear_countries()
+        raise
+
+
+def get_user(search_value, find_by_id=False) -> User | None:
     """Return a user object for the given 'id' or 'user_name'."""
     if find_by_id:
         params = {"id": search_value}
@@ -20,15 +53,8 @@ def get_user(search_value, find_by_id=False) -> dict:
         params = {"user_name": search_value}
     user = db.get_user(params)
     if user:
-        user = user[0]
-        user_object = {"id": user[0],
-                       "user_name": user[1],
-                       "first_name": user[2],
-                        "last_name": user[3],
-                        "password_hash": user[4]
-                        }
-        return user_object
-    return {}
+        return User(*user[0])
+    return None
 
 
 def add_user(user_name, password_hash, first_name="", last_name="") -> int:
@@ -38,109 +64,126 @@ def add_user(user_name, password_hash, first_name="", last_name="") -> int:
               'last_name': last_name,
               'password_hash': password_hash}
     db.add_user(params)
-    return get_user(user_name)["id"]
+    return get_user(user_name).id
 
 
-def get_movies(user_id=None):
-    """Return a dictionary of movie dictionaries for the given user.
+def update_password_hash(user_id, password_hash):
+    """Replace the user's password hash, e.g. after rehashing."""
+    params = {"id": user_id, "password_hash": password_hash}
+    db.update_user_password_hash(params)
 
-    If user id is None return all movies.
+
+def get_movies(user_id=None) -> MovieCollection:
+    """Return a collection of movies indexed by imdb_id for the given user.
+
+    If user id is None return all movies (without rating and note).
     """
     params = {"user_id": user_id}
     if user_id:
         movies = db.get_movies(params)
-        # movie[1] corresponds to 'imdb_id', main key for the sub dictionary
-        movies_dict = {movie[1]: {"movie_id": movie[0],
-                                  "title": movie[2],
-                                  "year": movie[3],
-                                  "image_url": movie[4],
-                                  "imdb_rating": movie[5],
-                                  "rating": movie[6],
-                                  "note": movie[7]}
-                       for movie in movies}
     else:
         movies = db.get_movies()
-        movies_dict = {movie[1]: {"movie_id": movie[0],
-                                  "title": movie[2],
-                                  "year": movie[3],
-                                  "image_url": movie[4],
-                                  "imdb_rating": movie[5]}
-                       for movie in movies}
-    return movies_dict
+    return MovieCollection(RatedMovie(*movie) for movie in movies)
+
+
+def find_movies(user_id, order_by=None, descending=False, limit=None,
+                offset=0, after=None, **filters) -> MovieCollection:
+    """Return the user's movies matching the filters, sorted in SQL.
+
+    Filters: min_rating, year_start, year_end, title (substring)
+    and country (name or code). Sort by 'rating', 'year' or 'title'.
+    Pass the last movie of a page as 'after' to get the following page.
+    """
+    params = {"user_id": user_id, "limit": limit, "offset": offset,
+              **filters}
+    if after is not None:
+        params["after_id"] = after.movie_id
+        params["after_value"] = after[order_by] if order_by else None
+    movies = db.find_movies(params, order_by, descending)
+    return MovieCollection(RatedMovie(*movie) for movie in movies)
+
+
+def count_movies(user_id, **filters) -> int:
+    """Return the number of the user's movies matching the filters."""
+    params = {"user_id": user_id, **filters}
+    return db.count_movies(params)[0][0]
+
+
+def find_movie_ids(user_id, **filters) -> list[tuple]:
+    """Return (movie_id, rating) of the user's movies matching
+    the filters of find_movies.
+    """
+    params = {"user_id": user_id, **filters}
+    return [tuple(movie) for movie in db.find_movie_ids(params)]
+
 
+def get_rated_movie(user_id, movie_id) -> RatedMovie | None:
+    """Return the movie with the user's rating, or None if not rated."""
+    params = {"user_id": user_id, "movie_id": movie_id}
+    movies = db.get_rated_movie(params)
+    return RatedMovie(*movies[0]) if movies else None
 
-def get_movie(search_value, find_by_id=False) -> dict:
+
+def get_movie(search_value, find_by_id=False) -> Movie:
     """Return a movie object for the given 'id' or 'imdb_id'."""
     if find_by_id:
         params = {"id": search_value}
     else:
         params = {"imdb_id": search_value}
-    movie = db.get_movie(params)[0]
-    movie_object = {"id": movie[0],
-                    "imdb_id": movie[1],
-                    "title": movie[2],
-                    "year": movie[3],
-                    "image_url": movie[4],
-                    "imdb_rating": movie[5]
-                    }
-    return movie_object
+    return Movie(*db.get_movie(params)[0])
 
 
-def get_country_by_name(search_string):
+def get_country_by_name(search_string) -> Country:
     """Return a country object for the given search value."""
-    # Retrieve country object from database...
-    params = {"name": search_string}
-    country = db.get_country(params)
-    if country:
-        country = country[0]
-        # Extract attributes
-        country_id = country[0]
-        name = country[1]
-        code = country[2]
-        emoji = get_country_emoji(name)
-        country_dict = {"id": country_id,
-                        "name": name,
-                        "code": code,
-                        "emoji": emoji
-                        }
+    # Retrieve country object from the in-memory countries table...
+    country = country_cache.get_country_by_name(search_string)
+    if country is not None:
+        return country
     # ...or generate a new one using the 'pycountry' module.
-    else:
-        # Use temporary id to tag newly generated country object.
-        temp_id = -1
-        try:
-            country = pycountry.countries.lookup(search_string)
-            name = country.name
-            code = country.alpha_2
-            emoji = country.flag
-        except LookupError:
-            name = search_string
-            code = search_string
-            emoji = search_string
-        country_dict = {"id": temp_id,
-                        "name": name,
-                        "code": code,
-                        "emoji": emoji
-                        }
-    return country_dict
-
-
-def get_countries_for_movie(movie_id):
+    return generate_country(search_string)
+
+
+def generate_country(search_string) -> Country:
+    """Return a new country object (not yet in the database)."""
+    # Use temporary id to tag newly generated country object.
+    temp_id = -1
+    try:
+        country = pycountry.countries.lookup(search_string)
+        name = country.name
+        code = country.alpha_2
+        emoji = country.flag
+    except LookupError:
+        name = search_string
+        code = search_string
+        emoji = search_string
+    return Country(temp_id, name, code, emoji)
+
+
+def get_countries_for_movie(movie_id) -> list[Country]:
     """Return a list of country objects for the given movie id."""
-    params = {"id": movie_id}
-    countries = db.get_countries_for_movie(params)
-    countries_list = [{"id": country[0],
-                       "name": country[1],
-                       "code": country[2],
-                       "emoji": get_country_emoji(country[1])
-                       } for country in countries]
-    return sorted(countries_list, key=lambda item: item["name"])
+    return get_countries_for_movies([movie_id])[movie_id]
+
+
+def get_countries_for_movies(movie_ids) -> dict[int, list[Country]]:
+    """Return the country objects for each of the given movie ids
+    with a single query.
+    """
+    countries_by_movie = {movie_id: [] for movie_id in movie_ids}
+    country_ids = db.get_country_ids_for_movies(
+        {"movie_ids": list(countries_by_movie)})
+    for movie_id, country_id in country_ids:
+        country = country_cache.get_country(country_id)
+        # Skip links to countries that no longer exist.
+        if country is not None:
+            countries_by_movie[movie_id].append(country)
+    for countries in countries_by_movie.values():
+        countries.sort(key=lambda country: country.name)
+    return countries_by_movie
 
 
 def add_country(name, code):
     """Add country to the database and return the id."""
-    params = {"name": name, "code": code}
-    db.add_country(params)
-    return get_country_by_name(name)["id"]
+    return country_cache.add_country(name, code).id
 
 
 def add_movie_country_relationship(movie_id, country_id):
@@ -157,24 +200,84 @@ def add_movie(imdb_id, title, year, image_url, imdb_rating):
               "image_url": image_url,
               "imdb_rating": imdb_rating}
     db.add_movie(params)
-    return get_movie(imdb_id)["id"]
+    return get_movie(imdb_id).id
+
+
+def get_movies_by_imdb_ids(imdb_ids) -> dict[str, Movie]:
+    """Return the movies found for the imdb ids by imdb_id."""
+    movies = db.get_movies_by_imdb_ids({"imdb_ids": list(imdb_ids)})
+    return {movie[1]: Movie(*movie) for movie in movies}
+
 
+def get_movies_by_ids(movie_ids) -> dict[int, Movie]:
+    """Return the movies found for the movie ids by id."""
+    movies = db.get_movies_by_ids({"movie_ids": list(movie_ids)})
+    return {movie[0]: Movie(*movie) for movie in movies}
 
-def get_rating(user_id, movie_id):
+
+def add_movie_with_countries(imdb_id, title, year, image_url, imdb_rating,
+                             countries) -> int:
+    """Add a movie with its countries in one transaction
+    and return the movie id (see add_movies_with_countries).
+    """
+    movie = {"imdb_id": imdb_id,
+             "title": title,
+             "year": year,
+             "image_url": image_url,
+             "imdb_rating": imdb_rating,
+             "countries": countries}
+    return add_movies_with_countries([movie])[imdb_id]
+
+
+def add_movies_with_countries(movies) -> dict[str, int]:
+    """Add movies with their countries in one transaction
+    and return the movie ids by imdb id.
+
+    Every movie is a dict with imdb_id, title, year, image_url,
+    imdb_rating and a list of country names. Movies, countries and
+    links are each written with one statement; rows that exist
+    already are kept, so the call can be retried.
+    """
+    movies = list(movies)
+    countries = {}
+    for movie in movies:
+        for country_name in movie["countries"]:
+            if country_name not in countries:
+                countries[country_name] = get_country_by_name(country_name)
+    with transaction():
+        movie_ids = {imdb_id: movie_id for movie_id, imdb_id in db.add_movies(
+            {"movies": [{field: movie[field] for field in MOVIE_FIELDS}
+                        for movie in movies]})}
+        existing = [movie["imdb_id"] for movie in movies
+                    if movie["imdb_id"] not in movie_ids]
+        if existing:
+            movie_ids.update((imdb_id, movie.id) for imdb_id, movie
+                             in get_movies_by_imdb_ids(existing).items())
+        # New countries have the temporary id -1.
+        added = country_cache.add_countries(
+            (country.name, country.code) for country in countries.values()
+            if country.id == -1)
+        country_ids = {country_name: (added[country.name].id
+                                      if country.id == -1 else country.id)
+                       for country_name, country in countries.items()}
+        links = dict.fromkeys((movie_ids[movie["imdb_id"]],
+                               country_ids[country_name])
+                              for movie in movies
+                              for country_name in movie["countries"])
+        if links:
+            db.add_movie_country_relationships({"links": list(links)})
+    return movie_ids
+
+
+def get_rating(user_id, movie_id) -> Rating | None:
     """Return the user's rating for a movie."""
     params = {"user_id": user_id,
               "movie_id": movie_id
               }
-    rating_obj = db.get_rating(params)
-    rating_obj = rating_obj[0]
-    rating = rating_obj[0]
-    note = rating_obj[-1]
-    rating_dict = {"rating": rating,
-                   "user_id": user_id,
-                   "movie_id": movie_id,
-                   "note": note
-                   }
-    return rating_dict
+    rating = db.get_rating(params)
+    if rating:
+        return Rating(*rating[0])
+    return None
 
 
 def add_rating(user_id, movie_id, rating, note=""):
@@ -185,6 +288,38 @@ def add_rating(user_id, movie_id, rating, note=""):
               "note": note
               }
     db.add_rating(params)
+    bump_ratings_version(user_id)
+
+
+def rate_movies(user_id, ratings) -> tuple[int, int]:
+    """Add or update the user's ratings given as
+    (movie_id, rating, note) tuples and return the number
+    of added and updated ratings.
+
+    All ratings are written in one transaction with one
+    statement execution each for new and existing ratings.
+    """
+    with transaction():
+        rated_movie_ids = {movie.movie_id
+                           for movie in get_movies(user_id).values()}
+        new_ratings = []
+        updated_ratings = []
+        for movie_id, rating, note in ratings:
+            params = {"user_id": user_id,
+                      "movie_id": movie_id,
+                      "rating": rating,
+                      "note": note}
+            if movie_id in rated_movie_ids:
+                updated_ratings.append(params)
+            else:
+                new_ratings.append(params)
+                rated_movie_ids.add(movie_id)
+        if new_ratings:
+            db.add_ratings(new_ratings)
+        if updated_ratings:
+            db.update_ratings(updated_ratings)
+    bump_ratings_version(user_id)
+    return len(new_ratings), len(updated_ratings)
 
 
 def delete_rating(user_id, movie_id):
@@ -193,6 +328,7 @@ def delete_rating(user_id, movie_id):
               "movie_id": movie_id
               }
     db.delete_rating(params)
+    bump_ratings_version(user_id)
 
 
 def update_rating(user_id, movie_id, rating, note):
@@ -203,6 +339,7 @@ def update_rating(user_id, movie_id, rating, note):
               "note": note
               }
     db.update_rating(params)
+    bump_ratings_version(user_id)
 
 
 # ---------------------------------------------------------------------
@@ -281,15 +418,90 @@ def is_valid_year(year: str) -> bool:
 
 def get_country_emojis_for_movie(movie_id):
     """Return list of country emojis for a given film."""
-    return [country["emoji"] for country in get_countries_for_movie(movie_id)]
+    return [country.emoji for country in get_countries_for_movie(movie_id)]
+
+
+def get_country_emojis_for_movies(movie_ids) -> dict[int, list]:
+    """Return the country emojis for each of the given movie ids
+    with a single query.
+    """
+    return {movie_id: [country.emoji for country in countries]
+            for movie_id, countries
+            in get_countries_for_movies(movie_ids).items()}
 
 
 def get_country_emoji(country_name):
     """Return the country flag emoji for a country."""
-    try:
-        return pycountry.countries.lookup(country_name).flag
-    except LookupError:
-        return country_name
+    return country_cache.get_country_emoji(country_name)
+
+
+def get_ratings_version(user_id):
+    """Return a number that changes whenever the user's ratings change."""
+    return ratings_versions.get(user_id, 0)
+
+
+def bump_ratings_version(user_id):
+    """Mark cached data derived from the user's ratings as stale."""
+    global all_ratings_version
+    with _versions_lock:
+        ratings_versions[user_id] = ratings_versions.get(user_id, 0) + 1
+        all_ratings_version += 1
+
+
+def get_all_ratings_version():
+    """Return a number that changes whenever any user's ratings change."""
+    return all_ratings_version
+
+
+def get_ratings_fingerprint() -> tuple:
+    """Return a value that changes with (almost) every change
+    of any user's ratings, also by other processes.
+    """
+    return tuple(db.get_ratings_fingerprint()[0])
+
+
+def get_user_ratings_fingerprint(user_id) -> tuple:
+    """Return a value that changes with (almost) every change
+    of the user's ratings, also by other processes.
+    """
+    params = {"user_id": user_id}
+    return tuple(db.get_user_ratings_fingerprint(params)[0])
+
+
+class RatingsStamp:
+    """The state of a user's ratings that cached data was derived from.
+
+    Take the stamp before reading the data, so changes made while
+    reading mark the data as stale.
+    """
+    __slots__ = ("user_id", "version", "fingerprint", "checked_at")
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.version = get_ratings_version(user_id)
+        self.fingerprint = get_user_ratings_fingerprint(user_id)
+        self.checked_at = monotonic()
+
+    def is_current(self, check_interval) -> bool:
+        """Return True if the ratings are unchanged.
+
+        Changes by this process are seen at once; the database is only
+        checked for changes by other processes once per check_interval
+        seconds.
+        """
+        if self.version != get_ratings_version(self.user_id):
+            return False
+        if monotonic() - self.checked_at < check_interval:
+            return True
+        if self.fingerprint != get_user_ratings_fingerprint(self.user_id):
+            return False
+        self.checked_at = monotonic()
+        return True
+
+
+def get_all_ratings() -> list[tuple]:
+    """Return (user_id, movie_id, rating) of all users' ratings."""
+    return [tuple(rating) for rating in db.get_all_ratings()]
 
 
 def count_movie_ratings_for_user(user_id):
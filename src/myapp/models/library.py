@@ -0,0 +1,137 @@
+"""Shared operations on a user's movie library for the frontends.
+
+The headless commands and the JSON API both use these helpers to
+serialize movies, compute rating statistics and recommendations and
+to add movies from OMDB. Errors a user can fix (e.g. a rating out of
+range or a movie unknown to OMDB) raise LibraryError; each frontend
+reports it in its own way. Failures of OMDB itself raise the subclasses
+OmdbUnavailableError and OmdbResponseError.
+"""
+import statistics
+
+import requests
+
+from myapp.api import api_client as api
+from myapp.models import columnar
+from myapp.models import data_processing
+from myapp.models import recommender
+
+MIN_RATING = 0
+MAX_RATING = 10
+
+
+class LibraryError(BaseException):
+    """Raised when an operation can't be completed."""
+
+
+class OmdbUnavailableError(LibraryError):
+    """Raised when the OMDB quota is used up or its circuit is open."""
+
+
+class OmdbResponseError(LibraryError):
+    """Raised when an OMDB request fails or its response can't be read."""
+
+
+def serialize_movies(movies) -> list[dict]:
+    """Return the movies as dictionaries with their country names."""
+    countries = data_processing.get_countries_for_movies(
+        [movie.movie_id for movie in movies.values()])
+    return [{**movie.to_dict(),
+             "countries": [country.name
+                           for country in countries[movie.movie_id]]}
+            for movie in movies.values()]
+
+
+def get_rating_stats(user_id) -> dict:
+    """Return count, average and median rating, best and worst movies
+    of the user.
+    """
+    if columnar.is_available():
+        snapshot = columnar.get_snapshot(user_id)
+        movies = snapshot.movies
+        if not movies:
+            return {"count": 0}
+        average = snapshot.average_rating()
+        median = snapshot.median_rating()
+        best = snapshot.best_or_worst_movies()
+        worst = snapshot.best_or_worst_movies(get_best=False)
+    else:
+        movies = data_processing.get_movies(user_id)
+        if not movies:
+            return {"count": 0}
+        ratings = [movie.rating for movie in movies.values()]
+        average = statistics.mean(ratings)
+        median = statistics.median(ratings)
+        best = [imdb_id for imdb_id, movie in movies.items()
+                if movie.rating == max(ratings)]
+        worst = [imdb_id for imdb_id, movie in movies.items()
+                 if movie.rating == min(ratings)]
+    return {"count": len(movies),
+            "average_rating": round(average, 1),
+            "median_rating": round(median, 1),
+            "best": [movies[imdb_id].to_dict() for imdb_id in best],
+            "worst": [movies[imdb_id].to_dict() for imdb_id in worst]}
+
+
+def get_recommendations(user_id, count) -> dict:
+    """Return the user's recommended movies with predicted ratings.
+
+    The predicted rating is None for movies recommended by popularity.
+    """
+    if not recommender.is_available():
+        raise LibraryError("Recommendations require NumPy.")
+    recommendations = recommender.recommend_movies(user_id, count)
+    countries = data_processing.get_countries_for_movies(
+        [movie.id for movie, _ in recommendations])
+    return {"movies": [{**movie.to_dict(),
+                        "predicted_rating": predicted_rating,
+                        "countries": [country.name
+                                      for country in countries[movie.id]]}
+                       for movie, predicted_rating in recommendations]}
+
+
+def check_rating(rating):
+    """Raise LibraryError if the rating is out of range."""
+    if not MIN_RATING <= rating <= MAX_RATING:
+        raise LibraryError(f"Rating must be between {MIN_RATING} "
+                           f"and {MAX_RATING} (inclusive).")
+
+
+def get_or_add_movie(imdb_id):
+    """Return the movie and whether it had to be fetched from OMDB."""
+    movie = data_processing.get_movies_by_imdb_ids([imdb_id]).get(imdb_id)
+    if movie is not None:
+        return movie, False
+    movie_id = data_processing.add_movies_with_countries(
+        [fetch_movie(imdb_id)])[imdb_id]
+    return data_processing.get_movie(movie_id, find_by_id=True), True
+
+
+def fetch_movie(imdb_id) -> dict:
+    """Return the movie's details from OMDB
+    for data_processing.add_movies_with_countries.
+    """
+    try:
+        movie_object_raw = api.fetch_movie_details(imdb_id)
+    except (api.QuotaExceededError, api.CircuitOpenError) as e:
+        raise OmdbUnavailableError(f"OMDB is not available: {e}") from None
+    except ValueError:
+        # Including requests' JSONDecodeError
+        raise OmdbResponseError("OMDB sent an invalid response.") from None
+    except requests.RequestException as e:
+        raise OmdbResponseError(f"OMDB request failed: "
+                                f"{api.describe_request_error(e)}") from None
+    if not movie_object_raw or movie_object_raw.get("Response") == "False":
+        raise LibraryError(f"Movie '{imdb_id}' not found on OMDB.")
+    try:
+        details = data_processing.std_extended_movie_object_from_api(
+            movie_object_raw)[imdb_id]
+    except (KeyError, AttributeError, TypeError) as e:
+        raise OmdbResponseError(f"OMDB sent an unexpected response "
+                                f"(missing {e}).") from None
+    return {"imdb_id": imdb_id,
+            "title": details["title"],
+            "year": details["year"],
+            "image_url": details["image_url"],
+            "imdb_rating": details["imdb_rating"],
+            "countries": details["country"]}
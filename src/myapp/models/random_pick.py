@@ -0,0 +1,168 @@
+"""Pick random movies from a user's library.
+
+Only the ids and ratings of the movies matching the filters are read
+from the database (filters as in data_processing.find_movies). They
+are cached per user and filter combination until the user's ratings
+change, so every further pick takes O(1): a random index, or with
+weighted=True a lookup in an alias table (Vose's method) built from
+the ratings. Changes by other processes are found by checking the
+ratings table at most every SAMPLER_CHECK_INTERVAL seconds (see
+data_processing.RatingsStamp).
+
+Movies picked recently (the last RECENT_PICKS per user in this
+process) are skipped until all matching movies have been picked.
+"""
+import os
+import random
+import threading
+from collections import OrderedDict, deque
+
+from myapp.models import data_processing
+
+# Recent picks per user that aren't picked again
+RECENT_PICKS = int(os.environ.get("MYAPP_RANDOM_RECENT_PICKS", 10))
+# Number of cached samplers (least recently used are dropped)
+SAMPLER_CACHE_SIZE = 64
+# Seconds until a sampler is checked for changes by other processes
+SAMPLER_CHECK_INTERVAL = float(
+    os.environ.get("MYAPP_RANDOM_CHECK_INTERVAL", 5))
+# Random draws per pick before recent picks are filtered out explicitly
+MAX_ATTEMPTS = 32
+
+_samplers = OrderedDict()
+_recent_picks = {}
+_lock = threading.Lock()
+
+
+class Sampler:
+    """Movie ids that can be drawn uniformly or weighted in O(1)."""
+
+    def __init__(self, movie_ids, weights=None):
+        self.movie_ids = list(movie_ids)
+        self.weights = None
+        self.probabilities = None
+        self.aliases = None
+        if weights is not None and sum(weights) > 0:
+            self.weights = list(weights)
+            self.build_alias_table(self.weights)
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def build_alias_table(self, weights):
+        """Split the weights into equally likely slots of two movies each.
+
+        Slot i holds movie i with probabilities[i] and aliases[i] else.
+        """
+        count = len(weights)
+        total = sum(weights)
+        scaled = [weight * count / total for weight in weights]
+        self.probabilities = [1.0] * count
+        self.aliases = list(range(count))
+        small = [i for i, weight in enumerate(scaled) if weight < 1]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+
+    def pick(self, rng) -> int:
+        """Return a random movie id."""
+        index = rng.randrange(len(self.movie_ids))
+        if (self.probabilities is not None
+                and rng.random() >= self.probabilities[index]):
+            index = self.aliases[index]
+        return self.movie_ids[index]
+
+    def without(self, excluded_ids):
+        """Return a sampler of the movies that aren't excluded."""
+        positions = [i for i, movie_id in enumerate(self.movie_ids)
+                     if movie_id not in excluded_ids]
+        weights = None
+        if self.weights is not None:
+            weights = [self.weights[i] for i in positions]
+        return Sampler([self.movie_ids[i] for i in positions], weights)
+
+
+def get_sampler(user_id, weighted=False, **filters) -> Sampler:
+    """Return the cached sampler for the user's movies matching
+    the filters, reading them anew if the ratings have changed.
+    """
+    filters = {name: value for name, value in filters.items()
+               if value is not None}
+    key = (user_id, weighted, tuple(sorted(filters.items())))
+    with _lock:
+        cached = _samplers.get(key)
+        if cached is not None:
+            _samplers.move_to_end(key)
+    if cached is not None and cached[0].is_current(SAMPLER_CHECK_INTERVAL):
+        return cached[1]
+    stamp = data_processing.RatingsStamp(user_id)
+    # A movie rated twice by the user is drawn with its last rating.
+    movies = dict(data_processing.find_movie_ids(user_id, **filters))
+    weights = ([max(rating, 0) for rating in movies.values()]
+               if weighted else None)
+    sampler = Sampler(movies, weights)
+    with _lock:
+        _samplers[key] = (stamp, sampler)
+        _samplers.move_to_end(key)
+        while len(_samplers) > SAMPLER_CACHE_SIZE:
+            _samplers.popitem(last=False)
+    return sampler
+
+
+def pick_movie_ids(user_id, count=1, weighted=False, exclude_recent=True,
+                   rng=None, **filters) -> list[int]:
+    """Return up to count different random movie ids of the user's
+    movies matching the filters.
+
+    With weighted=True movies are picked with a probability
+    proportional to their rating. Unless exclude_recent is False,
+    recently picked movies are skipped while others are left.
+    """
+    rng = rng or random
+    sampler = get_sampler(user_id, weighted, **filters)
+    with _lock:
+        recent = _recent_picks.setdefault(user_id,
+                                          deque(maxlen=RECENT_PICKS))
+        excluded = set(recent) if exclude_recent else set()
+    picks = []
+    # The sampler's movie ids are distinct.
+    while len(picks) < min(count, len(sampler)):
+        movie_id = next((movie_id for movie_id in
+                         (sampler.pick(rng) for _ in range(MAX_ATTEMPTS))
+                         if movie_id not in excluded), None)
+        if movie_id is None:
+            # Most candidates are excluded: draw from the others only.
+            remaining = sampler.without(excluded)
+            if not remaining:
+                # All were picked recently, so start over.
+                excluded = set(picks)
+                remaining = sampler.without(excluded)
+            movie_id = remaining.pick(rng)
+        picks.append(movie_id)
+        excluded.add(movie_id)
+    with _lock:
+        recent.extend(picks)
+    return picks
+
+
+def pick_movies(user_id, count=1, weighted=False, exclude_recent=True,
+                rng=None, **filters) -> list:
+    """Return up to count different random movies of the user
+    matching the filters (see pick_movie_ids).
+    """
+    movie_ids = pick_movie_ids(user_id, count, weighted, exclude_recent, rng,
+                               **filters)
+    movies = (data_processing.get_rated_movie(user_id, movie_id)
+              for movie_id in movie_ids)
+    return [movie for movie in movies if movie is not None]
+
+
+def clear_samplers():
+    """Drop all cached samplers and recent picks."""
+    with _lock:
+        _samplers.clear()
+        _recent_picks.clear()
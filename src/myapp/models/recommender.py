@@ -0,0 +1,303 @@
+"""Recommend movies from the ratings of all users.
+
+Item-based collaborative filtering: the model holds, for every movie
+rated by at least MIN_RATERS users, its NEIGHBORS most similar movies.
+Similarity is the cosine of the movies' rating columns after
+subtracting each user's mean rating (adjusted cosine). It is computed
+from the sparse ratings for BLOCK_SIZE movies at a time: every rating
+of a movie in the block is multiplied with all ratings of the same
+user and the products are summed per movie pair. The work grows with
+the sum of the squared number of ratings per user, memory only with
+BLOCK_SIZE x MAX_MOVIES (about 20 MB at the defaults) plus at most
+MAX_PAIRS rating pairs; the number of users doesn't matter.
+
+A user's unseen movies are scored by the similarity weighted
+deviations of the user's current ratings (see columnar.get_snapshot);
+missing slots are filled with popular movies.
+
+The model is built once and then rebuilt in a background thread when
+ratings have changed in this process and it is older than
+REBUILD_INTERVAL seconds, so requests never wait for a rebuild.
+Ratings written by other processes (e.g. the CLI while the API server
+runs) are detected by checking the ratings table every MAX_AGE seconds.
+
+NumPy is optional: if it isn't installed, is_available() returns False.
+"""
+import os
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from myapp.models import columnar
+from myapp.models import data_processing
+
+# Movies kept in the model (most rated first) and their neighbors
+MAX_MOVIES = int(os.environ.get("MYAPP_RECOMMENDER_MAX_MOVIES", 5000))
+NEIGHBORS = 50
+MIN_RATERS = 2
+# Seconds before a changed rating triggers a rebuild of the model
+REBUILD_INTERVAL = float(os.environ.get("MYAPP_RECOMMENDER_REBUILD_INTERVAL",
+                                        600))
+# Seconds after which the ratings table is checked for changes
+# made by other processes
+MAX_AGE = float(os.environ.get("MYAPP_RECOMMENDER_MAX_AGE", 3600))
+# Movies per block of the similarity computation
+BLOCK_SIZE = 512
+# Rating pairs multiplied at once (16 bytes each per array)
+MAX_PAIRS = 1 << 20
+DEFAULT_COUNT = 10
+
+_model = None
+_model_lock = threading.Lock()
+_rebuild_thread = None
+
+
+def is_available():
+    """Return True if NumPy is installed."""
+    return np is not None
+
+
+class ItemSimilarityModel:
+    """Nearest neighbors of every movie by rating similarity.
+
+    Row i of 'neighbors' and 'similarities' belongs to movie_ids[i];
+    neighbors hold row numbers, -1 where a movie has fewer neighbors.
+    """
+
+    def __init__(self, ratings, version=0, fingerprint=None):
+        self.version = version
+        self.fingerprint = fingerprint
+        # Time of the last build or check for changed ratings
+        self.checked_at = time.monotonic()
+        ratings = np.asarray(ratings, dtype=np.float64).reshape(-1, 3)
+        user_ids = ratings[:, 0].astype(np.int64)
+        movie_ids = ratings[:, 1].astype(np.int64)
+        values = ratings[:, 2]
+        # Keep the last rating of a movie rated twice by a user.
+        _, last = np.unique(np.stack((user_ids, movie_ids))[:, ::-1],
+                            axis=1, return_index=True)
+        last = np.sort(len(values) - 1 - last)
+        user_ids, movie_ids, values = (user_ids[last], movie_ids[last],
+                                       values[last])
+        # Keep the most rated movies.
+        unique_movies, movie_rows, raters = np.unique(
+            movie_ids, return_inverse=True, return_counts=True)
+        order = np.argsort(-raters, kind="stable")
+        order = order[raters[order] >= MIN_RATERS][:MAX_MOVIES]
+        self.movie_ids = unique_movies[order]
+        row_of_movie = np.full(len(unique_movies), -1, dtype=np.int64)
+        row_of_movie[order] = np.arange(len(order))
+        rows = row_of_movie[movie_rows]
+        kept = rows >= 0
+        self.rows_by_movie_id = dict(zip(self.movie_ids.tolist(),
+                                         range(len(self.movie_ids))))
+        # Mean rated movies first, for filling up recommendations.
+        sums = np.bincount(rows[kept], weights=values[kept],
+                           minlength=len(order))
+        counts = raters[order]
+        self.popularity = np.argsort(-(sums / counts) * np.log1p(counts),
+                                     kind="stable")
+        self.build_similarities(user_ids[kept], rows[kept], values[kept])
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def build_similarities(self, user_ids, rows, values):
+        """Compute the top NEIGHBORS similar movies of every movie."""
+        count = len(self)
+        _, user_rows = np.unique(user_ids, return_inverse=True)
+        user_count = int(user_rows.max()) + 1 if len(user_rows) else 0
+        # Subtract every user's mean rating and divide by the movie's norm.
+        user_sums = np.bincount(user_rows, weights=values, minlength=user_count)
+        user_counts = np.bincount(user_rows, minlength=user_count)
+        centered = values - (user_sums / np.maximum(user_counts, 1))[user_rows]
+        norms = np.sqrt(np.bincount(rows, weights=centered ** 2,
+                                    minlength=count))
+        norms[norms == 0] = 1
+        normalized = centered / norms[rows]
+        # Sort the ratings by user, so each user's ratings are a slice.
+        order = np.argsort(user_rows, kind="stable")
+        user_rows, rows, normalized = (user_rows[order], rows[order],
+                                       normalized[order])
+        user_starts = np.searchsorted(user_rows, np.arange(user_count))
+        neighbor_count = min(NEIGHBORS, max(count - 1, 0))
+        self.neighbors = np.full((count, neighbor_count), -1, dtype=np.int32)
+        self.similarities = np.zeros((count, neighbor_count), dtype=np.float32)
+        if neighbor_count == 0:
+            return
+        for start in range(0, count, BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, count)
+            in_block = np.flatnonzero((rows >= start) & (rows < end))
+            block = accumulate_products(
+                in_block, user_starts[user_rows[in_block]],
+                user_counts[user_rows[in_block]], rows, normalized,
+                start, end, count)
+            # A movie isn't its own neighbor.
+            block[np.arange(end - start), np.arange(start, end)] = -np.inf
+            top = np.argpartition(-block, neighbor_count - 1,
+                                  axis=1)[:, :neighbor_count]
+            top_similarities = np.take_along_axis(block, top, axis=1)
+            # Only positively correlated movies are neighbors.
+            top[top_similarities <= 0] = -1
+            top_similarities[top_similarities <= 0] = 0
+            self.neighbors[start:end] = top
+            self.similarities[start:end] = top_similarities
+
+    def recommend(self, rated_movie_ids, ratings, count=DEFAULT_COUNT):
+        """Return up to count (movie_id, score) pairs of unseen movies.
+
+        The score is the predicted rating; filled up popular movies
+        have a score of None.
+        """
+        rated_movie_ids = np.asarray(rated_movie_ids, dtype=np.int64)
+        ratings = np.asarray(ratings, dtype=np.float64)
+        valid = ~np.isnan(ratings)
+        rated_movie_ids, ratings = rated_movie_ids[valid], ratings[valid]
+        seen = np.zeros(len(self), dtype=bool)
+        rows = np.array([self.rows_by_movie_id.get(movie_id, -1)
+                         for movie_id in rated_movie_ids.tolist()],
+                        dtype=np.int64)
+        known = rows >= 0
+        seen[rows[known]] = True
+        results = []
+        if known.any():
+            mean = ratings.mean()
+            deviations = ratings[known] - mean
+            neighbors = self.neighbors[rows[known]]
+            similarities = self.similarities[rows[known]]
+            used = neighbors >= 0
+            candidates = neighbors[used]
+            weights = similarities[used]
+            contributions = (similarities * deviations[:, None])[used]
+            numerator = np.bincount(candidates, weights=contributions,
+                                    minlength=len(self))
+            denominator = np.bincount(candidates, weights=weights,
+                                      minlength=len(self))
+            scores = np.full(len(self), -np.inf)
+            has_score = (denominator > 0) & ~seen
+            scores[has_score] = (mean + numerator[has_score]
+                                 / denominator[has_score])
+            best_count = min(count, int(has_score.sum()))
+            if best_count:
+                best = np.argpartition(-scores, best_count - 1)[:best_count]
+                best = best[np.argsort(-scores[best], kind="stable")]
+                results = [(int(self.movie_ids[row]), round(float(scores[row]), 1))
+                           for row in best]
+                seen[best] = True
+        if len(results) < count:
+            popular = self.popularity[~seen[self.popularity]]
+            results += [(int(self.movie_ids[row]), None)
+                        for row in popular[:count - len(results)]]
+        return results
+
+
+def accumulate_products(entries, starts, counts, rows, values, start, end,
+                        movie_count):
+    """Return the similarity rows of the movies start to end - 1.
+
+    Each rating in entries (of a movie in the block) is multiplied
+    with all ratings of the same user, which are the counts ratings
+    from starts in the ratings sorted by user.
+    """
+    sums = np.zeros((end - start) * movie_count)
+    pair_ends = np.cumsum(counts)
+    first = 0
+    while first < len(entries):
+        # Take as many entries as fit into MAX_PAIRS pairs (at least one).
+        done = pair_ends[first - 1] if first else 0
+        last = max(first + 1, int(np.searchsorted(
+            pair_ends, done + MAX_PAIRS, side="right")))
+        chunk_counts = counts[first:last]
+        left = np.repeat(entries[first:last], chunk_counts)
+        positions = np.arange(len(left)) - np.repeat(
+            np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        right = np.repeat(starts[first:last], chunk_counts) + positions
+        sums += np.bincount((rows[left] - start) * movie_count + rows[right],
+                            weights=values[left] * values[right],
+                            minlength=len(sums))
+        first = last
+    return sums.reshape(end - start, movie_count)
+
+
+def build_model() -> ItemSimilarityModel:
+    """Build a model from all ratings in the database."""
+    version = data_processing.get_all_ratings_version()
+    fingerprint = data_processing.get_ratings_fingerprint()
+    return ItemSimilarityModel(data_processing.get_all_ratings(), version,
+                               fingerprint)
+
+
+def get_model() -> ItemSimilarityModel:
+    """Return the cached model, building it on first use.
+
+    Start a rebuild in the background if it is older than
+    REBUILD_INTERVAL and ratings have changed in this process since
+    it was built, or if it is older than MAX_AGE (see rebuild_model).
+    """
+    global _model
+    with _model_lock:
+        model = _model
+    if model is None:
+        with _model_lock:
+            if _model is None:
+                _model = build_model()
+            return _model
+    age = time.monotonic() - model.checked_at
+    if age >= REBUILD_INTERVAL and (
+            model.version != data_processing.get_all_ratings_version()
+            or age >= MAX_AGE):
+        start_rebuild()
+    return model
+
+
+def start_rebuild():
+    """Rebuild the model in a background thread unless one is running."""
+    global _rebuild_thread
+    with _model_lock:
+        if _rebuild_thread is not None and _rebuild_thread.is_alive():
+            return
+        _rebuild_thread = threading.Thread(target=rebuild_model, daemon=True,
+                                           name="recommender-rebuild")
+        _rebuild_thread.start()
+
+
+def rebuild_model():
+    """Replace the cached model with a new one, unless the ratings
+    in the database are unchanged.
+    """
+    global _model
+    with _model_lock:
+        model = _model
+    if (model is not None
+            and model.version == data_processing.get_all_ratings_version()
+            and model.fingerprint == data_processing.get_ratings_fingerprint()):
+        model.checked_at = time.monotonic()
+        return
+    model = build_model()
+    with _model_lock:
+        _model = model
+
+
+def clear_model():
+    """Drop the cached model."""
+    global _model
+    with _model_lock:
+        _model = None
+
+
+def recommend_movies(user_id, count=DEFAULT_COUNT) -> list[tuple]:
+    """Return up to count (movie, predicted rating) pairs for the user.
+
+    The predicted rating is None for movies recommended by popularity.
+    """
+    snapshot = columnar.get_snapshot(user_id)
+    recommendations = get_model().recommend(snapshot.movie_ids,
+                                            snapshot.ratings, count)
+    movies = data_processing.get_movies_by_ids(
+        movie_id for movie_id, _ in recommendations)
+    return [(movies[movie_id], score) for movie_id, score in recommendations
+            if movie_id in movies]
@@ -0,0 +1,142 @@
+"""Provide compact row objects for records read from the database.
+
+Rows use __slots__ instead of a dictionary per record, which saves
+memory and allocations for large libraries. Fields can be read as
+attributes (movie.title) or by name (movie["title"]), so code written
+for the former dictionaries keeps working. Iterating a row yields its
+values in field order, like a tuple; use to_dict for a dictionary.
+"""
+from collections.abc import Mapping
+
+
+class Row:
+    """Base class for slotted rows with item access by field name."""
+    __slots__ = ()
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}"
+                           for field in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+    def to_dict(self) -> dict:
+        """Return the row as a dictionary, e.g. for JSON output."""
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class User(Row):
+    """A record of the users table."""
+    __slots__ = ("id", "user_name", "first_name", "last_name", "password_hash")
+
+    def __init__(self, id, user_name, first_name, last_name, password_hash):
+        self.id = id
+        self.user_name = user_name
+        self.first_name = first_name
+        self.last_name = last_name
+        self.password_hash = password_hash
+
+
+class Movie(Row):
+    """A record of the movies table."""
+    __slots__ = ("id", "imdb_id", "title", "year", "image_url", "imdb_rating")
+
+    def __init__(self, id, imdb_id, title, year, image_url, imdb_rating):
+        self.id = id
+        self.imdb_id = imdb_id
+        self.title = title
+        self.year = year
+        self.image_url = image_url
+        self.imdb_rating = imdb_rating
+
+
+class RatedMovie(Row):
+    """A movie in a user's library together with the user's rating.
+
+    Rating and note are None for movies listed regardless of a user.
+    """
+    __slots__ = ("movie_id", "imdb_id", "title", "year", "image_url",
+                 "imdb_rating", "rating", "note")
+
+    def __init__(self, movie_id, imdb_id, title, year, image_url,
+                 imdb_rating, rating=None, note=None):
+        self.movie_id = movie_id
+        self.imdb_id = imdb_id
+        self.title = title
+        self.year = year
+        self.image_url = image_url
+        self.imdb_rating = imdb_rating
+        self.rating = rating
+        self.note = note
+
+
+class Rating(Row):
+    """A record of the ratings table."""
+    __slots__ = ("rating", "user_id", "movie_id", "note")
+
+    def __init__(self, rating, user_id, movie_id, note):
+        self.rating = rating
+        self.user_id = user_id
+        self.movie_id = movie_id
+        self.note = note
+
+
+class Country(Row):
+    """A record of the countries table with the country's flag emoji."""
+    __slots__ = ("id", "name", "code", "emoji")
+
+    def __init__(self, id, name, code, emoji):
+        self.id = id
+        self.name = name
+        self.code = code
+        self.emoji = emoji
+
+
+class MovieCollection(Mapping):
+    """An ordered collection of movies indexed by imdb_id.
+
+    It behaves like the former dictionary of movie dictionaries
+    and additionally supports access by position.
+    """
+    __slots__ = ("movies", "index")
+
+    def __init__(self, movies=()):
+        self.index = {movie.imdb_id: movie for movie in movies}
+        self.movies = list(self.index.values())
+
+    def __getitem__(self, imdb_id):
+        return self.index[imdb_id]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.movies)
+
+    def __contains__(self, imdb_id):
+        return imdb_id in self.index
+
+    def items(self):
+        return self.index.items()
+
+    def values(self):
+        return self.index.values()
+
+    def at(self, position) -> RatedMovie:
+        """Return the movie at the given position."""
+        return self.movies[position]
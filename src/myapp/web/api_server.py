@@ -0,0 +1,532 @@
+"""Serve users, movies, ratings and stats as a JSON HTTP API.
+
+Endpoints (all responses are JSON):
+- GET    /users/<name>                     user and number of ratings
+- GET    /users/<name>/movies              rated movies, with the query
+                                           parameters order_by, desc,
+                                           limit, offset, min_rating,
+                                           year_start, year_end, country
+                                           and title
+- GET    /users/<name>/stats               rating statistics
+- GET    /users/<name>/search?q=<term>     rated movies by title
+- GET    /users/<name>/recommendations     unrated movies predicted from
+                                           similar ratings (limit)
+- GET    /movies/<imdb_id>                 movie with its countries
+- PUT    /users/<name>/ratings/<imdb_id>   add or update a rating
+                                           ({"rating": ..., "note": ...})
+- DELETE /users/<name>/ratings/<imdb_id>   delete a rating
+- GET    /pages/<name>.html                the user's HTML page
+
+Errors are answered with {"error": ...}; unexpected exceptions are
+logged to stderr and answered with 500 Internal Server Error, failed
+OMDB requests with 502 Bad Gateway (logged without the API key).
+
+Read endpoints send an ETag and answer a matching If-None-Match with
+304 Not Modified. Write endpoints require HTTP basic authentication
+of the user in the path. User pages are served from 'page_cache'
+(gzip compressed if accepted) and also honor If-Modified-Since.
+
+Requests are handled by a fixed pool of worker threads sharing the
+queue pool of database connections. Start the server with:
+    python -m myapp.web.api_server --port 8000 --workers 8
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from myapp.api import api_client as api
+from myapp.auth import auth
+from myapp.db import database
+from myapp.models import data_processing
+from myapp.models import library
+from myapp.models import recommender
+from myapp.web import page_cache
+from myapp.web import render_user_page
+
+DEFAULT_HOST = os.environ.get("MYAPP_API_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.environ.get("MYAPP_API_PORT", 8000))
+# Worker threads handling requests (keep-alive connections occupy
+# a worker until they are closed or idle for CONNECTION_TIMEOUT)
+DEFAULT_WORKERS = int(os.environ.get("MYAPP_API_WORKERS", 8))
+CONNECTION_TIMEOUT = 5
+MAX_BODY_SIZE = 64 * 1024
+FILTER_TYPES = {"min_rating": float,
+                "year_start": int,
+                "year_end": int,
+                "country": str,
+                "title": str}
+
+
+class ApiError(BaseException):
+    """Raised to answer a request with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# ---------------------------------------------------------------------
+# ENDPOINTS
+# ---------------------------------------------------------------------
+def get_user_info(user, query) -> dict:
+    """Return the user without password hash and the number of ratings."""
+    return {"id": user.id,
+            "user_name": user.user_name,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "ratings": data_processing.count_movie_ratings_for_user(user.id)}
+
+
+def list_movies(user, query) -> dict:
+    """Return the user's movies matching the filters of the query."""
+    order_by = get_param(query, "order_by")
+    if order_by not in (None, "rating", "year", "title"):
+        raise ApiError(HTTPStatus.BAD_REQUEST,
+                       f"Can't sort by '{order_by}'.")
+    filters = {name: get_param(query, name, value_type)
+               for name, value_type in FILTER_TYPES.items()}
+    total = data_processing.count_movies(user.id, **filters)
+    movies = data_processing.find_movies(
+        user.id, order_by, get_param(query, "desc") in ("1", "true"),
+        limit=get_param(query, "limit", int),
+        offset=get_param(query, "offset", int) or 0,
+        **filters)
+    return {"total": total, "movies": library.serialize_movies(movies)}
+
+
+def get_stats(user, query) -> dict:
+    """Return the user's rating statistics."""
+    return library.get_rating_stats(user.id)
+
+
+def search_movies(user, query) -> dict:
+    """Return the user's movies with the search term in their title."""
+    term = get_param(query, "q")
+    if not term:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "Missing search term 'q'.")
+    total = data_processing.count_movies(user.id, title=term)
+    movies = data_processing.find_movies(
+        user.id, limit=get_param(query, "limit", int), title=term)
+    return {"total": total, "movies": library.serialize_movies(movies)}
+
+
+def get_recommendations(user, query) -> dict:
+    """Return movies the user hasn't rated, best predicted first."""
+    count = get_param(query, "limit", int) or recommender.DEFAULT_COUNT
+    try:
+        return library.get_recommendations(user.id, count)
+    except library.LibraryError as e:
+        raise ApiError(HTTPStatus.NOT_IMPLEMENTED, str(e)) from None
+
+
+def get_movie(imdb_id, query) -> dict:
+    """Return a movie with its countries."""
+    movie = get_movie_or_404(imdb_id)
+    countries = data_processing.get_countries_for_movie(movie.id)
+    return {**movie.to_dict(),
+            "countries": [country.name for country in countries]}
+
+
+def put_rating(user, imdb_id, body) -> tuple[int, dict]:
+    """Add or update the user's rating for a movie.
+
+    Movies that aren't in the database are fetched from OMDB.
+    """
+    try:
+        rating = float(body["rating"])
+        note = str(body.get("note", ""))
+        library.check_rating(rating)
+    except (KeyError, TypeError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST,
+                       "Expected {\"rating\": <0-10>, \"note\": ...}.") from None
+    except library.LibraryError as e:
+        raise ApiError(HTTPStatus.UNPROCESSABLE_ENTITY, str(e)) from None
+    try:
+        movie, _ = library.get_or_add_movie(imdb_id)
+    except library.OmdbUnavailableError as e:
+        raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, str(e)) from None
+    except library.OmdbResponseError as e:
+        raise ApiError(HTTPStatus.BAD_GATEWAY, str(e)) from None
+    except library.LibraryError as e:
+        raise ApiError(HTTPStatus.UNPROCESSABLE_ENTITY, str(e)) from None
+    added, _ = data_processing.rate_movies(user.id, [(movie.id, rating, note)])
+    status = HTTPStatus.CREATED if added else HTTPStatus.OK
+    return status, {"imdb_id": imdb_id, "movie_id": movie.id,
+                    "title": movie.title, "rating": rating, "note": note}
+
+
+def delete_rating(user, imdb_id, body) -> tuple[int, dict]:
+    """Delete the user's rating for a movie."""
+    movie = get_movie_or_404(imdb_id)
+    if data_processing.get_rating(user.id, movie.id) is None:
+        raise ApiError(HTTPStatus.NOT_FOUND,
+                       f"'{movie.title}' isn't rated by {user.user_name}.")
+    data_processing.delete_rating(user.id, movie.id)
+    return HTTPStatus.OK, {"imdb_id": imdb_id, "deleted": True}
+
+
+USER_ROUTES = {"": get_user_info,
+               "/movies": list_movies,
+               "/stats": get_stats,
+               "/search": search_movies,
+               "/recommendations": get_recommendations}
+RATING_ROUTES = {"PUT": put_rating,
+                 "DELETE": delete_rating}
+USER_PATH = re.compile(r"^/users/([^/]+)"
+                       r"(/movies|/stats|/search|/recommendations)?/?$")
+MOVIE_PATH = re.compile(r"^/movies/([^/]+)/?$")
+RATING_PATH = re.compile(r"^/users/([^/]+)/ratings/([^/]+)/?$")
+PAGE_PATH = re.compile(r"^/pages/([^/]+)\.html$")
+# Linked relatively by the page template
+STYLESHEET_PATH = "/pages/style.css"
+STYLESHEET_FILE = render_user_page.OUTPUT_PATH / "style.css"
+
+
+# ---------------------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------------------
+def get_param(query, name, value_type=str):
+    """Return the query parameter converted to value_type or None."""
+    values = query.get(name)
+    if not values or values[0] == "":
+        return None
+    try:
+        return value_type(values[0])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST,
+                       f"Invalid value for '{name}'.") from None
+
+
+def get_user_or_404(user_name):
+    """Return the user or raise ApiError."""
+    user = data_processing.get_user(user_name.lower())
+    if user is None:
+        raise ApiError(HTTPStatus.NOT_FOUND,
+                       f"User '{user_name}' does not exist.")
+    return user
+
+
+def get_movie_or_404(imdb_id):
+    """Return the movie or raise ApiError."""
+    movie = data_processing.get_movies_by_imdb_ids([imdb_id]).get(imdb_id)
+    if movie is None:
+        raise ApiError(HTTPStatus.NOT_FOUND,
+                       f"Movie '{imdb_id}' does not exist.")
+    return movie
+
+
+def check_credentials(user, authorization):
+    """Raise ApiError unless the basic auth header belongs to the user."""
+    try:
+        scheme, credentials = (authorization or "").split(" ", 1)
+        user_name, password = (base64.b64decode(credentials)
+                               .decode("utf-8").split(":", 1))
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        scheme = user_name = password = None
+    if (scheme is None or scheme.lower() != "basic"
+            or user_name.lower() != user.user_name
+            or not user.password_hash
+            or not auth.authenticate_user(user.user_name, password)):
+        raise ApiError(HTTPStatus.UNAUTHORIZED, "Authentication required.")
+
+
+def make_etag(content) -> str:
+    """Return a strong ETag for the response body."""
+    return f'"{hashlib.blake2b(content, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag) -> bool:
+    """Return True if the If-None-Match header matches the ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/")
+                    for tag in if_none_match.split(","))
+
+
+def is_not_modified(headers, etags, last_modified) -> bool:
+    """Return True if the conditional request headers match the
+    ETags or Last-Modified time (a Unix timestamp) of a resource.
+
+    If-Modified-Since is only used without If-None-Match.
+    """
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match:
+        return any(etag_matches(if_none_match, etag) for etag in etags)
+    if_modified_since = headers.get("If-Modified-Since")
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(last_modified) <= since
+
+
+def accepts_gzip(accept_encoding) -> bool:
+    """Return True if the Accept-Encoding header allows gzip."""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "x-gzip"):
+            continue
+        params = params.strip()
+        if not params.startswith("q="):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+# ---------------------------------------------------------------------
+# SERVER
+# ---------------------------------------------------------------------
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    """Route requests to the endpoint functions and send JSON."""
+    protocol_version = "HTTP/1.1"
+    timeout = CONNECTION_TIMEOUT
+    # Headers and body are written separately; without TCP_NODELAY
+    # every keep-alive response waits for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer a read request, or 304 if the ETag matches."""
+        self.handle_request(self.handle_read)
+
+    def handle_request(self, handler):
+        """Run the handler and answer errors with a JSON error message."""
+        try:
+            handler()
+        except ApiError as e:
+            self.send_json(e.status, {"error": e.message})
+        except requests.RequestException as e:
+            # The message of e holds the request URL with the API key.
+            print(f"Upstream request failed: "
+                  f"{api.describe_request_error(e)}", file=sys.stderr)
+            self.send_json(HTTPStatus.BAD_GATEWAY,
+                           {"error": "Upstream request failed."})
+        except Exception:  # pylint: disable=broad-exception-caught
+            traceback.print_exc()
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR,
+                           {"error": "Internal server error."})
+
+    def handle_read(self):
+        """Run the read endpoint and send its result."""
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if match := PAGE_PATH.match(url.path):
+            self.send_page(match.group(1))
+            return
+        if url.path == STYLESHEET_PATH:
+            self.send_stylesheet()
+            return
+        if match := USER_PATH.match(url.path):
+            user_name, route = match.groups()
+            user = get_user_or_404(user_name)
+            result = USER_ROUTES[route or ""](user, query)
+        elif match := MOVIE_PATH.match(url.path):
+            result = get_movie(match.group(1), query)
+        else:
+            raise ApiError(HTTPStatus.NOT_FOUND, "Unknown endpoint.")
+        content = self.encode(result)
+        etag = make_etag(content)
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(HTTPStatus.OK, content=content, etag=etag)
+
+    def send_page(self, user_name):
+        """Send the user's cached HTML page, compressed if accepted."""
+        page = page_cache.get_page(user_name)
+        if page is None:
+            raise ApiError(HTTPStatus.NOT_FOUND,
+                           f"User '{user_name}' does not exist.")
+        use_gzip = accepts_gzip(self.headers.get("Accept-Encoding"))
+        etag = page.gzip_etag if use_gzip else page.etag
+        if is_not_modified(self.headers, (page.etag, page.gzip_etag),
+                           page.last_modified):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            content = b""
+        else:
+            self.send_response(HTTPStatus.OK)
+            content = page.gzipped if use_gzip else page.html
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", page.last_modified_http)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_stylesheet(self):
+        """Send the stylesheet linked by the user pages."""
+        try:
+            with open(STYLESHEET_FILE, "rb") as file_obj:
+                content = file_obj.read()
+        except FileNotFoundError:
+            raise ApiError(HTTPStatus.NOT_FOUND,
+                           "Stylesheet not found.") from None
+        etag = make_etag(content)
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            content = b""
+        else:
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/css; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        """Add or update a rating."""
+        self.handle_request(self.handle_write)
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+        """Delete a rating."""
+        self.handle_request(self.handle_write)
+
+    def handle_write(self):
+        """Authenticate the user and run the rating endpoint."""
+        body = self.read_body()
+        match = RATING_PATH.match(urlparse(self.path).path)
+        if not match:
+            raise ApiError(HTTPStatus.NOT_FOUND, "Unknown endpoint.")
+        user_name, imdb_id = match.groups()
+        user = get_user_or_404(user_name)
+        check_credentials(user, self.headers.get("Authorization"))
+        status, result = RATING_ROUTES[self.command](user, imdb_id, body)
+        self.send_json(status, result)
+
+    def read_body(self) -> dict:
+        """Return the JSON request body."""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_SIZE:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                           "Request body too large.")
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except (ValueError, UnicodeDecodeError):
+            body = None
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "Expected a JSON object.")
+        return body
+
+    @staticmethod
+    def encode(result) -> bytes:
+        """Return the result as JSON bytes."""
+        return json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+    def send_json(self, status, result=None, content=None, etag=None):
+        """Send the result (or already encoded content) as JSON."""
+        if content is None:
+            content = self.encode(result)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status == HTTPStatus.UNAUTHORIZED:
+            self.send_header("WWW-Authenticate", 'Basic realm="movies"')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Log requests only if the server is verbose."""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server handling requests on a fixed pool of worker threads.
+
+    Unlike ThreadingHTTPServer it doesn't start a thread per
+    connection, so the number of concurrent database connections
+    stays bounded under load.
+    """
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS,
+                 verbose=False):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="api-worker")
+        self.verbose = verbose
+
+    def process_request(self, request, client_address):
+        """Hand the connection over to a worker thread."""
+        self.executor.submit(self.process_request_thread, request,
+                             client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Handle the connection like ThreadingMixIn does."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        """Close the socket and wait for the workers to finish."""
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT,
+                  workers=DEFAULT_WORKERS, verbose=False) -> PooledHTTPServer:
+    """Return a server using the queue pool for database connections.
+
+    Use port 0 to pick a free port (see server.server_address).
+    """
+    database.configure_engine("queue")
+    return PooledHTTPServer((host, port), ApiRequestHandler, workers, verbose)
+
+
+def main():
+    """Run the API server until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--verbose", action="store_true",
+                        help="log every request")
+    args = parser.parse_args()
+    server = create_server(args.host, args.port, args.workers, args.verbose)
+    host, port = server.server_address[:2]
+    print(f"Serving the movie API at http://{host}:{port}/ "
+          f"with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
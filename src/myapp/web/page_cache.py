@@ -0,0 +1,110 @@
+"""Cache rendered user pages in memory for serving them over HTTP.
+
+A page is rendered on first request with render_user_page.render_html
+and kept as plain and pre-compressed gzip bytes together with its
+ETag and Last-Modified time. Cached pages stay valid until the user's
+ratings version changes (see data_processing.bump_ratings_version), so
+repeat requests cost neither a database query nor a render.
+
+Ratings changed by another process (e.g. the CLI) don't bump the
+version of this process; such pages are re-rendered once they are
+older than PAGE_CACHE_TTL seconds and keep their ETag if unchanged.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+
+from myapp.api.rate_limiter import SingleFlight
+from myapp.models import data_processing
+from myapp.web import render_user_page
+
+# Number of user pages kept in memory (least recently used are dropped)
+PAGE_CACHE_SIZE = int(os.environ.get("MYAPP_PAGE_CACHE_SIZE", 256))
+# Seconds until a cached page is checked for changes by other processes
+PAGE_CACHE_TTL = float(os.environ.get("MYAPP_PAGE_CACHE_TTL", 60))
+GZIP_LEVEL = 9
+
+_pages = OrderedDict()
+_user_ids = {}
+_pages_lock = threading.Lock()
+# Concurrent requests for the same page share one render.
+_renders = SingleFlight()
+
+
+class CachedPage:
+    """A rendered user page with its validators."""
+
+    def __init__(self, user_id, version, html, last_modified):
+        self.user_id = user_id
+        self.version = version
+        self.html = html
+        self.gzipped = gzip.compress(html, compresslevel=GZIP_LEVEL,
+                                     mtime=0)
+        digest = hashlib.blake2b(html, digest_size=16).hexdigest()
+        self.etag = f'"{digest}"'
+        # Compressed bytes are a different representation.
+        self.gzip_etag = f'"{digest}-gzip"'
+        self.last_modified = last_modified
+        self.last_modified_http = formatdate(last_modified, usegmt=True)
+        self.rendered_at = time.monotonic()
+
+    def is_fresh(self, version) -> bool:
+        """Return True if the page can be served without rendering."""
+        return (self.version == version
+                and time.monotonic() - self.rendered_at < PAGE_CACHE_TTL)
+
+
+def get_user_id(user_name) -> int | None:
+    """Return the user's id, looking it up only once."""
+    user_id = _user_ids.get(user_name)
+    if user_id is None:
+        user = data_processing.get_user(user_name)
+        if user is None:
+            return None
+        user_id = _user_ids.setdefault(user_name, user.id)
+    return user_id
+
+
+def get_page(user_name) -> CachedPage | None:
+    """Return the user's page from the cache or rendered anew.
+
+    Return None if the user doesn't exist.
+    """
+    user_id = get_user_id(user_name.lower())
+    if user_id is None:
+        return None
+    version = data_processing.get_ratings_version(user_id)
+    with _pages_lock:
+        page = _pages.get(user_id)
+        if page is not None and page.is_fresh(version):
+            _pages.move_to_end(user_id)
+            return page
+    return _renders.do((user_id, version),
+                       lambda: render_page(user_id, version, page))
+
+
+def render_page(user_id, version, previous_page=None) -> CachedPage:
+    """Render the user's page and store it in the cache."""
+    html = render_user_page.render_html(user_id).encode("utf-8")
+    page = CachedPage(user_id, version, html, time.time())
+    if previous_page is not None and previous_page.etag == page.etag:
+        # Unchanged content keeps its validators, so clients get a 304.
+        page.last_modified = previous_page.last_modified
+        page.last_modified_http = previous_page.last_modified_http
+    with _pages_lock:
+        _pages[user_id] = page
+        _pages.move_to_end(user_id)
+        while len(_pages) > PAGE_CACHE_SIZE:
+            _pages.popitem(last=False)
+    return page
+
+
+def clear_pages():
+    """Remove all cached pages."""
+    with _pages_lock:
+        _pages.clear()
+        _user_ids.clear()
@@ -2,7 +2,10 @@
 to display movies rated by a user.
 """
 from pathlib import Path
-from myapp.models.data_processing import get_movies, get_user, get_country_emojis_for_movie
+from myapp.models.data_processing import (get_movies,
+                                          get_user,
+                                          get_country_emojis_for_movie,
+                                          get_country_emojis_for_movies)
 
 # Get the project root and go up three levels
 PROJECT_ROOT = Path(__file__).resolve().parents[3]
@@ -35,13 +38,11 @@ def write_file(file_name, content):
         file_obj.write(content)
 
 
-def write_html_file(template_file, new_file_name, title, content):
-    """Write a new html file for the given content."""
-    new_file_path = (OUTPUT_PATH / new_file_name).resolve()
+def fill_template(template_file, title, content):
+    """Return the html template filled with title and content."""
     html_template = load_template(template_file)
     html_with_title = html_template.replace(PLACEHOLDER_TITLE, title)
-    html_with_content = html_with_title.replace(PLACEHOLDER_MAIN, content)
-    write_file(new_file_path, html_with_content)
+    return html_with_title.replace(PLACEHOLDER_MAIN, content)
 
 
 def indent(n):
@@ -57,8 +58,11 @@ def convert_emoji_to_html(symbol):
     return html_numeric_entities
 
 
-def serialize_movie_to_html(imdb_id, movie_details):
-    """Return movie details serialized as HTML."""
+def serialize_movie_to_html(imdb_id, movie_details, emojis_unicode=None):
+    """Return movie details serialized as HTML.
+
+    Query the country emojis unless they are given.
+    """
     # Get movie attributes
     movie_id = movie_details["movie_id"]
     title = movie_details["title"]
@@ -70,7 +74,8 @@ def serialize_movie_to_html(imdb_id, movie_details):
         image_url = DUMMY_POSTER_URL
     year = movie_details["year"]
     # Create country emojis string as HTML numeric entities
-    emojis_unicode = get_country_emojis_for_movie(movie_id)
+    if emojis_unicode is None:
+        emojis_unicode = get_country_emojis_for_movie(movie_id)
     emojis_html = [convert_emoji_to_html(emoji) for emoji in emojis_unicode]
     emojis = "".join(emojis_html)
     # Begin serialization
@@ -91,27 +96,48 @@ def serialize_movie_to_html(imdb_id, movie_details):
 
 def serialize_all_movies_to_html(movies):
     """Return a user's movie ratings serialized as HTML."""
+    # Get the country emojis of all movies with a single query
+    emojis = get_country_emojis_for_movies(
+        [movie_details["movie_id"] for movie_details in movies.values()])
     output = ""
     for imdb_id, movie_details in movies.items():
-        output += serialize_movie_to_html(imdb_id, movie_details) + "\n"
+        output += serialize_movie_to_html(
+            imdb_id, movie_details, emojis[movie_details["movie_id"]]) + "\n"
     return output
 
 
-def render_webpage(user_id):
-    """Generate webpage with all movies rated by the given user.
+def get_sort_key(movie_details):
+    """Return rating and year of a movie for sorting.
 
-    Show the movies in reverse chronological order.
+    A missing year (NULL, '' or 'N/A' from OMDB) counts as 0.
     """
-    user = get_user(user_id, find_by_id=True)
-    username = user["user_name"]
+    year = movie_details["year"]
+    return movie_details["rating"], year if isinstance(year, int) else 0
+
+
+def render_html(user_id, username=None):
+    """Return the webpage with all movies rated by the given user.
+
+    Show the movies sorted by rating and year, best first.
+    The user is looked up unless the username is given.
+    """
+    if username is None:
+        username = get_user(user_id, find_by_id=True)["user_name"]
     page_title = f"{username}'s movie ratings"
-    file_name = f"{username}.html"
     movies = get_movies(user_id)
     movies_sorted = dict(sorted(movies.items(),
-                                key=lambda item: (item[1]["rating"], item[1]["year"]),
+                                key=lambda item: get_sort_key(item[1]),
                                 reverse=True))
     content = serialize_all_movies_to_html(movies_sorted)
-    write_html_file(TEMPLATE_FILE_PATH, file_name, page_title, content)
+    return fill_template(TEMPLATE_FILE_PATH, page_title, content)
+
+
+def render_webpage(user_id):
+    """Generate webpage with all movies rated by the given user."""
+    username = get_user(user_id, find_by_id=True)["user_name"]
+    file_name = f"{username}.html"
+    write_file((OUTPUT_PATH / file_name).resolve(),
+               render_html(user_id, username))
     return True
 
 
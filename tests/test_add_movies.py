@@ -0,0 +1,94 @@
+"""Check that movies, countries and their links are added in batches
+and that adding them again is harmless.
+
+Run from the project root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# The database path is read when myapp.db.database is imported
+# (by the first test module that imports it).
+if "myapp.db.database" not in sys.modules:
+    os.environ["MOVIES_DB_PATH"] = str(Path(tempfile.mkdtemp())
+                                       / "movies.sqlite3")
+
+from myapp.db import database  # noqa: E402
+from myapp.models import countries  # noqa: E402
+from myapp.models import data_processing  # noqa: E402
+
+
+def make_movie(imdb_id, title, country_names):
+    """Return a movie as expected by add_movies_with_countries."""
+    return {"imdb_id": imdb_id, "title": title, "year": 2001,
+            "image_url": "N/A", "imdb_rating": 7.5,
+            "countries": country_names}
+
+
+def count_links(movie_id):
+    """Return the number of country links of the movie."""
+    connection = sqlite3.connect(database.db_path)
+    try:
+        return connection.execute(
+            "SELECT COUNT(*) FROM movies_countries WHERE movie_id = ?",
+            (movie_id,)).fetchone()[0]
+    finally:
+        connection.close()
+
+
+class AddMoviesTest(unittest.TestCase):
+
+    def country_names(self, movie_id):
+        return [country.name for country
+                in data_processing.get_countries_for_movie(movie_id)]
+
+    def test_movies_and_countries_are_added(self):
+        movie_ids = data_processing.add_movies_with_countries([
+            make_movie("tt8000001", "First", ["France", "Germany"]),
+            make_movie("tt8000002", "Second", ["France", "Atlantis"])])
+        self.assertEqual(set(movie_ids), {"tt8000001", "tt8000002"})
+        movies = data_processing.get_movies_by_imdb_ids(movie_ids)
+        self.assertEqual(movies["tt8000002"].title, "Second")
+        self.assertEqual(self.country_names(movie_ids["tt8000001"]),
+                         ["France", "Germany"])
+        # Countries unknown to pycountry are added under their name.
+        self.assertEqual(self.country_names(movie_ids["tt8000002"]),
+                         ["Atlantis", "France"])
+
+    def test_adding_again_returns_the_same_ids(self):
+        movies = [make_movie("tt8000011", "Retry", ["Italy", "Italy"])]
+        first = data_processing.add_movies_with_countries(movies)
+        second = data_processing.add_movies_with_countries(movies)
+        self.assertEqual(first, second)
+        self.assertEqual(count_links(first["tt8000011"]), 1)
+
+    def test_existing_and_new_movies_in_one_batch(self):
+        existing = data_processing.add_movies_with_countries(
+            [make_movie("tt8000021", "Old", ["Spain"])])
+        movie_ids = data_processing.add_movies_with_countries([
+            make_movie("tt8000021", "Old", ["Spain", "Portugal"]),
+            make_movie("tt8000022", "New", [])])
+        self.assertEqual(movie_ids["tt8000021"], existing["tt8000021"])
+        self.assertEqual(self.country_names(movie_ids["tt8000021"]),
+                         ["Portugal", "Spain"])
+        self.assertEqual(self.country_names(movie_ids["tt8000022"]), [])
+
+    def test_country_added_by_another_process_is_reused(self):
+        connection = sqlite3.connect(database.db_path)
+        with connection:
+            connection.execute("INSERT INTO countries (name, code) "
+                               "VALUES ('Lemuria', 'LM1')")
+        connection.close()
+        movie_ids = data_processing.add_movies_with_countries(
+            [make_movie("tt8000031", "Elsewhere", ["Lemuria"])])
+        self.assertEqual(self.country_names(movie_ids["tt8000031"]),
+                         ["Lemuria"])
+        self.assertIsNotNone(countries.get_cached_country("Lemuria"))
+
+
+if __name__ == "__main__":
+    unittest.main()
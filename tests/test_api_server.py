@@ -0,0 +1,106 @@
+"""Check the ETag and conditional request handling of the API server.
+
+Run from the project root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+import http.client
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from email.utils import formatdate
+from pathlib import Path
+
+# The database path is read when myapp.db.database is imported
+# (by the first test module that imports it).
+if "myapp.db.database" not in sys.modules:
+    os.environ["MOVIES_DB_PATH"] = str(Path(tempfile.mkdtemp())
+                                       / "movies.sqlite3")
+
+from myapp.models import data_processing  # noqa: E402
+from myapp.web import api_server  # noqa: E402
+
+USER_NAME = "etaguser"
+LAST_MODIFIED = 1_700_000_000
+
+
+class ConditionalHeadersTest(unittest.TestCase):
+
+    def test_etag_matches(self):
+        etag = '"abc"'
+        for header, expected in ((None, False), ("", False),
+                                 ('"abc"', True), ('W/"abc"', True),
+                                 ('"x", "abc"', True), ("*", True),
+                                 ('"abcd"', False)):
+            with self.subTest(header=header):
+                self.assertEqual(api_server.etag_matches(header, etag),
+                                 expected)
+
+    def test_if_modified_since(self):
+        for since, expected in ((LAST_MODIFIED, True),
+                                (LAST_MODIFIED + 60, True),
+                                (LAST_MODIFIED - 1, False)):
+            headers = {"If-Modified-Since": formatdate(since, usegmt=True)}
+            with self.subTest(since=since):
+                self.assertEqual(api_server.is_not_modified(
+                    headers, ('"a"',), LAST_MODIFIED), expected)
+        self.assertFalse(api_server.is_not_modified(
+            {"If-Modified-Since": "yesterday"}, ('"a"',), LAST_MODIFIED))
+
+    def test_if_none_match_takes_precedence(self):
+        headers = {"If-None-Match": '"b"',
+                   "If-Modified-Since": formatdate(LAST_MODIFIED + 60,
+                                                   usegmt=True)}
+        self.assertFalse(api_server.is_not_modified(
+            headers, ('"a"',), LAST_MODIFIED))
+
+
+class ServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if data_processing.get_user(USER_NAME) is None:
+            data_processing.add_user(USER_NAME, "")
+        cls.server = api_server.create_server("127.0.0.1", 0, workers=2)
+        thread = threading.Thread(target=cls.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def request(self, path, headers=None):
+        """Return the response status, headers and body."""
+        connection = http.client.HTTPConnection(
+            *self.server.server_address[:2], timeout=5)
+        try:
+            connection.request("GET", path, headers=headers or {})
+            response = connection.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            connection.close()
+
+    def test_matching_etag_is_not_modified(self):
+        status, headers, body = self.request(f"/users/{USER_NAME}")
+        self.assertEqual(status, 200)
+        self.assertIn(b'"ratings": 0', body)
+        etag = headers["ETag"]
+        status, headers, body = self.request(f"/users/{USER_NAME}",
+                                             {"If-None-Match": etag})
+        self.assertEqual(status, 304)
+        self.assertEqual(headers["ETag"], etag)
+        self.assertEqual(body, b"")
+        status, _, _ = self.request(f"/users/{USER_NAME}",
+                                    {"If-None-Match": '"other"'})
+        self.assertEqual(status, 200)
+
+    def test_unknown_user_and_endpoint(self):
+        status, headers, body = self.request("/users/nobody-here")
+        self.assertEqual(status, 404)
+        self.assertIsNone(headers["ETag"])
+        self.assertIn(b"does not exist", body)
+        self.assertEqual(self.request("/nothing")[0], 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
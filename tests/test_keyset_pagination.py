@@ -0,0 +1,75 @@
+"""Check that keyset pagination returns movies with a NULL sort value.
+
+Run from the project root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# The database path is read when myapp.db.database is imported
+# (by the first test module that imports it).
+if "myapp.db.database" not in sys.modules:
+    os.environ["MOVIES_DB_PATH"] = str(Path(tempfile.mkdtemp())
+                                       / "movies.sqlite3")
+
+from myapp.db import database  # noqa: E402
+from myapp.models import data_processing  # noqa: E402
+
+USER_ID = 1
+# title, year, rating
+MOVIES = [("a", None, 5), ("b", 2000, 6), ("c", None, 7),
+          ("d", 1990, 5), ("e", 2010, 6)]
+
+
+def setUpModule():
+    """Add the movies with NULL years to the default user."""
+    connection = sqlite3.connect(database.db_path)
+    with connection:
+        for number, (title, year, rating) in enumerate(MOVIES, 1):
+            movie_id = connection.execute(
+                "INSERT INTO movies (imdb_id, title, year) VALUES (?, ?, ?)",
+                (f"tt{number}", title, year)).lastrowid
+            connection.execute(
+                "INSERT INTO ratings (user_id, movie_id, rating, note) "
+                "VALUES (?, ?, ?, '')", (USER_ID, movie_id, rating))
+    connection.close()
+
+
+class KeysetPaginationTest(unittest.TestCase):
+
+    def page_titles(self, order_by, descending):
+        """Return the titles read one movie per page."""
+        titles = []
+        after = None
+        while True:
+            page = data_processing.find_movies(
+                USER_ID, order_by=order_by, descending=descending,
+                limit=1, after=after)
+            if not page:
+                return titles
+            after = page.at(-1)
+            titles.append(after.title)
+
+    def test_pages_match_full_result(self):
+        for order_by in ("year", "rating", "title", None):
+            for descending in (False, True):
+                with self.subTest(order_by=order_by, descending=descending):
+                    movies = data_processing.find_movies(
+                        USER_ID, order_by=order_by, descending=descending)
+                    self.assertEqual(
+                        self.page_titles(order_by, descending),
+                        [movie.title for movie in movies.values()])
+
+    def test_null_years_are_paged(self):
+        self.assertEqual(self.page_titles("year", False),
+                         ["a", "c", "d", "b", "e"])
+        self.assertEqual(self.page_titles("year", True),
+                         ["e", "b", "d", "c", "a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Check the alias table sampling and the handling of recent picks.
+
+Run from the project root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+# The database path is read when myapp.db.database is imported
+# (by the first test module that imports it).
+if "myapp.db.database" not in sys.modules:
+    os.environ["MOVIES_DB_PATH"] = str(Path(tempfile.mkdtemp())
+                                       / "movies.sqlite3")
+
+from myapp.models import random_pick  # noqa: E402
+from myapp.models.random_pick import Sampler  # noqa: E402
+
+USER_ID = 1
+DRAWS = 20000
+
+
+class SamplerTest(unittest.TestCase):
+
+    def test_alias_table_keeps_the_weights(self):
+        weights = [1, 2, 3, 4, 0]
+        sampler = Sampler([10, 20, 30, 40, 50], weights)
+        # Every slot holds its own movie with probabilities[i] and the
+        # alias else, which adds up to the normalized weights.
+        shares = Counter()
+        for slot, probability in enumerate(sampler.probabilities):
+            shares[sampler.movie_ids[slot]] += probability
+            shares[sampler.movie_ids[sampler.aliases[slot]]] += 1 - probability
+        for movie_id, weight in zip(sampler.movie_ids, weights):
+            self.assertAlmostEqual(shares[movie_id] / len(weights),
+                                   weight / sum(weights))
+
+    def test_weighted_picks_follow_the_weights(self):
+        sampler = Sampler([1, 2, 3], [1, 3, 0])
+        rng = random.Random(0)
+        counts = Counter(sampler.pick(rng) for _ in range(DRAWS))
+        self.assertEqual(counts[3], 0)
+        self.assertAlmostEqual(counts[2] / DRAWS, 0.75, delta=0.02)
+
+    def test_uniform_without_weights(self):
+        for weights in (None, [0, 0, 0]):
+            with self.subTest(weights=weights):
+                sampler = Sampler([1, 2, 3], weights)
+                self.assertIsNone(sampler.probabilities)
+                rng = random.Random(0)
+                counts = Counter(sampler.pick(rng) for _ in range(DRAWS))
+                for movie_id in (1, 2, 3):
+                    self.assertAlmostEqual(counts[movie_id] / DRAWS, 1 / 3,
+                                           delta=0.02)
+
+    def test_without_keeps_the_other_weights(self):
+        sampler = Sampler([1, 2, 3], [1, 2, 3]).without({2})
+        self.assertEqual(sampler.movie_ids, [1, 3])
+        self.assertEqual(sampler.weights, [1, 3])
+
+
+class RecentPicksTest(unittest.TestCase):
+
+    def setUp(self):
+        random_pick.clear_samplers()
+        self.addCleanup(random_pick.clear_samplers)
+        patcher = mock.patch.object(random_pick, "get_sampler",
+                                    return_value=Sampler(range(1, 6)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rng = random.Random(0)
+
+    def pick(self, count, exclude_recent=True):
+        return random_pick.pick_movie_ids(USER_ID, count,
+                                          exclude_recent=exclude_recent,
+                                          rng=self.rng)
+
+    def test_picks_are_distinct(self):
+        self.assertEqual(sorted(self.pick(5)), [1, 2, 3, 4, 5])
+        self.assertEqual(len(self.pick(10)), 5)
+
+    def test_recent_picks_are_skipped(self):
+        picks = []
+        with mock.patch.object(random_pick, "RECENT_PICKS", 3):
+            for _ in range(20):
+                pick = self.pick(1)[0]
+                self.assertNotIn(pick, picks[-3:])
+                picks.append(pick)
+
+    def test_all_recent_starts_over(self):
+        self.pick(5)
+        # All movies were picked recently, so they can be picked again.
+        self.assertEqual(len(set(self.pick(2))), 2)
+
+    def test_recent_picks_can_be_included(self):
+        self.pick(4)
+        picks = {self.pick(1, exclude_recent=False)[0] for _ in range(50)}
+        self.assertEqual(picks, {1, 2, 3, 4, 5})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,249 @@
+"""Check the token bucket, daily quota, single-flight coalescing and
+circuit breaker used for the OMDB API.
+
+Run from the project root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+import tempfile
+import threading
+import time
+import unittest
+from datetime import date
+from pathlib import Path
+from unittest import mock
+
+from myapp.api import circuit_breaker, rate_limiter
+from myapp.api.circuit_breaker import (CLOSED, HALF_OPEN, OPEN,
+                                       CircuitBreaker, CircuitOpenError)
+from myapp.api.rate_limiter import (DailyQuota, QuotaExceededError,
+                                    SingleFlight, TokenBucket)
+
+
+class FakeClock:
+    """Stand-in for the time module whose sleep advances monotonic.
+
+    Tests use powers of two for rates, so the clock stays exact.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(rate_limiter, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_passes_without_waiting(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_waits_for_the_next_token(self):
+        bucket = TokenBucket(rate=2, capacity=1)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.5])
+
+    def test_refill_is_capped_at_capacity(self):
+        bucket = TokenBucket(rate=4, capacity=2)
+        bucket.acquire()
+        bucket.acquire()
+        self.clock.now += 60
+        for _ in range(2):
+            bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(self.clock.sleeps, [0.25])
+
+
+class DailyQuotaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.file_path = Path(tempfile.mkdtemp()) / "quota.json"
+
+    def test_limit_is_enforced(self):
+        quota = DailyQuota(2, self.file_path)
+        quota.consume()
+        quota.consume()
+        with self.assertRaises(QuotaExceededError):
+            quota.consume()
+        self.assertEqual(quota.usage(), (2, 2))
+
+    def test_count_survives_restarts(self):
+        DailyQuota(5, self.file_path).consume()
+        quota = DailyQuota(5, self.file_path)
+        quota.consume()
+        self.assertEqual(quota.usage(), (2, 5))
+
+    def test_count_starts_over_on_a_new_day(self):
+        quota = DailyQuota(1, self.file_path)
+        quota.consume()
+        tomorrow = date.fromordinal(date.today().toordinal() + 1)
+        with mock.patch.object(rate_limiter, "date") as fake_date:
+            fake_date.today.return_value = tomorrow
+            quota.consume()
+            self.assertEqual(quota.usage(), (1, 1))
+            # A stored count of another day isn't loaded.
+            self.assertEqual(DailyQuota(1, self.file_path).usage(), (1, 1))
+        self.assertEqual(DailyQuota(1, self.file_path).usage(), (0, 1))
+
+    def test_unreadable_file_counts_from_zero(self):
+        self.file_path.write_text("not json", encoding="utf-8")
+        self.assertEqual(DailyQuota(3, self.file_path).usage(), (0, 3))
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_concurrent_calls_share_one_call(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "result"
+
+        results = []
+
+        def run():
+            results.append(flight.do("key", slow_call))
+
+        threads = [threading.Thread(target=run) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Give the other callers time to find the call in flight.
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.in_flight, {})
+
+    def test_results_are_kept_for_the_ttl(self):
+        flight = SingleFlight(ttl=60)
+        calls = []
+        for _ in range(3):
+            flight.do("key", lambda: calls.append(1) or len(calls))
+        self.assertEqual(len(calls), 1)
+        flight.clear()
+        self.assertEqual(flight.do("key", lambda: "new"), "new")
+
+    def test_uncacheable_results_are_not_kept(self):
+        flight = SingleFlight(ttl=60)
+        calls = []
+        for _ in range(2):
+            flight.do("key", lambda: calls.append(1),
+                      is_cacheable=lambda result: False)
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_raised_and_not_kept(self):
+        flight = SingleFlight(ttl=60)
+
+        def failing_call():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            flight.do("key", failing_call)
+        self.assertEqual(flight.do("key", lambda: "ok"), "ok")
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(circuit_breaker, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, cooldown=30,
+            failure_exceptions=(ConnectionError,),
+            is_failure=lambda result: result == "error")
+
+    def fail(self):
+        """Make one call that fails with a counted exception."""
+        def raise_connection_error():
+            raise ConnectionError
+
+        with self.assertRaises(ConnectionError):
+            self.breaker.call(raise_connection_error)
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.call(lambda: "error")
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: "ok")
+        self.assertEqual(self.breaker.retry_in(), 30)
+
+    def test_success_resets_the_failure_count(self):
+        self.fail()
+        self.breaker.call(lambda: "ok")
+        self.fail()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_successful_probe_closes_the_circuit(self):
+        self.fail()
+        self.fail()
+        self.clock.now += 30
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failed_probe_reopens_the_circuit(self):
+        self.fail()
+        self.fail()
+        self.clock.now += 30
+        self.fail()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.retry_in(), 30)
+
+    def test_only_one_probe_while_half_open(self):
+        self.fail()
+        self.fail()
+        self.clock.now += 30
+
+        def probe():
+            # A second call during the probe is short-circuited.
+            with self.assertRaises(CircuitOpenError):
+                self.breaker.call(lambda: "ok")
+            return "ok"
+
+        self.breaker.call(probe)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_unrelated_errors_release_the_probe(self):
+        self.fail()
+        self.fail()
+        self.clock.now += 30
+
+        def raise_key_error():
+            raise KeyError
+
+        with self.assertRaises(KeyError):
+            self.breaker.call(raise_key_error)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
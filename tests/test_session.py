@@ -0,0 +1,114 @@
+"""Check signing, expiry and revocation of session tokens.
+
+Run from the project root:
+    PYTHONPATH=src python -m unittest discover tests
+"""
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from myapp.auth import session
+
+USER_ID = 7
+USER_NAME = "alice"
+
+
+class SessionTestCase(unittest.TestCase):
+    """Use a fresh session store, signing key and terminal per test."""
+
+    def setUp(self):
+        store_path = Path(tempfile.mkdtemp()) / "sessions.json"
+        patches = [
+            mock.patch.object(session, "SESSIONS_FILE_PATH", store_path),
+            mock.patch.object(session, "LOCK_FILE_PATH",
+                              store_path.with_suffix(".lock")),
+            mock.patch.object(session, "SESSION_TTL", 60),
+            mock.patch.object(session, "_secret", b"k" * session.SECRET_SIZE),
+            mock.patch.object(session, "get_terminal_id",
+                              return_value="tester@tty1"),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TokenTest(SessionTestCase):
+
+    def test_round_trip(self):
+        claims = session.read_token(session.issue_token(USER_ID))
+        self.assertEqual(claims["uid"], USER_ID)
+        self.assertGreater(claims["exp"], time.time())
+
+    def test_tokens_have_different_session_ids(self):
+        first = session.read_token(session.issue_token(USER_ID))
+        second = session.read_token(session.issue_token(USER_ID))
+        self.assertNotEqual(first["sid"], second["sid"])
+
+    def test_changed_payload_is_rejected(self):
+        payload, signature = session.issue_token(USER_ID).split(".")
+        forged = session.encode(
+            session.decode(payload).replace(b'"uid":7', b'"uid":8'))
+        self.assertIsNone(session.read_token(f"{forged}.{signature}"))
+
+    def test_other_key_is_rejected(self):
+        token = session.issue_token(USER_ID)
+        with mock.patch.object(session, "_secret", b"x" * 32):
+            self.assertIsNone(session.read_token(token))
+
+    def test_malformed_tokens_are_rejected(self):
+        for token in (None, "", "no-dot", "a.b.c", "a.b"):
+            with self.subTest(token=token):
+                self.assertIsNone(session.read_token(token))
+
+    def test_expired_token_is_rejected(self):
+        token = session.issue_token(USER_ID, ttl=10)
+        with mock.patch.object(session.time, "time",
+                               return_value=time.time() + 11):
+            self.assertIsNone(session.read_token(token))
+
+
+class SessionStoreTest(SessionTestCase):
+
+    def test_session_is_resumed(self):
+        token = session.start_session(USER_ID, USER_NAME)
+        claims = session.resume_session(USER_ID, USER_NAME)
+        self.assertEqual(claims, session.read_token(token))
+
+    def test_session_belongs_to_user_and_terminal(self):
+        session.start_session(USER_ID, USER_NAME)
+        self.assertIsNone(session.resume_session(USER_ID + 1, USER_NAME))
+        with mock.patch.object(session, "get_terminal_id",
+                               return_value="tester@tty2"):
+            self.assertIsNone(session.resume_session(USER_ID, USER_NAME))
+
+    def test_ended_session_is_revoked(self):
+        token = session.start_session(USER_ID, USER_NAME)
+        session.end_session(USER_NAME)
+        self.assertIsNone(session.resume_session(USER_ID, USER_NAME))
+        # A copy of the token can't be used any more either.
+        self.assertIsNotNone(session.read_token(token))
+        self.assertIsNone(session.validate_token(token))
+
+    def test_expired_entries_are_dropped(self):
+        token = session.start_session(USER_ID, USER_NAME)
+        session.end_session(USER_NAME)
+        session.start_session(USER_ID + 1, "carol")
+        sid = session.read_token(token)["sid"]
+        self.assertIn(sid, session.load_store()["revoked"])
+        with mock.patch.object(session.time, "time",
+                               return_value=time.time() + 61):
+            session.start_session(USER_ID + 2, "bob")
+        store = session.load_store()
+        self.assertNotIn(sid, store["revoked"])
+        self.assertEqual(list(store["terminals"]["tester@tty1"]), ["bob"])
+
+    def test_disabled_sessions(self):
+        with mock.patch.object(session, "SESSION_TTL", 0):
+            self.assertIsNone(session.start_session(USER_ID, USER_NAME))
+            self.assertIsNone(session.resume_session(USER_ID, USER_NAME))
+
+
+if __name__ == "__main__":
+    unittest.main()